@@ -1,2 +1,2 @@
 # Copyright 2020-present Kensho Technologies, LLC.
-from .stub_generator import make_grpc_client  # noqa
+from .stub_generator import close_grpc_client, make_grpc_client  # noqa
@@ -0,0 +1,159 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""Client-side batching of single-item calls into a batch RPC"""
+from concurrent import futures
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_SIZE = 100
+DEFAULT_MAX_DELAY_SECONDS = 0.005
+DEFAULT_MAX_CONCURRENT_BATCHES = 4
+
+
+class AutoBatcher(object):
+    """Collect concurrent single-item calls and issue them as one batch RPC.
+
+    Calls submitted within max_delay_seconds of the first pending call (or until max_batch_size
+    calls are pending) are merged into a single batch request with merge_requests_func. The batch
+    response is split back into per-item responses with split_response_func and every caller gets
+    its own future.
+
+    Sample usage:
+
+        client = make_grpc_client("group", "things", address, ThingServiceStub)
+        get_thing = AutoBatcher(
+            client.BatchGetThing,
+            lambda requests: BatchGetThingRequest(ids=[request.id for request in requests]),
+            lambda batch_response, requests: list(batch_response.things),
+        )
+        thing = get_thing(GetThingRequest(id=1))
+    """
+
+    def __init__(
+        self,
+        batch_method,
+        merge_requests_func,
+        split_response_func,
+        max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+        max_delay_seconds=DEFAULT_MAX_DELAY_SECONDS,
+        max_concurrent_batches=DEFAULT_MAX_CONCURRENT_BATCHES,
+        batch_timeout=None,
+    ):
+        """Initialize the batcher.
+
+        Args:
+            batch_method: grpc method (e.g. stub.BatchGetThing) accepting a merged batch request
+            merge_requests_func: function taking a list of single-item requests and returning
+                                 the batch request
+            split_response_func: function taking the batch response and the list of single-item
+                                 requests and returning a list of single-item responses in the
+                                 same order as the requests
+            max_batch_size: maximum number of single-item requests merged into one batch
+            max_delay_seconds: maximum time a call waits for other calls to join its batch
+            max_concurrent_batches: maximum number of batch RPCs in flight at the same time
+            batch_timeout: optional timeout passed to every batch RPC
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be positive, got {}".format(max_batch_size))
+
+        self._batch_method = batch_method
+        self._merge_requests_func = merge_requests_func
+        self._split_response_func = split_response_func
+        self._max_batch_size = max_batch_size
+        self._max_delay_seconds = max_delay_seconds
+        self._batch_timeout = batch_timeout
+
+        self._executor = futures.ThreadPoolExecutor(max_workers=max_concurrent_batches)
+        self._condition = threading.Condition()
+        self._pending = []  # list of (request, future)
+        self._batch_deadline = None
+        self._closed = False
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="AutoBatcher", daemon=True)
+        self._flusher.start()
+
+    def future(self, request):
+        """Submit a single-item request and return a concurrent.futures.Future for its response"""
+        result_future = futures.Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot submit requests to a closed AutoBatcher")
+            if not self._pending:
+                self._batch_deadline = time.monotonic() + self._max_delay_seconds
+            self._pending.append((request, result_future))
+            if len(self._pending) >= self._max_batch_size:
+                self._dispatch_pending()
+            else:
+                self._condition.notify()
+        return result_future
+
+    def __call__(self, request, timeout=None):
+        """Submit a single-item request and wait for its response"""
+        return self.future(request).result(timeout=timeout)
+
+    def close(self):
+        """Send the calls that are still pending and stop accepting new ones"""
+        with self._condition:
+            self._closed = True
+            self._dispatch_pending()
+            self._condition.notify()
+        self._flusher.join()
+        self._executor.shutdown(wait=True)
+
+    def _flush_loop(self):
+        """Send pending batches whose collection window has expired"""
+        with self._condition:
+            while not self._closed:
+                if not self._pending:
+                    self._condition.wait()
+                    continue
+                remaining = self._batch_deadline - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                else:
+                    self._dispatch_pending()
+
+    def _dispatch_pending(self):
+        """Hand the pending calls to the executor as one batch. Must hold the condition lock"""
+        while self._pending:
+            batch = self._pending[: self._max_batch_size]
+            self._pending = self._pending[self._max_batch_size :]
+            self._executor.submit(self._run_batch, batch)
+        self._batch_deadline = None
+
+    def _run_batch(self, batch):
+        """Issue the batch RPC and resolve the per-item futures"""
+        # Callers may have cancelled their futures while the batch was waiting
+        batch = [
+            (request, result_future)
+            for request, result_future in batch
+            if result_future.set_running_or_notify_cancel()
+        ]
+        if not batch:
+            return
+
+        requests = [request for request, _ in batch]
+        try:
+            batch_request = self._merge_requests_func(requests)
+            if self._batch_timeout is None:
+                batch_response = self._batch_method(batch_request)
+            else:
+                batch_response = self._batch_method(batch_request, timeout=self._batch_timeout)
+            responses = list(self._split_response_func(batch_response, requests))
+            if len(responses) != len(requests):
+                raise ValueError(
+                    "split_response_func returned {} responses for {} requests".format(
+                        len(responses), len(requests)
+                    )
+                )
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.debug("Batch of %d requests failed: %r", len(requests), exc)
+            for _, result_future in batch:
+                result_future.set_exception(exc)
+            return
+
+        for (_, result_future), response in zip(batch, responses):
+            result_future.set_result(response)
@@ -0,0 +1,642 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""Call objects returned by client middlewares in place of grpc's own calls
+
+Client middlewares must not block on the call they intercept, otherwise stub.Method.future(...)
+becomes synchronous. Instead they return one of these call objects, which act on the outcome of
+the underlying call once it completes.
+"""
+import threading
+import time
+
+import backoff
+import grpc
+
+
+class FailedCall(grpc.RpcError, grpc.Call, grpc.Future):
+    """A completed call that failed with an exception raised while intercepting the RPC.
+
+    This mirrors what grpc returns to an outer interceptor when an inner interceptor raises.
+    """
+
+    def __init__(self, exception, traceback=None):
+        """Initialize with the exception and its traceback"""
+        super(FailedCall, self).__init__()
+        self._exception = exception
+        self._traceback = traceback
+
+    def initial_metadata(self):
+        """Get the initial metadata"""
+        return None
+
+    def trailing_metadata(self):
+        """Get the trailing metadata"""
+        return None
+
+    def code(self):
+        """Get the status code"""
+        return grpc.StatusCode.INTERNAL
+
+    def details(self):
+        """Get the status details"""
+        return "Exception raised while intercepting the RPC"
+
+    def cancel(self):
+        """The call is completed and cannot be cancelled"""
+        return False
+
+    def cancelled(self):
+        """The call was not cancelled"""
+        return False
+
+    def running(self):
+        """The call is not running"""
+        return False
+
+    def done(self):
+        """The call is done"""
+        return True
+
+    def result(self, timeout=None):
+        """Raise the exception"""
+        raise self._exception
+
+    def exception(self, timeout=None):
+        """Get the exception"""
+        return self._exception
+
+    def traceback(self, timeout=None):
+        """Get the traceback of the exception"""
+        return self._traceback
+
+    def add_callback(self, callback):
+        """The call is completed, the callback is not registered"""
+        return False
+
+    def is_active(self):
+        """The call is not active"""
+        return False
+
+    def time_remaining(self):
+        """No time remaining"""
+        return None
+
+    def add_done_callback(self, fn):
+        """Call fn right away since the call is done"""
+        fn(self)
+
+    def __iter__(self):
+        """Iterating over the failed call's responses raises its exception"""
+        return self
+
+    def __next__(self):
+        """Raise the exception"""
+        raise self._exception
+
+
+class RejectedCall(FailedCall):
+    """A call rejected on the client side before being sent, failing with a status code"""
+
+    def __init__(self, code, details):
+        """Initialize with the status code and details; the call is its own exception"""
+        super(RejectedCall, self).__init__(self)
+        self._code = code
+        self._details = details
+
+    def code(self):
+        """Get the status code"""
+        return self._code
+
+    def details(self):
+        """Get the status details"""
+        return self._details
+
+    def __str__(self):
+        """Describe the rejection"""
+        return "<RejectedCall of RPC that terminated with {}: {}>".format(self._code, self._details)
+
+
+def _call_with_timeout(method, timeout):
+    """Call a future method, passing the timeout only if given
+
+    grpc's completed unary outcomes do not accept a timeout argument.
+    """
+    if timeout is None:
+        return method()
+    return method(timeout=timeout)
+
+
+class ForwardingCall(grpc.Call, grpc.Future):
+    """A call that forwards everything to an underlying call"""
+
+    def __init__(self, call):
+        """Initialize with the underlying call"""
+        super(ForwardingCall, self).__init__()
+        self._call = call
+
+    def initial_metadata(self):
+        """Get the initial metadata"""
+        return self._call.initial_metadata()
+
+    def trailing_metadata(self):
+        """Get the trailing metadata"""
+        return self._call.trailing_metadata()
+
+    def code(self):
+        """Get the status code"""
+        return self._call.code()
+
+    def details(self):
+        """Get the status details"""
+        return self._call.details()
+
+    def cancel(self):
+        """Cancel the call"""
+        return self._call.cancel()
+
+    def cancelled(self):
+        """Whether the call was cancelled"""
+        return self._call.cancelled()
+
+    def running(self):
+        """Whether the call is running"""
+        return self._call.running()
+
+    def done(self):
+        """Whether the call is done"""
+        return self._call.done()
+
+    def result(self, timeout=None):
+        """Get the result of the call"""
+        return _call_with_timeout(self._call.result, timeout)
+
+    def exception(self, timeout=None):
+        """Get the exception of the call"""
+        return _call_with_timeout(self._call.exception, timeout)
+
+    def traceback(self, timeout=None):
+        """Get the traceback of the call's exception"""
+        return _call_with_timeout(self._call.traceback, timeout)
+
+    def add_callback(self, callback):
+        """Register a callback for the termination of the RPC"""
+        return self._call.add_callback(callback)
+
+    def is_active(self):
+        """Whether the RPC is active"""
+        return self._call.is_active()
+
+    def time_remaining(self):
+        """Time remaining for the RPC"""
+        return self._call.time_remaining()
+
+    def add_done_callback(self, fn):
+        """Call fn with this call once the underlying call is done"""
+        self._call.add_done_callback(lambda _: fn(self))
+
+
+class TranslatedCall(ForwardingCall):
+    """A call whose grpc errors are translated into other exceptions once it completes"""
+
+    _NOT_TRANSLATED = object()
+
+    def __init__(self, call, translate_exception_func):
+        """Initialize
+
+        Args:
+            call: underlying call
+            translate_exception_func: function taking a grpc.RpcError and returning the exception
+                                      to raise in its place
+        """
+        super(TranslatedCall, self).__init__(call)
+        self._translate_exception_func = translate_exception_func
+        self._translated_exception = self._NOT_TRANSLATED
+
+    def exception(self, timeout=None):
+        """Get the translated exception of the call"""
+        if self._translated_exception is self._NOT_TRANSLATED:
+            exception = _call_with_timeout(self._call.exception, timeout)
+            if isinstance(exception, grpc.RpcError):
+                exception = self._translate_exception_func(exception)
+            self._translated_exception = exception
+        return self._translated_exception
+
+    def result(self, timeout=None):
+        """Get the result of the call, raising the translated exception if it failed"""
+        exception = self.exception(timeout=timeout)
+        if exception is not None:
+            raise exception
+        return _call_with_timeout(self._call.result, timeout)
+
+
+class RetryingCall(grpc.Call, grpc.Future):
+    """A call that is re-issued with exponential backoff while it fails with retriable errors.
+
+    As long as attempts complete synchronously (e.g. for blocking invocations), retries happen
+    on the calling thread. Once an attempt is still running when issued, the outcome is awaited
+    with a done callback and the next attempt is issued from a timer thread, so the caller is
+    never blocked.
+    """
+
+    def __init__(self, issue_call, exceptions_to_retry, max_tries):
+        """Initialize and issue the first attempt
+
+        Args:
+            issue_call: function issuing one attempt and returning its call
+            exceptions_to_retry: tuple of exception classes to retry
+            max_tries: maximum number of attempts
+        """
+        super(RetryingCall, self).__init__()
+        self._issue_call = issue_call
+        self._exceptions_to_retry = exceptions_to_retry
+        self._max_tries = max_tries
+        self._tries = 1
+        self._wait_generator = backoff.expo()
+        self._condition = threading.Condition()
+        self._done = False
+        self._cancelled = False
+        self._retry_timer = None
+        self._callbacks = []
+
+        call = issue_call()
+        while call.done() and self._should_retry(call):
+            time.sleep(self._next_delay())
+            call = issue_call()
+        self._call = call
+        call.add_done_callback(self._on_attempt_done)
+
+    def _should_retry(self, call):
+        """Whether a completed attempt should be retried"""
+        if self._tries >= self._max_tries or call.cancelled():
+            return False
+        return isinstance(call.exception(), self._exceptions_to_retry)
+
+    def _next_delay(self):
+        """Count an attempt and get the jittered backoff delay before it"""
+        self._tries += 1
+        return backoff.full_jitter(next(self._wait_generator))
+
+    def _complete(self):
+        """Mark the call as done and run the callbacks. Must not hold the condition lock"""
+        with self._condition:
+            if self._done:
+                return
+            self._done = True
+            self._retry_timer = None
+            callbacks, self._callbacks = self._callbacks, []
+            self._condition.notify_all()
+        for callback in callbacks:
+            callback(self)
+
+    def _on_attempt_done(self, call):
+        """Schedule a retry of the attempt if necessary, otherwise complete the call"""
+        with self._condition:
+            if call is not self._call:
+                return
+            if not self._cancelled and self._should_retry(call):
+                self._retry_timer = threading.Timer(self._next_delay(), self._retry)
+                self._retry_timer.daemon = True
+                self._retry_timer.start()
+                return
+        self._complete()
+
+    def _retry(self):
+        """Issue the next attempt"""
+        with self._condition:
+            if self._cancelled or self._done:
+                return
+            self._retry_timer = None
+            # Issue under the lock so that a concurrent cancel() sees the new attempt
+            call = self._issue_call()
+            self._call = call
+        call.add_done_callback(self._on_attempt_done)
+
+    def _wait_until_done(self, timeout):
+        """Wait for the final attempt, raising FutureTimeoutError on timeout"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._done, timeout=timeout):
+                raise grpc.FutureTimeoutError()
+            return self._call
+
+    def initial_metadata(self):
+        """Get the initial metadata of the current attempt"""
+        return self._call.initial_metadata()
+
+    def trailing_metadata(self):
+        """Get the trailing metadata of the final attempt"""
+        return self._wait_until_done(None).trailing_metadata()
+
+    def code(self):
+        """Get the status code of the final attempt"""
+        return self._wait_until_done(None).code()
+
+    def details(self):
+        """Get the status details of the final attempt"""
+        return self._wait_until_done(None).details()
+
+    def cancel(self):
+        """Cancel the current attempt and stop retrying"""
+        with self._condition:
+            if self._done:
+                return False
+            self._cancelled = True
+            call = self._call
+            retry_timer = self._retry_timer
+        if retry_timer is not None:
+            # The last attempt already failed and a retry is pending; complete with that attempt
+            retry_timer.cancel()
+            self._complete()
+        else:
+            call.cancel()
+        return True
+
+    def cancelled(self):
+        """Whether the call was cancelled"""
+        with self._condition:
+            return self._cancelled
+
+    def running(self):
+        """Whether the call is running"""
+        with self._condition:
+            return not self._done
+
+    def done(self):
+        """Whether the call is done"""
+        with self._condition:
+            return self._done
+
+    def result(self, timeout=None):
+        """Get the result of the final attempt"""
+        return self._wait_until_done(timeout).result()
+
+    def exception(self, timeout=None):
+        """Get the exception of the final attempt"""
+        return self._wait_until_done(timeout).exception()
+
+    def traceback(self, timeout=None):
+        """Get the traceback of the final attempt's exception"""
+        return self._wait_until_done(timeout).traceback()
+
+    def add_callback(self, callback):
+        """Register a callback for the termination of the current attempt"""
+        return self._call.add_callback(callback)
+
+    def is_active(self):
+        """Whether the RPC is active"""
+        with self._condition:
+            return not self._done
+
+    def time_remaining(self):
+        """Time remaining for the current attempt"""
+        return self._call.time_remaining()
+
+    def add_done_callback(self, fn):
+        """Call fn with this call once the final attempt is done"""
+        with self._condition:
+            if not self._done:
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+
+class SharedCall(grpc.Call, grpc.Future):
+    """A call that completes with the outcome of a call issued by another caller.
+
+    The other caller sets the underlying call with set_call once it is done. Shared calls cannot
+    be cancelled, since other callers depend on the underlying call.
+    """
+
+    def __init__(self):
+        """Initialize without an underlying call"""
+        super(SharedCall, self).__init__()
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._call = None
+        self._callbacks = []
+
+    def set_call(self, call):
+        """Complete with the outcome of the underlying call, which must be done"""
+        with self._lock:
+            self._call = call
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def _wait_until_done(self, timeout):
+        """Wait for the underlying call, raising FutureTimeoutError on timeout"""
+        if not self._done.wait(timeout):
+            raise grpc.FutureTimeoutError()
+        return self._call
+
+    def initial_metadata(self):
+        """Get the initial metadata"""
+        return self._wait_until_done(None).initial_metadata()
+
+    def trailing_metadata(self):
+        """Get the trailing metadata"""
+        return self._wait_until_done(None).trailing_metadata()
+
+    def code(self):
+        """Get the status code"""
+        return self._wait_until_done(None).code()
+
+    def details(self):
+        """Get the status details"""
+        return self._wait_until_done(None).details()
+
+    def cancel(self):
+        """Shared calls cannot be cancelled"""
+        return False
+
+    def cancelled(self):
+        """Whether the underlying call was cancelled"""
+        return self._done.is_set() and self._call.cancelled()
+
+    def running(self):
+        """Whether the underlying call is running"""
+        return not self._done.is_set()
+
+    def done(self):
+        """Whether the underlying call is done"""
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Get the result of the underlying call"""
+        return self._wait_until_done(timeout).result()
+
+    def exception(self, timeout=None):
+        """Get the exception of the underlying call"""
+        return self._wait_until_done(timeout).exception()
+
+    def traceback(self, timeout=None):
+        """Get the traceback of the underlying call's exception"""
+        return self._wait_until_done(timeout).traceback()
+
+    def add_callback(self, callback):
+        """Register a callback for the termination of the RPC"""
+        with self._lock:
+            if self._done.is_set():
+                return False
+            self._callbacks.append(lambda _: callback())
+            return True
+
+    def is_active(self):
+        """Whether the RPC is active"""
+        return not self._done.is_set()
+
+    def time_remaining(self):
+        """Time remaining is not known for shared calls"""
+        return None
+
+    def add_done_callback(self, fn):
+        """Call fn with this call once the underlying call is done"""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+
+class LocalCall(grpc.RpcError, grpc.Call, grpc.Future):
+    """A unary call completed by the client itself, e.g. from a tunnel stream or in-process.
+
+    Like grpc's calls, the call is its own exception if it fails.
+    """
+
+    def __init__(self, response_deserializer, on_cancel, timeout):
+        """Initialize a running call
+
+        Args:
+            response_deserializer: optional function deserializing the response payload
+            on_cancel: optional function called with the call when it gets cancelled
+            timeout: optional timeout of the call in seconds
+        """
+        super(LocalCall, self).__init__()
+        self._response_deserializer = response_deserializer
+        self._on_cancel = on_cancel
+        self._deadline = None if timeout is None else time.monotonic() + timeout
+        self._condition = threading.Condition()
+        self._done = False
+        self._cancelled = False
+        self._code = None
+        self._details = None
+        self._payload = None
+        self._trailing_metadata = None
+        self._callbacks = []
+
+    def _complete(self, code, details, payload=None, trailing_metadata=(), cancelled=False):
+        """Complete the call, returning False if it was already done"""
+        with self._condition:
+            if self._done:
+                return False
+            self._done = True
+            self._cancelled = cancelled
+            self._code = code
+            self._details = details
+            self._payload = payload
+            self._trailing_metadata = tuple(trailing_metadata)
+            callbacks, self._callbacks = self._callbacks, []
+            self._condition.notify_all()
+        for callback in callbacks:
+            callback(self)
+        return True
+
+    def _wait_until_done(self, timeout):
+        """Wait for the call to complete, raising FutureTimeoutError on timeout"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._done, timeout=timeout):
+                raise grpc.FutureTimeoutError()
+
+    def initial_metadata(self):
+        """Initial metadata is not available for local calls"""
+        return ()
+
+    def trailing_metadata(self):
+        """Get the trailing metadata"""
+        self._wait_until_done(None)
+        return self._trailing_metadata
+
+    def code(self):
+        """Get the status code"""
+        self._wait_until_done(None)
+        return self._code
+
+    def details(self):
+        """Get the status details"""
+        self._wait_until_done(None)
+        return self._details
+
+    def cancel(self):
+        """Cancel the call. The server still runs it if it already received it"""
+        if self._done:
+            return False
+        if self._on_cancel is not None:
+            self._on_cancel(self)
+        return self._complete(
+            grpc.StatusCode.CANCELLED, "Locally cancelled by application!", cancelled=True
+        )
+
+    def cancelled(self):
+        """Whether the call was cancelled"""
+        return self._cancelled
+
+    def running(self):
+        """Whether the call is running"""
+        return not self._done
+
+    def done(self):
+        """Whether the call is done"""
+        return self._done
+
+    def result(self, timeout=None):
+        """Get the response, raising the call itself if it failed"""
+        exception = self.exception(timeout=timeout)
+        if exception is not None:
+            raise exception
+        if self._response_deserializer is None:
+            return self._payload
+        return self._response_deserializer(self._payload)
+
+    def exception(self, timeout=None):
+        """Get the call itself if it failed, otherwise None"""
+        self._wait_until_done(timeout)
+        if self._cancelled:
+            raise grpc.FutureCancelledError()
+        if self._code is grpc.StatusCode.OK:
+            return None
+        return self
+
+    def traceback(self, timeout=None):
+        """Local calls carry no traceback"""
+        self._wait_until_done(timeout)
+        return None
+
+    def add_callback(self, callback):
+        """Register a callback for the termination of the call"""
+        with self._condition:
+            if self._done:
+                return False
+            self._callbacks.append(lambda _: callback())
+            return True
+
+    def is_active(self):
+        """Whether the call is running"""
+        return not self._done
+
+    def time_remaining(self):
+        """Seconds until the deadline, or None without a deadline"""
+        if self._deadline is None:
+            return None
+        return max(self._deadline - time.monotonic(), 0)
+
+    def add_done_callback(self, fn):
+        """Call fn with this call once it is done"""
+        with self._condition:
+            if not self._done:
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def __str__(self):
+        """Describe the call"""
+        return "<LocalCall of RPC that terminated with {}: {}>".format(self._code, self._details)
@@ -0,0 +1,136 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""Prometheus instrumentation of the connectivity of client channels"""
+import logging
+import threading
+import time
+from timeit import default_timer
+
+import grpc
+import prometheus_client
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_STATE_GAUGE = prometheus_client.Gauge(
+    "clientside_grpc_channel_state",
+    "Connectivity state of client channels, 1 for the current state and 0 otherwise",
+    labelnames=("client_name", "server_name", "state"),
+)
+CHANNEL_TRANSITIONS_COUNTER = prometheus_client.Counter(
+    "clientside_grpc_channel_state_transitions",
+    "Connectivity state transitions of client channels",
+    labelnames=("client_name", "server_name", "from_state", "to_state"),
+)
+CHANNEL_RECONNECTS_COUNTER = prometheus_client.Counter(
+    "clientside_grpc_channel_reconnects",
+    "Times client channels became ready again after having been ready before",
+    labelnames=("client_name", "server_name"),
+)
+CHANNEL_STATE_SECONDS_COUNTER = prometheus_client.Counter(
+    "clientside_grpc_channel_state_seconds",
+    "Time client channels spent in each connectivity state, counted when the state is left",
+    labelnames=("client_name", "server_name", "state"),
+)
+
+
+# grpc polls the connectivity of subscribed channels in watches of this many seconds, after which
+# its polling thread notices that the channel has no subscribers left
+_GRPC_POLLING_INTERVAL = 0.2
+
+
+def _state_label(state):
+    """Metric label of a connectivity state"""
+    return state.name.lower()
+
+
+class ChannelConnectivityMonitor(object):
+    """Exports the connectivity state transitions of a channel as prometheus metrics"""
+
+    def __init__(self, channel, client_label, server_label):
+        """Initialize
+
+        Args:
+            channel: grpc channel to monitor
+            client_label: client label for metrics
+            server_label: server label for metrics
+        """
+        self._channel = channel
+        self._client_label = client_label
+        self._server_label = server_label
+        self._lock = threading.Lock()
+        self._state = None
+        self._entered_state_at = None
+        self._was_ready = False
+
+    @property
+    def state(self):
+        """Last observed connectivity state of the channel, None before the first observation"""
+        return self._state
+
+    def start(self, try_to_connect=False):
+        """Start monitoring, optionally asking the channel to connect right away"""
+        self._channel.subscribe(self._on_state_change, try_to_connect=try_to_connect)
+
+    def stop(self):
+        """Stop monitoring
+
+        Waits for grpc's polling thread to stop watching the channel, which fails if the channel
+        gets closed during a watch.
+        """
+        self._channel.unsubscribe(self._on_state_change)
+        # Only grpc's own channels poll, channels wrapping them unsubscribe from them
+        connectivity_state = getattr(self._channel, "_connectivity_state", None)
+        deadline = time.monotonic() + 2 * _GRPC_POLLING_INTERVAL
+        while getattr(connectivity_state, "polling", False) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _on_state_change(self, state):
+        """Record a connectivity state transition"""
+        now = default_timer()
+        with self._lock:
+            if state is self._state:
+                return
+            previous_state, self._state = self._state, state
+            previous_entered_at, self._entered_state_at = self._entered_state_at, now
+            reconnected = state is grpc.ChannelConnectivity.READY and self._was_ready
+            if state is grpc.ChannelConnectivity.READY:
+                self._was_ready = True
+
+        labels = (self._client_label, self._server_label)
+        CHANNEL_STATE_GAUGE.labels(*labels, _state_label(state)).set(1)
+        if previous_state is not None:
+            CHANNEL_STATE_GAUGE.labels(*labels, _state_label(previous_state)).set(0)
+            CHANNEL_STATE_SECONDS_COUNTER.labels(*labels, _state_label(previous_state)).inc(
+                now - previous_entered_at
+            )
+            CHANNEL_TRANSITIONS_COUNTER.labels(
+                *labels, _state_label(previous_state), _state_label(state)
+            ).inc()
+        if reconnected:
+            CHANNEL_RECONNECTS_COUNTER.labels(*labels).inc()
+        logger.debug(
+            "Channel of %s to %s went from %s to %s",
+            self._client_label,
+            self._server_label,
+            previous_state,
+            state,
+        )
+
+
+def wait_for_channel_ready(channel, timeout):
+    """Block until the channel is connected or the timeout expires
+
+    Args:
+        channel: grpc channel
+        timeout: timeout in seconds
+
+    Returns:
+        True if the channel is ready, False if the timeout expired first
+    """
+    ready_future = grpc.channel_ready_future(channel)
+    try:
+        ready_future.result(timeout=timeout)
+        return True
+    except grpc.FutureTimeoutError:
+        ready_future.cancel()
+        return False
@@ -1,26 +1,131 @@
 # Copyright 2020-present Kensho Technologies, LLC.
 """Implementing client-side grpc interceptors"""
+import collections
 import functools
 import json
+import random
+import sys
+import threading
+import time
+from timeit import default_timer
+import zlib
 
-import backoff
 import grpc
 import prometheus_client
 
+from eagr.client.call_futures import (
+    FailedCall,
+    ForwardingCall,
+    RejectedCall,
+    RetryingCall,
+    SharedCall,
+    TranslatedCall,
+)
+from eagr.client.service_config import MethodConfigMatcher
+from eagr.server.middleware import get_current_servicer_context
+
 
 CLIENTSIDE_METRICS_HISTO = prometheus_client.Histogram(
     "clientside_grpc_endpoint",
     "Response time histogram for grpc endpoints from the client-side",
     labelnames=("client_name", "server_name", "service", "endpoint"),
 )
+CLIENTSIDE_STREAM_FIRST_MESSAGE_HISTO = prometheus_client.Histogram(
+    "clientside_grpc_stream_first_message",
+    "Time from the start of a streaming call to its first response message",
+    labelnames=("client_name", "server_name", "service", "endpoint"),
+)
+CLIENTSIDE_STREAM_MESSAGE_WAIT_HISTO = prometheus_client.Histogram(
+    "clientside_grpc_stream_message_wait",
+    "Time spent waiting for each subsequent response message of a streaming call",
+    labelnames=("client_name", "server_name", "service", "endpoint"),
+)
+CLIENTSIDE_STREAM_MESSAGES_COUNTER = prometheus_client.Counter(
+    "clientside_grpc_stream_messages",
+    "Response messages received by streaming calls",
+    labelnames=("client_name", "server_name", "service", "endpoint"),
+)
 CLIENTSIDE_ERROR_COUNTER = prometheus_client.Counter(
     "clientside_grpc_endpoint_error",
     "Clientside exception counts for grpc methods",
     labelnames=("client_name", "server_name", "service", "endpoint", "exception"),
 )
+CLIENTSIDE_REQUEST_BYTES_COUNTER = prometheus_client.Counter(
+    "clientside_grpc_request_bytes",
+    "Serialized size of requests before compression, by the compression applied to them",
+    labelnames=("client_name", "server_name", "service", "endpoint", "compression"),
+)
+CLIENTSIDE_COMPRESSION_SAMPLE_BYTES_COUNTER = prometheus_client.Counter(
+    "clientside_grpc_request_compression_sample_bytes",
+    "Size of a sample of compressed requests before and after compression",
+    labelnames=("client_name", "server_name", "service", "endpoint", "compression", "stage"),
+)
+CLIENTSIDE_SINGLEFLIGHT_SAVED_COUNTER = prometheus_client.Counter(
+    "clientside_grpc_singleflight_saved_calls",
+    "Calls that were not sent because an identical call was in flight",
+    labelnames=("client_name", "server_name", "service", "endpoint"),
+)
+CLIENTSIDE_THROTTLE_PROBABILITY_GAUGE = prometheus_client.Gauge(
+    "clientside_grpc_throttle_probability",
+    "Probability with which the client rejects calls locally because the server rejects calls",
+    labelnames=("client_name", "server_name"),
+)
+CLIENTSIDE_THROTTLED_COUNTER = prometheus_client.Counter(
+    "clientside_grpc_throttled_calls",
+    "Calls rejected locally by adaptive throttling",
+    labelnames=("client_name", "server_name", "service", "endpoint"),
+)
 
 GRPC_RENDEZVOUS_ERROR = "_Rendezvous"
 
+# Fraction of compressed requests whose compressed size is measured
+DEFAULT_COMPRESSION_SAMPLE_RATE = 0.01
+
+# Adaptive throttling rejects calls locally once the server accepts fewer than 1/K of them
+DEFAULT_THROTTLING_K = 2.0
+DEFAULT_THROTTLING_WINDOW_SECONDS = 120
+THROTTLING_WINDOW_BUCKETS = 60
+# Status codes with which a server rejects calls under load
+DEFAULT_THROTTLING_REJECTION_CODES = (
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+    grpc.StatusCode.UNAVAILABLE,
+)
+
+# Inbound time remaining above this is grpc's representation of "no deadline"
+NO_DEADLINE_THRESHOLD_SECONDS = 1e9
+
+
+class _ClientCallDetails(
+    collections.namedtuple(
+        "_ClientCallDetails",
+        ("method", "timeout", "metadata", "credentials", "wait_for_ready", "compression"),
+    ),
+    grpc.ClientCallDetails,
+):
+    """Concrete client call details that interceptors can pass on to the continuation"""
+
+
+CompressionPolicy = collections.namedtuple("CompressionPolicy", ("threshold_bytes", "algorithm"))
+CompressionPolicy.__doc__ = """Compress requests whose serialized size is at least threshold_bytes
+
+algorithm is grpc.Compression.Gzip or grpc.Compression.Deflate.
+"""
+
+# zlib window bits producing the formats of the grpc compression algorithms
+_ZLIB_WBITS = {
+    grpc.Compression.Gzip: 16 + zlib.MAX_WBITS,
+    grpc.Compression.Deflate: zlib.MAX_WBITS,
+}
+
+
+def _replace_client_call_details(client_call_details, **changes):
+    """Copy client call details, replacing the given fields"""
+    fields = {
+        field: getattr(client_call_details, field, None) for field in _ClientCallDetails._fields
+    }
+    fields.update(changes)
+    return _ClientCallDetails(**fields)
+
 
 def get_service_and_method_from_url(method_url):
     """Extract service and method names from the method url string.
@@ -111,6 +216,146 @@ class GRPCClientUnaryOutputInterceptor(
         return self._intercept_call(continuation, client_call_details, request_iterator)
 
 
+class FusedClientInterceptor(
+    grpc.UnaryUnaryClientInterceptor,
+    grpc.StreamUnaryClientInterceptor,
+    grpc.UnaryStreamClientInterceptor,
+    grpc.StreamStreamClientInterceptor,
+):
+    """Single GRPC client interceptor applying a whole chain of client middlewares.
+
+    Stacking one interceptor per middleware makes every call go through each interceptor layer,
+    parse the metadata and the method url, and resolve metric label children again. The fused
+    interceptor computes the decorators of metadata-independent middlewares once per method,
+    parses the metadata at most once per call (and only if a middleware needs it), and applies
+    the resulting chain in a single interceptor layer.
+
+    The first middleware in the list is the outermost one, i.e. the middlewares are applied like
+    decorators and the later a middleware is in the list the closer it is to the wire.
+    """
+
+    def __init__(self, middlewares):
+        """Initialize with the list of GRPCClientMiddleware objects"""
+        super(FusedClientInterceptor, self).__init__()
+        self._middlewares = tuple(middlewares)
+        # (method name, response streaming) -> (chain, chain needs metadata). The chain is a tuple
+        # of (decorator, middleware) pairs: the decorator is precomputed when the middleware does
+        # not depend on the metadata, and the middleware is kept to compute it per call otherwise.
+        self._chains = {}
+
+    def _build_chain(self, method_name, response_streaming):
+        """Compute the decorator chain for a method"""
+        chain = []
+        needs_metadata = False
+        for middleware in self._middlewares:
+            if response_streaming and not middleware.intercepts_streaming_responses:
+                continue
+            if not response_streaming and not middleware.intercepts_unary_responses:
+                continue
+            if middleware.metadata_dependent:
+                chain.append((None, middleware))
+                needs_metadata = True
+            else:
+                decorator = middleware.get_decorator(method_name, {})
+                if decorator:
+                    chain.append((decorator, None))
+        # Reverse so that the first middleware ends up as the outermost decorator
+        return tuple(reversed(chain)), needs_metadata
+
+    def _intercept_call(
+        self, continuation, client_call_details, request_or_iterator, response_streaming
+    ):
+        """Interceptor implementation"""
+        key = (client_call_details.method, response_streaming)
+        chain_and_flag = self._chains.get(key)
+        if chain_and_flag is None:
+            chain_and_flag = self._build_chain(client_call_details.method, response_streaming)
+            self._chains[key] = chain_and_flag
+        chain, needs_metadata = chain_and_flag
+
+        metadata = None
+        if needs_metadata:
+            metadata = _get_metadata_map_from_client_details(client_call_details)
+
+        handler = continuation
+        for decorator, middleware in chain:
+            if middleware is not None:
+                decorator = middleware.get_decorator(client_call_details.method, metadata)
+                if not decorator:
+                    continue
+            if handler is not continuation:
+                # Separate interceptors would hand an exception raised by an inner middleware to
+                # the outer ones as a failed call, so keep doing that within the fused chain
+                handler = _returning_failed_calls(handler)
+            handler = decorator(handler)
+
+        return handler(client_call_details, request_or_iterator)
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        """Intercept unary-unary."""
+        return self._intercept_call(continuation, client_call_details, request, False)
+
+    def intercept_stream_unary(self, continuation, client_call_details, request_iterator):
+        """Intercept stream-unary."""
+        return self._intercept_call(continuation, client_call_details, request_iterator, False)
+
+    def intercept_unary_stream(self, continuation, client_call_details, request):
+        """Intercept unary-stream."""
+        return self._intercept_call(continuation, client_call_details, request, True)
+
+    def intercept_stream_stream(self, continuation, client_call_details, request_iterator):
+        """Intercept stream-stream."""
+        return self._intercept_call(continuation, client_call_details, request_iterator, True)
+
+
+def _returning_failed_calls(fn):
+    """Make fn return a failed call instead of raising"""
+
+    @functools.wraps(fn)
+    def wrap(client_call_details, request):
+        """Inner wrapper"""
+        try:
+            return fn(client_call_details, request)
+        except grpc.RpcError as exc:
+            if isinstance(exc, grpc.Future):
+                return exc
+            return FailedCall(exc, sys.exc_info()[2])
+        except Exception as exc:  # pylint: disable=broad-except
+            return FailedCall(exc, sys.exc_info()[2])
+
+    return wrap
+
+
+class GRPCClientStreamOutputInterceptor(
+    grpc.UnaryStreamClientInterceptor, grpc.StreamStreamClientInterceptor
+):
+    """GRPC interceptor that makes intercepts only stream-output grpcs."""
+
+    def __init__(self, decorator_fn):
+        """Initialize interceptor with a factory function producing decorators."""
+        super(GRPCClientStreamOutputInterceptor, self).__init__()
+        self._decorator_fn = decorator_fn
+
+    def _intercept_call(self, continuation, client_call_details, request_or_iterator):
+        """Interceptor implementation"""
+        metadata = _get_metadata_map_from_client_details(client_call_details)
+        decorator = self._decorator_fn(client_call_details.method, metadata)
+        if not decorator:
+            handler = continuation
+        else:
+            handler = decorator(continuation)
+
+        return handler(client_call_details, request_or_iterator)
+
+    def intercept_unary_stream(self, continuation, client_call_details, request):
+        """Intercept unary-stream."""
+        return self._intercept_call(continuation, client_call_details, request)
+
+    def intercept_stream_stream(self, continuation, client_call_details, request_iterator):
+        """Intercept stream-stream."""
+        return self._intercept_call(continuation, client_call_details, request_iterator)
+
+
 class GRPCClientMiddleware(object):
     """Base class for GRPC client-side middleware.
 
@@ -126,8 +371,12 @@ class GRPCClientMiddleware(object):
       get_interceptors(self) will be called to retrieve all GRPC interceptors
         necessary for the middleware.  Users may extend this method to include
         additional interceptors.
+      Middlewares whose get_decorator ignores the metadata should set metadata_dependent to
+        False, so that FusedClientInterceptor can compute their decorator once per method.
     """
 
+    metadata_dependent = True
+
     def __init__(self, client_label, server_label, interceptor_class):
         """Initialize"""
         super(GRPCClientMiddleware, self).__init__()
@@ -145,6 +394,16 @@ class GRPCClientMiddleware(object):
         """Get client label."""
         return self._client_label
 
+    @property
+    def intercepts_unary_responses(self):
+        """Whether the middleware applies to methods with a unary response."""
+        return issubclass(self._interceptor_class, grpc.UnaryUnaryClientInterceptor)
+
+    @property
+    def intercepts_streaming_responses(self):
+        """Whether the middleware applies to methods with a streaming response."""
+        return issubclass(self._interceptor_class, grpc.UnaryStreamClientInterceptor)
+
     def get_interceptors(self):
         """Get a list of interceptors needed by the middleware."""
         return [self._interceptor_class(self.get_decorator)]
@@ -153,6 +412,8 @@ class GRPCClientMiddleware(object):
 class ClientSideMetricsMiddleware(GRPCClientMiddleware):
     """GRPC middleware that captures prometheus metrics."""
 
+    metadata_dependent = False
+
     def __init__(self, client_label, server_label):
         """Initialize"""
         super(ClientSideMetricsMiddleware, self).__init__(
@@ -160,7 +421,7 @@ class ClientSideMetricsMiddleware(GRPCClientMiddleware):
         )
 
     class Timer(object):
-        """Decorator that wraps a function in a prometheus histogram."""
+        """Decorator that observes the duration of the call in a prometheus histogram."""
 
         def __init__(self, histogram):
             """Initializes with the histogram object."""
@@ -172,8 +433,14 @@ class ClientSideMetricsMiddleware(GRPCClientMiddleware):
             @functools.wraps(fn)
             def wrap(request, context):
                 """Inner wrapper."""
-                with self._histogram.time():
-                    return fn(request, context)
+                started_at = default_timer()
+                call = fn(request, context)
+                # Observe when the call completes rather than when it is initiated, so that
+                # futures and streams are timed correctly without blocking on them
+                call.add_done_callback(
+                    lambda _: self._histogram.observe(max(default_timer() - started_at, 0))
+                )
+                return call
 
             return wrap
 
@@ -190,9 +457,90 @@ class ClientSideMetricsMiddleware(GRPCClientMiddleware):
         )
 
 
+class ClientSideStreamMetricsMiddleware(GRPCClientMiddleware):
+    """GRPC middleware that captures prometheus metrics for the messages of streaming responses.
+
+    The total duration of streaming calls is captured by ClientSideMetricsMiddleware.
+    """
+
+    metadata_dependent = False
+
+    def __init__(self, client_label, server_label):
+        """Initialize"""
+        super(ClientSideStreamMetricsMiddleware, self).__init__(
+            client_label, server_label, GRPCClientStreamOutputInterceptor
+        )
+
+    class StreamTimer(object):
+        """Decorator that instruments the response stream of a call."""
+
+        def __init__(self, first_message_histogram, message_wait_histogram, messages_counter):
+            """Initializes with the bound metric children."""
+            self._first_message_histogram = first_message_histogram
+            self._message_wait_histogram = message_wait_histogram
+            self._messages_counter = messages_counter
+
+        def __call__(self, fn):
+            """Wrap a method with stream instrumentation."""
+
+            @functools.wraps(fn)
+            def wrap(request, context):
+                """Inner wrapper."""
+                started_at = default_timer()
+                return InstrumentedResponseStream(fn(request, context), started_at, self)
+
+            return wrap
+
+    def get_decorator(self, method_name, _):
+        """Normalize metric name and return decorator that instruments response streams"""
+        service_label, endpoint_label = get_service_and_method_from_url(method_name)
+        labels = (self.client_label, self.server_label, service_label, endpoint_label)
+        return self.StreamTimer(
+            CLIENTSIDE_STREAM_FIRST_MESSAGE_HISTO.labels(*labels),
+            CLIENTSIDE_STREAM_MESSAGE_WAIT_HISTO.labels(*labels),
+            CLIENTSIDE_STREAM_MESSAGES_COUNTER.labels(*labels),
+        )
+
+
+class InstrumentedResponseStream(ForwardingCall):
+    """Response stream of a call recording the time to each message as it is consumed"""
+
+    def __init__(self, call, started_at, stream_timer):
+        """Initialize with the streaming call, its start time and the StreamTimer"""
+        super(InstrumentedResponseStream, self).__init__(call)
+        self._last_message_at = started_at
+        self._first_message = True
+        self._stream_timer = stream_timer
+
+    def __iter__(self):
+        """Iterate over the response messages"""
+        return self
+
+    def __next__(self):
+        """Get the next response message"""
+        # Only the time spent inside next() counts, so that the time the application takes
+        # to process a message does not show up as a gap between messages
+        waiting_since = self._last_message_at if self._first_message else default_timer()
+        message = next(self._call)
+        self._last_message_at = default_timer()
+        if self._first_message:
+            self._first_message = False
+            self._stream_timer._first_message_histogram.observe(
+                self._last_message_at - waiting_since
+            )
+        else:
+            self._stream_timer._message_wait_histogram.observe(
+                self._last_message_at - waiting_since
+            )
+        self._stream_timer._messages_counter.inc()
+        return message
+
+
 class ClientSideExceptionCountMiddleware(GRPCClientMiddleware):
     """GRPC middleware that captures prometheus metrics for unary outputs."""
 
+    metadata_dependent = False
+
     def __init__(self, client_label, server_label):
         """Initialize"""
         super(ClientSideExceptionCountMiddleware, self).__init__(
@@ -217,27 +565,34 @@ class ClientSideExceptionCountMiddleware(GRPCClientMiddleware):
             def wrap(request, context):
                 """Inner wrapper."""
                 r = fn(request, context)
-                if r.exception():
-                    # If we get a Rendezvous error, we want some more information about the type
-                    # of error we are getting. For example, a GRPC timeout error will be labelled as
-                    # exception "_Rendezvous: <StatusCode.DEADLINE_EXCEEDED: 4>". All errors can be
-                    # found at https://grpc.github.io/grpc/python/grpc.html#grpc-status-code
-                    if type(r.exception()).__name__ == GRPC_RENDEZVOUS_ERROR:
-                        exception = GRPC_RENDEZVOUS_ERROR + ": " + repr(r.exception().code())
-                    # No guarantees of status code for other errors--only report error type.
-                    else:
-                        exception = type(r.exception()).__name__
-                    self._counter.labels(
-                        client_name=self._client_name,
-                        server_name=self._server_name,
-                        service=self._service,
-                        endpoint=self._endpoint,
-                        exception=exception,
-                    ).inc()
+                r.add_done_callback(self._count_exception)
                 return r
 
             return wrap
 
+        def _count_exception(self, r):
+            """Count the exception of a completed call, if any."""
+            if r.cancelled():
+                return
+            exception = r.exception()
+            if exception:
+                # If we get a Rendezvous error, we want some more information about the type
+                # of error we are getting. For example, a GRPC timeout error will be labelled as
+                # exception "_Rendezvous: <StatusCode.DEADLINE_EXCEEDED: 4>". All errors can be
+                # found at https://grpc.github.io/grpc/python/grpc.html#grpc-status-code
+                if type(exception).__name__ == GRPC_RENDEZVOUS_ERROR:
+                    exception_label = GRPC_RENDEZVOUS_ERROR + ": " + repr(exception.code())
+                # No guarantees of status code for other errors--only report error type.
+                else:
+                    exception_label = type(exception).__name__
+                self._counter.labels(
+                    client_name=self._client_name,
+                    server_name=self._server_name,
+                    service=self._service,
+                    endpoint=self._endpoint,
+                    exception=exception_label,
+                ).inc()
+
     def get_decorator(self, method_name, _):
         """Normalize method name and return decorator that captures exceptions"""
         service_label, endpoint_label = get_service_and_method_from_url(method_name)
@@ -253,6 +608,8 @@ class ClientSideExceptionCountMiddleware(GRPCClientMiddleware):
 class ClientExceptionTranslationMiddlewareUnaryOutput(GRPCClientMiddleware):
     """Translate client exception"""
 
+    metadata_dependent = False
+
     def __init__(self, client_label, server_label, code_to_exception_class_func):
         """Initialize"""
         super(ClientExceptionTranslationMiddlewareUnaryOutput, self).__init__(
@@ -267,20 +624,22 @@ class ClientExceptionTranslationMiddlewareUnaryOutput(GRPCClientMiddleware):
             """Initializes with the counter object"""
             self._code_to_exception_class_func = code_to_exception_class_func
 
+        def _translate_exception(self, exc):
+            """Get the exception to raise in place of a grpc error"""
+            return translate_grpc_exception(self._code_to_exception_class_func, exc)
+
         def __call__(self, fn):
-            """Wrap a method with an exception counter"""
+            """Wrap a method with an exception translator"""
 
             @functools.wraps(fn)
             def wrap(request, context):
-                """Execute a function, if an exception is raised, change its type if necessary"""
+                """Execute a function, change the type of its exception if necessary"""
                 try:
                     result = fn(request, context)
-                    if result.code() is grpc.StatusCode.OK:
-                        return result
-                    else:
-                        raise result
                 except grpc.RpcError as exc:
                     raise_exception_from_grpc_exception(self._code_to_exception_class_func, exc)
+                # The error of the call is translated once it completes
+                return TranslatedCall(result, self._translate_exception)
 
             return wrap
 
@@ -292,13 +651,28 @@ class ClientExceptionTranslationMiddlewareUnaryOutput(GRPCClientMiddleware):
 class ClientRetryingMiddlewareUnaryOutput(GRPCClientMiddleware):
     """Translate client exception"""
 
-    def __init__(self, client_label, server_label, exceptions_to_retry, max_retries):
-        """Initialize"""
+    metadata_dependent = False
+
+    def __init__(
+        self, client_label, server_label, exceptions_to_retry, max_retries, service_config=None
+    ):
+        """Initialize
+
+        Args:
+            client_label: client label
+            server_label: server label
+            exceptions_to_retry: tuple of exception classes to retry
+            max_retries: maximum number of retries
+            service_config: optional gRPC service config (JSON string or dict) of the channel.
+                            Methods it gives a retry or hedging policy are retried by the gRPC
+                            core and are not retried here
+        """
         super(ClientRetryingMiddlewareUnaryOutput, self).__init__(
             client_label, server_label, GRPCClientUnaryOutputInterceptor
         )
         self._exceptions_to_retry = exceptions_to_retry
         self._max_retries = max_retries
+        self._method_configs = MethodConfigMatcher(service_config)
 
     class Retrier(object):
         """Decorator that wraps a function in a exception translator"""
@@ -309,29 +683,489 @@ class ClientRetryingMiddlewareUnaryOutput(GRPCClientMiddleware):
             self._max_retries = max_retries
 
         def __call__(self, fn):
-            """Wrap a method with an exception counter"""
-            return backoff.on_exception(backoff.expo, self._exceptions_to_retry, self._max_retries)(
-                fn
-            )
+            """Wrap a method with a retrier"""
+
+            @functools.wraps(fn)
+            def wrap(request, context):
+                """Issue the call, retrying it with exponential backoff once it fails"""
+
+                def issue_call():
+                    """Issue one attempt"""
+                    try:
+                        return fn(request, context)
+                    except Exception as exc:  # pylint: disable=broad-except
+                        return FailedCall(exc, sys.exc_info()[2])
+
+                return RetryingCall(issue_call, self._exceptions_to_retry, self._max_retries)
+
+            return wrap
 
     def get_decorator(self, method_name, _):
-        """Return exception translator decorator"""
+        """Return the retrier decorator, or None if the gRPC core retries the method"""
+        if self._method_configs.covers_retries(method_name):
+            return None
         return self.Retrier(self._exceptions_to_retry, self._max_retries)
 
 
-def raise_exception_from_grpc_exception(code_to_exception_class_func, exc):
-    """Raise exception from exc, translating with code_to_exception_class_func"""
+class ClientSingleflightMiddleware(GRPCClientMiddleware):
+    """Deduplicate identical unary calls that are in flight at the same time.
+
+    Calls are identical if they have the same method, the same serialized request and the same
+    values for the chosen metadata keys. Only the first of them is sent and the others complete
+    with its outcome, including its errors. Note that the first call's timeout applies to all of
+    them and that cancelling it cancels it for all of them, while the others cannot be cancelled.
+    """
+
+    metadata_dependent = False
+
+    def __init__(self, client_label, server_label, metadata_keys=()):
+        """Initialize
+
+        Args:
+            client_label: client label
+            server_label: server label
+            metadata_keys: optional iterable of metadata keys whose values are part of the
+                           identity of a call, e.g. the keys carrying the caller's credentials
+        """
+        super(ClientSingleflightMiddleware, self).__init__(
+            client_label, server_label, GRPCClientUnaryOutputInterceptor
+        )
+        self._metadata_keys = frozenset(metadata_keys)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    class Deduplicator(object):
+        """Decorator that shares the outcome of identical in-flight calls"""
+
+        def __init__(self, lock, in_flight, metadata_keys, saved_calls_counter):
+            """Initializes with the middleware's in-flight calls and the bound counter"""
+            self._lock = lock
+            self._in_flight = in_flight
+            self._metadata_keys = metadata_keys
+            self._saved_calls_counter = saved_calls_counter
+
+        def _get_key(self, client_call_details, request):
+            """Get the identity of a call"""
+            metadata = tuple(
+                sorted(
+                    (key, value)
+                    for key, value in (client_call_details.metadata or ())
+                    if key in self._metadata_keys
+                )
+            )
+            return (
+                client_call_details.method,
+                request.SerializeToString(deterministic=True),
+                metadata,
+            )
+
+        def _complete(self, key, shared_call, call):
+            """Hand the outcome of a completed call to the calls that waited for it"""
+            with self._lock:
+                if self._in_flight.get(key) is shared_call:
+                    del self._in_flight[key]
+            shared_call.set_call(call)
+
+        def __call__(self, fn):
+            """Wrap a method with the deduplicator"""
+
+            @functools.wraps(fn)
+            def wrap(client_call_details, request):
+                """Inner wrapper"""
+                # Streaming requests cannot be compared before they are sent
+                if not hasattr(request, "SerializeToString"):
+                    return fn(client_call_details, request)
+
+                key = self._get_key(client_call_details, request)
+                # Register before issuing the call, since blocking calls only return once they
+                # are done
+                shared_call = SharedCall()
+                with self._lock:
+                    in_flight_call = self._in_flight.setdefault(key, shared_call)
+                if in_flight_call is not shared_call:
+                    self._saved_calls_counter.inc()
+                    return in_flight_call
+
+                try:
+                    call = fn(client_call_details, request)
+                except Exception as exc:  # pylint: disable=broad-except
+                    call = FailedCall(exc, sys.exc_info()[2])
+                call.add_done_callback(lambda _: self._complete(key, shared_call, call))
+                return call
+
+            return wrap
+
+    def get_decorator(self, method_name, _):
+        """Return decorator deduplicating the calls of the method"""
+        service_label, endpoint_label = get_service_and_method_from_url(method_name)
+        return self.Deduplicator(
+            self._lock,
+            self._in_flight,
+            self._metadata_keys,
+            CLIENTSIDE_SINGLEFLIGHT_SAVED_COUNTER.labels(
+                self.client_label, self.server_label, service_label, endpoint_label
+            ),
+        )
+
+
+class _SlidingWindowCounts(object):
+    """Counts of requests and accepts over a sliding time window, kept in buckets"""
+
+    def __init__(self, window_seconds, num_buckets):
+        """Initialize an empty window"""
+        self._bucket_seconds = window_seconds / num_buckets
+        self._num_buckets = num_buckets
+        # Deque of [bucket index, requests, accepts]
+        self._buckets = collections.deque()
+        self.requests = 0
+        self.accepts = 0
+
+    def _current_bucket(self):
+        """Get the bucket of the current time, dropping the buckets that left the window"""
+        bucket_index = int(time.monotonic() / self._bucket_seconds)
+        while self._buckets and self._buckets[0][0] <= bucket_index - self._num_buckets:
+            _, requests, accepts = self._buckets.popleft()
+            self.requests -= requests
+            self.accepts -= accepts
+        if not self._buckets or self._buckets[-1][0] != bucket_index:
+            self._buckets.append([bucket_index, 0, 0])
+        return self._buckets[-1]
+
+    def add_request(self):
+        """Count a request"""
+        self._current_bucket()[1] += 1
+        self.requests += 1
+
+    def add_accept(self):
+        """Count an accepted request"""
+        self._current_bucket()[2] += 1
+        self.accepts += 1
+
+    def refresh(self):
+        """Drop the buckets that left the window"""
+        self._current_bucket()
+
+
+class ClientAdaptiveThrottlingMiddleware(GRPCClientMiddleware):
+    """Reject calls locally while the server rejects many of them (adaptive throttling).
+
+    Following the client-side throttling of the SRE book, the client counts the requests it made
+    and the requests the server accepted over a sliding window, and rejects new calls with
+    probability max(0, (requests - K * accepts) / (requests + 1)). Calls are rejected locally with
+    RESOURCE_EXHAUSTED. A lower K throttles more aggressively.
+    """
+
+    metadata_dependent = False
+
+    def __init__(
+        self,
+        client_label,
+        server_label,
+        k=DEFAULT_THROTTLING_K,
+        window_seconds=DEFAULT_THROTTLING_WINDOW_SECONDS,
+        rejection_codes=DEFAULT_THROTTLING_REJECTION_CODES,
+    ):
+        """Initialize
+
+        Args:
+            client_label: client label
+            server_label: server label
+            k: multiplier of the accepts, the client sends up to K times as many requests as the
+               server accepts before throttling
+            window_seconds: length of the sliding window in seconds
+            rejection_codes: status codes with which the server rejects calls
+        """
+        super(ClientAdaptiveThrottlingMiddleware, self).__init__(
+            client_label, server_label, GRPCClientGeneralInterceptor
+        )
+        self._k = k
+        self._rejection_codes = frozenset(rejection_codes)
+        self._lock = threading.Lock()
+        self._counts = _SlidingWindowCounts(window_seconds, THROTTLING_WINDOW_BUCKETS)
+        self._probability_gauge = CLIENTSIDE_THROTTLE_PROBABILITY_GAUGE.labels(
+            client_label, server_label
+        )
+
+    def _get_rejection_probability(self):
+        """Get the probability of rejecting a request. Must hold the lock"""
+        requests = self._counts.requests
+        return max(0.0, (requests - self._k * self._counts.accepts) / (requests + 1))
+
+    def throttle_probability(self):
+        """Get the current probability of rejecting a call"""
+        with self._lock:
+            self._counts.refresh()
+            return self._get_rejection_probability()
+
+    def _admit(self):
+        """Count a request and decide whether to send it"""
+        with self._lock:
+            probability = self._get_rejection_probability()
+            self._counts.add_request()
+        self._probability_gauge.set(probability)
+        return random.random() >= probability
+
+    def _record_outcome(self, call):
+        """Count the call as accepted unless the server rejected it"""
+        if not call.cancelled():
+            exception = call.exception()
+            if (
+                isinstance(exception, grpc.RpcError)
+                and hasattr(exception, "code")
+                and exception.code() in self._rejection_codes
+            ):
+                return
+        with self._lock:
+            self._counts.add_accept()
+
+    class Throttler(object):
+        """Decorator that rejects calls locally with the middleware's throttle probability"""
+
+        def __init__(self, middleware, throttled_counter):
+            """Initializes with the middleware and the bound counter"""
+            self._middleware = middleware
+            self._throttled_counter = throttled_counter
+
+        def __call__(self, fn):
+            """Wrap a method with the throttler"""
+
+            @functools.wraps(fn)
+            def wrap(client_call_details, request):
+                """Inner wrapper"""
+                if not self._middleware._admit():
+                    self._throttled_counter.inc()
+                    return RejectedCall(
+                        grpc.StatusCode.RESOURCE_EXHAUSTED, "Throttled by the client"
+                    )
+                call = fn(client_call_details, request)
+                call.add_done_callback(self._middleware._record_outcome)
+                return call
+
+            return wrap
+
+    def get_decorator(self, method_name, _):
+        """Return decorator that throttles the calls of the method"""
+        service_label, endpoint_label = get_service_and_method_from_url(method_name)
+        return self.Throttler(
+            self,
+            CLIENTSIDE_THROTTLED_COUNTER.labels(
+                self.client_label, self.server_label, service_label, endpoint_label
+            ),
+        )
+
+
+class ClientDeadlineMiddleware(GRPCClientMiddleware):
+    """Apply default deadlines and propagate the inbound deadline of the current server call.
+
+    A call made without an explicit timeout gets the per-method default timeout, falling back to
+    default_timeout. If the call is made inside a server handler whose RPC has a deadline, the
+    timeout is capped at the inbound time remaining minus propagation_margin, so that downstream
+    work that cannot be useful anymore is not started.
+    """
+
+    metadata_dependent = False
+
+    def __init__(
+        self,
+        client_label,
+        server_label,
+        default_timeout=None,
+        method_timeouts=None,
+        propagation_margin=None,
+        service_config=None,
+    ):
+        """Initialize
+
+        Args:
+            client_label: client label
+            server_label: server label
+            default_timeout: optional timeout in seconds for calls without an explicit timeout
+            method_timeouts: optional dict of method name (e.g. "GetThing") to timeout in seconds,
+                             overriding default_timeout
+            propagation_margin: optional safety margin in seconds subtracted from the inbound
+                                time remaining. Set to None to disable deadline propagation.
+            service_config: optional gRPC service config (JSON string or dict) of the channel.
+                            default_timeout does not apply to methods it gives a timeout
+        """
+        super(ClientDeadlineMiddleware, self).__init__(
+            client_label, server_label, GRPCClientGeneralInterceptor
+        )
+        self._default_timeout = default_timeout
+        self._method_timeouts = dict(method_timeouts or {})
+        self._propagation_margin = propagation_margin
+        self._method_configs = MethodConfigMatcher(service_config)
+
+    class DeadlineSetter(object):
+        """Decorator that sets the timeout of the call"""
+
+        def __init__(self, default_timeout, propagation_margin):
+            """Initializes with the default timeout and the propagation margin"""
+            self._default_timeout = default_timeout
+            self._propagation_margin = propagation_margin
+
+        def _get_inbound_timeout(self):
+            """Get the outbound timeout allowed by the inbound deadline, or None"""
+            if self._propagation_margin is None:
+                return None
+            servicer_context = get_current_servicer_context()
+            if servicer_context is None:
+                return None
+            time_remaining = servicer_context.time_remaining()
+            if time_remaining is None or time_remaining > NO_DEADLINE_THRESHOLD_SECONDS:
+                return None
+            # A zero timeout makes the call fail right away with DEADLINE_EXCEEDED
+            return max(time_remaining - self._propagation_margin, 0)
+
+        def __call__(self, fn):
+            """Wrap a method with the deadline setter"""
+
+            @functools.wraps(fn)
+            def wrap(client_call_details, request):
+                """Inner wrapper"""
+                timeout = client_call_details.timeout
+                if timeout is None:
+                    timeout = self._default_timeout
+                inbound_timeout = self._get_inbound_timeout()
+                if inbound_timeout is not None and (timeout is None or inbound_timeout < timeout):
+                    timeout = inbound_timeout
+                if timeout != client_call_details.timeout:
+                    client_call_details = _replace_client_call_details(
+                        client_call_details, timeout=timeout
+                    )
+                return fn(client_call_details, request)
+
+            return wrap
+
+    def get_decorator(self, method_name, _):
+        """Return decorator that sets the timeout for the method"""
+        _, endpoint_label = get_service_and_method_from_url(method_name)
+        if endpoint_label in self._method_timeouts:
+            default_timeout = self._method_timeouts[endpoint_label]
+        elif self._method_configs.covers_timeout(method_name):
+            default_timeout = None
+        else:
+            default_timeout = self._default_timeout
+        if default_timeout is None and self._propagation_margin is None:
+            return None
+        return self.DeadlineSetter(default_timeout, self._propagation_margin)
+
+
+class ClientCompressionMiddleware(GRPCClientMiddleware):
+    """Compress large requests according to per-method size-threshold policies.
+
+    The decision is made for every call from the serialized size of the request, so small calls
+    never pay for compression. Calls made with an explicit compression argument and calls with
+    streaming requests, whose size is not known upfront, are left alone.
+
+    grpc does not expose the size of compressed messages, so a random sample of the compressed
+    requests is compressed once more with zlib to count the bytes before and after compression.
+    """
+
+    metadata_dependent = False
+
+    def __init__(
+        self,
+        client_label,
+        server_label,
+        default_policy=None,
+        method_policies=None,
+        sample_rate=DEFAULT_COMPRESSION_SAMPLE_RATE,
+    ):
+        """Initialize
+
+        Args:
+            client_label: client label
+            server_label: server label
+            default_policy: optional CompressionPolicy for all methods
+            method_policies: optional dict of method name (e.g. "GetThing") to CompressionPolicy,
+                             overriding default_policy. None disables compression for the method
+            sample_rate: fraction of compressed requests whose compressed size is measured
+        """
+        super(ClientCompressionMiddleware, self).__init__(
+            client_label, server_label, GRPCClientGeneralInterceptor
+        )
+        for policy in [default_policy] + list((method_policies or {}).values()):
+            if policy is not None and policy.algorithm not in _ZLIB_WBITS:
+                raise ValueError("Unsupported compression algorithm {}".format(policy.algorithm))
+        self._default_policy = default_policy
+        self._method_policies = dict(method_policies or {})
+        self._sample_rate = sample_rate
+
+    class Compressor(object):
+        """Decorator that sets the compression of calls with large requests"""
+
+        def __init__(self, policy, sample_rate, labels):
+            """Initializes with the policy and the metric labels of the method"""
+            self._policy = policy
+            self._sample_rate = sample_rate
+            self._labels = labels
+            self._uncompressed_bytes = CLIENTSIDE_REQUEST_BYTES_COUNTER.labels(*labels, "identity")
+            self._compressed_bytes = CLIENTSIDE_REQUEST_BYTES_COUNTER.labels(
+                *labels, policy.algorithm.name.lower()
+            )
+
+        def _sample_compression(self, request):
+            """Count the size of a request before and after compressing it"""
+            compression_label = self._policy.algorithm.name.lower()
+            serialized_request = request.SerializeToString()
+            compressor = zlib.compressobj(wbits=_ZLIB_WBITS[self._policy.algorithm])
+            compressed_size = len(compressor.compress(serialized_request) + compressor.flush())
+            CLIENTSIDE_COMPRESSION_SAMPLE_BYTES_COUNTER.labels(
+                *self._labels, compression_label, "before"
+            ).inc(len(serialized_request))
+            CLIENTSIDE_COMPRESSION_SAMPLE_BYTES_COUNTER.labels(
+                *self._labels, compression_label, "after"
+            ).inc(compressed_size)
+
+        def __call__(self, fn):
+            """Wrap a method with the compression policy"""
+
+            @functools.wraps(fn)
+            def wrap(client_call_details, request):
+                """Inner wrapper"""
+                if getattr(client_call_details, "compression", None) is not None or not hasattr(
+                    request, "ByteSize"
+                ):
+                    return fn(client_call_details, request)
+
+                request_size = request.ByteSize()
+                if request_size < self._policy.threshold_bytes:
+                    self._uncompressed_bytes.inc(request_size)
+                    return fn(client_call_details, request)
+
+                self._compressed_bytes.inc(request_size)
+                if random.random() < self._sample_rate:
+                    self._sample_compression(request)
+                client_call_details = _replace_client_call_details(
+                    client_call_details, compression=self._policy.algorithm
+                )
+                return fn(client_call_details, request)
+
+            return wrap
+
+    def get_decorator(self, method_name, _):
+        """Return decorator applying the compression policy of the method"""
+        service_label, endpoint_label = get_service_and_method_from_url(method_name)
+        policy = self._method_policies.get(endpoint_label, self._default_policy)
+        if policy is None:
+            return None
+        labels = (self.client_label, self.server_label, service_label, endpoint_label)
+        return self.Compressor(policy, self._sample_rate, labels)
+
+
+def translate_grpc_exception(code_to_exception_class_func, exc):
+    """Get the exception to raise in place of exc, translating with code_to_exception_class_func"""
     code = None
     details = "[]"  # Details are expected to be jsondeserializable
 
     if exc.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
-        raise TimeoutError()
+        return TimeoutError()
     elif exc.code() == grpc.StatusCode.UNIMPLEMENTED:
-        raise NotImplementedError()
+        return NotImplementedError()
     elif exc.code() == grpc.StatusCode.UNAVAILABLE:
-        raise ConnectionRefusedError()
+        return ConnectionRefusedError()
 
-    for key, value in exc.trailing_metadata():
+    for key, value in exc.trailing_metadata() or ():
         if key == "error_code":
             try:
                 code = int(value)
@@ -345,8 +1179,13 @@ def raise_exception_from_grpc_exception(code_to_exception_class_func, exc):
 
         if exception_class:
             exception_args = json.loads(details)
-            raise exception_class(*exception_args)
-    raise exc
+            return exception_class(*exception_args)
+    return exc
+
+
+def raise_exception_from_grpc_exception(code_to_exception_class_func, exc):
+    """Raise exception from exc, translating with code_to_exception_class_func"""
+    raise translate_grpc_exception(code_to_exception_class_func, exc)
 
 
 def _get_metadata_map_from_client_details(client_call_details):
@@ -1,8 +1,23 @@
 # Copyright 2020-present Kensho Technologies, LLC.
+from timeit import default_timer
+
 from grpc_opentracing import ActiveSpanSource, open_tracing_client_interceptor
-from grpc_opentracing.grpcext import intercept_channel
+from grpc_opentracing.grpcext import (
+    StreamClientInterceptor,
+    UnaryClientInterceptor,
+    intercept_channel,
+)
 import opentracing
 from opentracing_instrumentation.request_context import get_current_span
+import prometheus_client
+
+
+CLIENTSIDE_TRACING_OVERHEAD_HISTO = prometheus_client.Histogram(
+    "clientside_grpc_tracing_overhead",
+    "Time spent by client tracing per call, excluding the call itself",
+    labelnames=("sampled",),
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01),
+)
 
 
 class RequestContextSpanSource(ActiveSpanSource):
@@ -17,14 +32,123 @@ class RequestContextSpanSource(ActiveSpanSource):
         return get_current_span()
 
 
-def wrap_grpc_client_channel(channel):
-    """Wraps a GRPC channel with tracing, given a global tracer has been registered"""
+def is_call_sampled(tracer, active_span):
+    """Default sampling decision for a client call
+
+    A call is not traced if the tracer is the no-op tracer or if the active span reports that it
+    is not sampled (as jaeger spans do with is_sampled()). Otherwise the tracer decides as usual.
+
+    Args:
+        tracer: opentracing tracer
+        active_span: active span of the request context, or None
+
+    Returns:
+        whether the call should be traced
+    """
+    if type(tracer) is opentracing.Tracer:
+        return False
+    if active_span is None:
+        return True
+    is_sampled = getattr(active_span, "is_sampled", None)
+    if callable(is_sampled):
+        return bool(is_sampled())
+    return True
+
+
+class _TimedInvoker(object):
+    """Invoker recording the time spent inside it"""
+
+    def __init__(self, invoker):
+        """Initialize with the invoker to time"""
+        self._invoker = invoker
+        self.elapsed = 0.0
+
+    def __call__(self, request_or_iterator, metadata):
+        """Invoke and time"""
+        started_at = default_timer()
+        try:
+            return self._invoker(request_or_iterator, metadata)
+        finally:
+            self.elapsed += default_timer() - started_at
+
+
+class SamplingAwareClientInterceptor(UnaryClientInterceptor, StreamClientInterceptor):
+    """Opentracing client interceptor that skips tracing of unsampled calls
+
+    Unsampled calls are invoked directly, without creating a span or injecting the span context
+    into the metadata. Note that the server then receives no trace headers for these calls.
+    """
+
+    def __init__(self, tracer, active_span_source, sampling_predicate=None):
+        """Initialize
+
+        Args:
+            tracer: opentracing tracer
+            active_span_source: ActiveSpanSource of the parent spans
+            sampling_predicate: optional function taking the tracer and the active span (or None)
+                                and returning whether the call should be traced. is_call_sampled
+                                by default
+        """
+        self._tracer = tracer
+        self._active_span_source = active_span_source
+        self._sampling_predicate = sampling_predicate or is_call_sampled
+        self._tracing_interceptor = open_tracing_client_interceptor(
+            tracer, active_span_source=active_span_source
+        )
+        self._unsampled_overhead = CLIENTSIDE_TRACING_OVERHEAD_HISTO.labels("false")
+        self._sampled_overhead = CLIENTSIDE_TRACING_OVERHEAD_HISTO.labels("true")
+
+    def _intercept(
+        self, intercept_method_name, request_or_iterator, metadata, client_info, invoker
+    ):
+        """Trace the call if it is sampled, recording the tracing overhead"""
+        started_at = default_timer()
+        active_span = self._active_span_source.get_active_span()
+        if not self._sampling_predicate(self._tracer, active_span):
+            self._unsampled_overhead.observe(default_timer() - started_at)
+            return invoker(request_or_iterator, metadata)
+
+        timed_invoker = _TimedInvoker(invoker)
+        try:
+            # Responses of server-streaming calls are traced lazily, while they are consumed,
+            # so only the time spent starting the call is counted for them
+            return getattr(self._tracing_interceptor, intercept_method_name)(
+                request_or_iterator, metadata, client_info, timed_invoker
+            )
+        finally:
+            self._sampled_overhead.observe(default_timer() - started_at - timed_invoker.elapsed)
+
+    def intercept_unary(self, request, metadata, client_info, invoker):
+        """Intercept unary-unary"""
+        return self._intercept("intercept_unary", request, metadata, client_info, invoker)
+
+    def intercept_stream(self, request_or_iterator, metadata, client_info, invoker):
+        """Intercept the other kinds of calls"""
+        return self._intercept(
+            "intercept_stream", request_or_iterator, metadata, client_info, invoker
+        )
+
+
+def wrap_grpc_client_channel(channel, sampling_predicate=None):
+    """Wraps a GRPC channel with tracing, given a global tracer has been registered
+
+    Args:
+        channel: grpc channel
+        sampling_predicate: optional function taking the tracer and the active span (or None)
+                            and returning whether a call should be traced. is_call_sampled by
+                            default
+
+    Returns:
+        the traced channel
+    """
     if not opentracing.is_global_tracer_registered():
         raise Exception(
             "Global tracer has not been registered. Disable tracing or " "register a global tracer"
         )
 
-    interceptor = open_tracing_client_interceptor(
-        opentracing.global_tracer(), active_span_source=RequestContextSpanSource()
+    interceptor = SamplingAwareClientInterceptor(
+        opentracing.global_tracer(),
+        RequestContextSpanSource(),
+        sampling_predicate=sampling_predicate,
     )
     return intercept_channel(channel, interceptor)
@@ -0,0 +1,81 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""Issuing many unary calls in parallel with bounded concurrency"""
+import queue
+
+import grpc
+
+from eagr.client.client_side_middleware import raise_exception_from_grpc_exception
+
+
+DEFAULT_MAX_IN_FLIGHT = 64
+
+
+def _get_response(call, code_to_exception_class_func):
+    """Get the response of a completed call, translating grpc errors"""
+    try:
+        return call.result()
+    except grpc.RpcError as exc:
+        raise_exception_from_grpc_exception(code_to_exception_class_func, exc)
+
+
+def map_unordered(
+    method,
+    requests,
+    max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+    timeout=None,
+    metadata=None,
+    code_to_exception_class_func=None,
+):
+    """Call a unary-response method for every request and yield the responses as they complete.
+
+    Requests are pulled lazily from the iterable so that at most max_in_flight calls are
+    outstanding at any time. The calls are issued with method.future, so no thread is held per
+    outstanding call. If a call fails, its exception is raised from the generator and the calls
+    still in flight are cancelled; the same happens when the generator is closed early.
+
+    Sample usage:
+
+        client = make_grpc_client("group", "things", address, ThingServiceStub)
+        requests = (GetThingRequest(id=thing_id) for thing_id in thing_ids)
+        for thing in map_unordered(client.GetThing, requests, max_in_flight=32, timeout=5):
+            ...
+
+    Args:
+        method: unary-unary or stream-unary grpc method, e.g. stub.GetThing
+        requests: iterable of requests
+        max_in_flight: maximum number of outstanding calls
+        timeout: optional timeout in seconds for every call
+        metadata: optional metadata sent with every call
+        code_to_exception_class_func: optional function for translating error codes to exceptions
+
+    Yields:
+        responses in completion order
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be positive, got {}".format(max_in_flight))
+
+    completed_calls = queue.Queue()
+    in_flight = set()
+    request_iterator = iter(requests)
+    requests_exhausted = False
+    try:
+        while True:
+            while not requests_exhausted and len(in_flight) < max_in_flight:
+                try:
+                    request = next(request_iterator)
+                except StopIteration:
+                    requests_exhausted = True
+                    break
+                call = method.future(request, timeout=timeout, metadata=metadata)
+                in_flight.add(call)
+                call.add_done_callback(lambda _, call=call: completed_calls.put(call))
+
+            if not in_flight:
+                return
+
+            call = completed_calls.get()
+            in_flight.discard(call)
+            yield _get_response(call, code_to_exception_class_func)
+    finally:
+        for call in in_flight:
+            call.cancel()
@@ -0,0 +1,191 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""Calling servicers that live in the same process without going through the network"""
+from concurrent import futures
+
+import grpc
+
+from eagr.client.call_futures import LocalCall, RejectedCall
+from eagr.server.local_dispatch import LocalDispatcher, LocalServicerContext
+
+
+DEFAULT_IN_PROCESS_WORKERS = 10
+
+
+class _InProcessUnaryUnaryMultiCallable(grpc.UnaryUnaryMultiCallable):
+    """Multicallable dispatching the calls of a unary method to the in-process servicers"""
+
+    def __init__(self, channel, method, request_serializer, response_deserializer):
+        """Capture the channel, the method and its serialization functions"""
+        self._channel = channel
+        self._method = method
+        self._request_serializer = request_serializer
+        self._response_deserializer = response_deserializer
+
+    def _new_call(self, timeout):
+        """Make the call object of a call"""
+        response_deserializer = (
+            None if self._channel.skip_serialization else self._response_deserializer
+        )
+        return LocalCall(response_deserializer, None, timeout)
+
+    def _run(self, call, request, timeout, metadata):
+        """Dispatch the call to the servicer and complete the call object with its outcome"""
+        context = LocalServicerContext(metadata or (), timeout=timeout, peer="in-process")
+        if self._channel.skip_serialization:
+            outcome = self._channel.dispatcher.dispatch(self._method, request, context)
+        else:
+            if self._request_serializer is not None:
+                request = self._request_serializer(request)
+            outcome = self._channel.dispatcher.dispatch(
+                self._method, request, context, serialized=True
+            )
+
+        code, details = outcome.code, outcome.details
+        # Handlers cannot be interrupted, so the deadline is enforced when they return
+        if code is grpc.StatusCode.OK and context.time_remaining() == 0:
+            code, details = grpc.StatusCode.DEADLINE_EXCEEDED, "Deadline Exceeded"
+        call._complete(code, details, outcome.response, outcome.trailing_metadata or ())
+
+    def future(self, request, timeout=None, metadata=None, **kwargs):
+        """Dispatch the call on the channel's thread pool, returning its LocalCall"""
+        call = self._new_call(timeout)
+        self._channel.thread_pool.submit(self._run, call, request, timeout, metadata)
+        return call
+
+    def with_call(self, request, timeout=None, metadata=None, **kwargs):
+        """Dispatch the call on the calling thread, returning the response with the call"""
+        call = self._new_call(timeout)
+        self._run(call, request, timeout, metadata)
+        return call.result(), call
+
+    def __call__(self, request, timeout=None, metadata=None, **kwargs):
+        """Dispatch the call on the calling thread, returning the response"""
+        return self.with_call(request, timeout=timeout, metadata=metadata)[0]
+
+
+class _UnsupportedMultiCallable(
+    grpc.UnaryStreamMultiCallable, grpc.StreamUnaryMultiCallable, grpc.StreamStreamMultiCallable
+):
+    """Multicallable failing the calls of methods that cannot be dispatched in-process"""
+
+    def __init__(self, method):
+        """Capture the method"""
+        self._method = method
+
+    def _reject(self):
+        """Make the failed call"""
+        return RejectedCall(
+            grpc.StatusCode.UNIMPLEMENTED,
+            "Only unary-unary methods can be dispatched in-process: {}".format(self._method),
+        )
+
+    def future(self, *args, **kwargs):
+        """Return the failed call"""
+        return self._reject()
+
+    def with_call(self, *args, **kwargs):
+        """Raise the failed call"""
+        raise self._reject()
+
+    def __call__(self, *args, **kwargs):
+        """Return the failed call, which raises when its responses are read"""
+        return self._reject()
+
+
+class InProcessChannel(grpc.Channel):
+    """A grpc channel dispatching unary-unary calls to servicers living in the same process.
+
+    Calls skip HTTP/2 entirely: the server middlewares are applied and the servicer method is
+    called on the calling thread for blocking calls, and on the channel's thread pool for futures.
+    Handlers cannot be interrupted, so a call that outlives its deadline fails with
+    DEADLINE_EXCEEDED once its handler returns. Calls of the other kinds, and of the methods the
+    servers do not serve, go through the fallback channel if there is one, and fail with
+    UNIMPLEMENTED otherwise.
+    """
+
+    def __init__(
+        self,
+        servers,
+        middlewares=None,
+        skip_serialization=False,
+        fallback_channel=None,
+        thread_pool=None,
+    ):
+        """Initialize
+
+        Args:
+            servers: iterable of GRPCBase instances to dispatch the calls to
+            middlewares: optional list of GRPCMiddleware objects applied on the server side
+            skip_serialization: boolean, set to hand the request and response objects over as they
+            are instead of serializing and deserializing them. Callers and servicers then share
+            the messages, so neither side may modify them afterwards
+            fallback_channel: optional grpc channel for the calls that cannot be dispatched
+            in-process
+            thread_pool: optional executor running the handlers of futures. By default a thread
+            pool of DEFAULT_IN_PROCESS_WORKERS threads is created and shut down with the channel
+        """
+        self.dispatcher = LocalDispatcher(servers, middlewares=middlewares)
+        self.skip_serialization = skip_serialization
+        self._fallback_channel = fallback_channel
+        self._owns_thread_pool = thread_pool is None
+        self.thread_pool = thread_pool or futures.ThreadPoolExecutor(
+            max_workers=DEFAULT_IN_PROCESS_WORKERS, thread_name_prefix="InProcessDispatch"
+        )
+
+    def unary_unary(
+        self, method, request_serializer=None, response_deserializer=None, *args, **kwargs
+    ):
+        """Create a multicallable dispatching its calls in-process, if the servers serve it"""
+        if self._fallback_channel is not None and not self.dispatcher.has_method(method):
+            return self._fallback_channel.unary_unary(
+                method, request_serializer, response_deserializer, *args, **kwargs
+            )
+        return _InProcessUnaryUnaryMultiCallable(
+            self, method, request_serializer, response_deserializer
+        )
+
+    def _other_kind(self, kind, method, *args, **kwargs):
+        """Create a multicallable of the fallback channel, or one failing the calls"""
+        if self._fallback_channel is None:
+            return _UnsupportedMultiCallable(method)
+        return getattr(self._fallback_channel, kind)(method, *args, **kwargs)
+
+    def unary_stream(self, method, *args, **kwargs):
+        """Create a unary-stream multicallable"""
+        return self._other_kind("unary_stream", method, *args, **kwargs)
+
+    def stream_unary(self, method, *args, **kwargs):
+        """Create a stream-unary multicallable"""
+        return self._other_kind("stream_unary", method, *args, **kwargs)
+
+    def stream_stream(self, method, *args, **kwargs):
+        """Create a stream-stream multicallable"""
+        return self._other_kind("stream_stream", method, *args, **kwargs)
+
+    def subscribe(self, callback, try_to_connect=False):
+        """Subscribe to the connectivity of the fallback channel. Without one, always ready"""
+        if self._fallback_channel is None:
+            callback(grpc.ChannelConnectivity.READY)
+        else:
+            self._fallback_channel.subscribe(callback, try_to_connect=try_to_connect)
+
+    def unsubscribe(self, callback):
+        """Unsubscribe from the connectivity of the fallback channel"""
+        if self._fallback_channel is not None:
+            self._fallback_channel.unsubscribe(callback)
+
+    def close(self):
+        """Close the fallback channel and the thread pool if the channel created it"""
+        if self._owns_thread_pool:
+            self.thread_pool.shutdown(wait=False)
+        if self._fallback_channel is not None:
+            self._fallback_channel.close()
+
+    def __enter__(self):
+        """Enter the runtime context"""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Close the channel when leaving the runtime context"""
+        self.close()
+        return False
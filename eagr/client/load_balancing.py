@@ -0,0 +1,505 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""Latency-aware client-side load balancing across multiple targets
+
+The balancer keeps one channel per endpoint and picks the endpoint of every call with the
+"power of two choices" rule: two random endpoints are compared and the one with the lower
+(in-flight calls + 1) * EWMA latency * (1 + failure_penalty * EWMA error rate) score wins. Unlike
+round_robin this shifts traffic away from slow, overloaded or failing replicas. Only successful
+calls feed the latency average, so that an endpoint failing fast does not look fast.
+"""
+import collections
+import logging
+import random
+import socket
+import threading
+import time
+
+import grpc
+import prometheus_client
+
+from eagr.client.call_futures import RejectedCall
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EWMA_WEIGHT = 0.2
+# An endpoint failing every call scores like one (1 + DEFAULT_FAILURE_PENALTY) times slower
+DEFAULT_FAILURE_PENALTY = 10.0
+DNS_PREFIX = "dns:///"
+
+ENDPOINT_IN_FLIGHT_GAUGE = prometheus_client.Gauge(
+    "clientside_grpc_endpoint_in_flight",
+    "Number of in-flight calls per balanced endpoint",
+    labelnames=("client_name", "server_name", "target"),
+)
+ENDPOINT_LATENCY_GAUGE = prometheus_client.Gauge(
+    "clientside_grpc_endpoint_latency_ewma_seconds",
+    "Exponentially weighted moving average of the call latency per balanced endpoint",
+    labelnames=("client_name", "server_name", "target"),
+)
+
+EndpointStats = collections.namedtuple(
+    "EndpointStats", ("in_flight", "ewma_latency_seconds", "calls", "errors")
+)
+
+# Attribute of the stub holding the balancing channel
+LATENCY_AWARE_CHANNEL_ATTRIBUTE = "_latency_aware_channel"
+
+# Connectivity states from best to worst; the balancing channel is in the best state of its
+# endpoint channels
+_CONNECTIVITY_PREFERENCE = (
+    grpc.ChannelConnectivity.READY,
+    grpc.ChannelConnectivity.CONNECTING,
+    grpc.ChannelConnectivity.IDLE,
+    grpc.ChannelConnectivity.TRANSIENT_FAILURE,
+    grpc.ChannelConnectivity.SHUTDOWN,
+)
+
+
+def resolve_endpoints(target):
+    """Resolve a host:port target into a sorted list of ip:port endpoints"""
+    if target.startswith(DNS_PREFIX):
+        target = target[len(DNS_PREFIX) :]
+    host, _, port = target.rpartition(":")
+    host = host.strip("[]")
+    endpoints = set()
+    for family, _, _, _, sockaddr in socket.getaddrinfo(host, int(port), type=socket.SOCK_STREAM):
+        address = sockaddr[0]
+        if family == socket.AF_INET6:
+            address = "[{}]".format(address)
+        endpoints.add("{}:{}".format(address, port))
+    return sorted(endpoints)
+
+
+def get_endpoint_stats(stub):
+    """Get a dict of endpoint to EndpointStats for a stub created with load balancing"""
+    channel = getattr(stub, LATENCY_AWARE_CHANNEL_ATTRIBUTE, None)
+    if channel is None:
+        raise ValueError("Stub was not created with latency-aware load balancing")
+    return channel.endpoint_stats()
+
+
+class _Endpoint(object):
+    """Channel and call statistics of a single endpoint"""
+
+    def __init__(self, target, channel, in_flight_gauge, latency_gauge):
+        """Initialize with the endpoint's channel and bound metric children"""
+        self.target = target
+        self.channel = channel
+        self.in_flight = 0
+        self.ewma_latency = None
+        self.ewma_error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.removed = False
+        self.in_flight_gauge = in_flight_gauge
+        self.latency_gauge = latency_gauge
+        self._multicallables = {}
+
+    def get_multicallable(self, kind, method, args, kwargs):
+        """Get (and cache) the multicallable of the endpoint's channel for a method"""
+        key = (kind, method)
+        multicallable = self._multicallables.get(key)
+        if multicallable is None:
+            multicallable = getattr(self.channel, kind)(method, *args, **kwargs)
+            self._multicallables[key] = multicallable
+        return multicallable
+
+
+class _ConnectivitySubscription(object):
+    """Subscription to the aggregate connectivity state of the endpoint channels"""
+
+    def __init__(self, callback, try_to_connect):
+        """Initialize with the subscriber's callback"""
+        self.callback = callback
+        self.try_to_connect = try_to_connect
+        self._lock = threading.Lock()
+        self._endpoint_states = {}
+        self._endpoint_callbacks = {}
+        self._state = None
+
+    def subscribe_endpoint(self, endpoint):
+        """Start following the connectivity of an endpoint channel"""
+
+        def on_endpoint_state_change(state):
+            """Record the endpoint's state"""
+            self._update(endpoint.target, state)
+
+        self._endpoint_callbacks[endpoint.target] = on_endpoint_state_change
+        endpoint.channel.subscribe(on_endpoint_state_change, try_to_connect=self.try_to_connect)
+
+    def unsubscribe_endpoint(self, endpoint):
+        """Stop following the connectivity of an endpoint channel"""
+        callback = self._endpoint_callbacks.pop(endpoint.target, None)
+        if callback is not None:
+            endpoint.channel.unsubscribe(callback)
+        self._update(endpoint.target, None)
+
+    def _update(self, target, state):
+        """Update the state of an endpoint and notify the subscriber if the aggregate changed"""
+        with self._lock:
+            if state is None:
+                self._endpoint_states.pop(target, None)
+            else:
+                self._endpoint_states[target] = state
+            if not self._endpoint_states:
+                return
+            aggregate_state = min(
+                self._endpoint_states.values(), key=_CONNECTIVITY_PREFERENCE.index
+            )
+            if aggregate_state is self._state:
+                return
+            self._state = aggregate_state
+        self.callback(aggregate_state)
+
+
+class LatencyAwareChannel(grpc.Channel):
+    """A grpc channel balancing calls across endpoints by in-flight count and latency"""
+
+    def __init__(
+        self,
+        channel_factory,
+        client_label,
+        server_label,
+        endpoints=None,
+        dns_target=None,
+        dns_refresh_interval=None,
+        ewma_weight=DEFAULT_EWMA_WEIGHT,
+        failure_penalty=DEFAULT_FAILURE_PENALTY,
+    ):
+        """Initialize
+
+        Args:
+            channel_factory: function creating a grpc channel for an ip:port or host:port target
+            client_label: client label for metrics
+            server_label: server label for metrics
+            endpoints: optional list of host:port endpoints to balance across
+            dns_target: optional host:port name that is resolved into the endpoints
+            dns_refresh_interval: optional interval in seconds at which dns_target is re-resolved
+            ewma_weight: weight of the newest sample in the moving averages of latency and errors
+            failure_penalty: factor of the error rate by which failing endpoints are penalized
+        """
+        if (endpoints is None) == (dns_target is None):
+            raise ValueError("Exactly one of endpoints and dns_target must be given")
+
+        self._channel_factory = channel_factory
+        self._client_label = client_label
+        self._server_label = server_label
+        self._ewma_weight = ewma_weight
+        self._failure_penalty = failure_penalty
+        self._lock = threading.Lock()
+        self._endpoints = []
+        self._subscriptions = []
+        self._closed = threading.Event()
+
+        if dns_target is not None:
+            endpoints = resolve_endpoints(dns_target)
+        if not endpoints:
+            raise ValueError("No endpoints to balance across")
+        self._set_endpoints(endpoints)
+
+        self._refresh_thread = None
+        if dns_target is not None and dns_refresh_interval:
+            self._refresh_thread = threading.Thread(
+                target=self._refresh_loop,
+                args=(dns_target, dns_refresh_interval),
+                name="LatencyAwareChannelDNS",
+                daemon=True,
+            )
+            self._refresh_thread.start()
+
+    def _make_endpoint(self, target):
+        """Create the channel and metric children for a new endpoint"""
+        labels = (self._client_label, self._server_label, target)
+        return _Endpoint(
+            target,
+            self._channel_factory(target),
+            ENDPOINT_IN_FLIGHT_GAUGE.labels(*labels),
+            ENDPOINT_LATENCY_GAUGE.labels(*labels),
+        )
+
+    def _set_endpoints(self, targets):
+        """Replace the set of endpoints, keeping the state of the ones that remain"""
+        targets = set(targets)
+        if not targets:
+            return
+        with self._lock:
+            current = {endpoint.target: endpoint for endpoint in self._endpoints}
+            removed = [endpoint for endpoint in self._endpoints if endpoint.target not in targets]
+            added = [self._make_endpoint(target) for target in sorted(targets - set(current))]
+            self._endpoints = [current[target] for target in current if target in targets] + added
+            # Seed new endpoints with the average latency so they are neither shunned nor flooded
+            known_latencies = [
+                endpoint.ewma_latency
+                for endpoint in self._endpoints
+                if endpoint.ewma_latency is not None
+            ]
+            if known_latencies:
+                for endpoint in added:
+                    endpoint.ewma_latency = sum(known_latencies) / len(known_latencies)
+            for endpoint in removed:
+                endpoint.removed = True
+            idle_removed = [endpoint for endpoint in removed if endpoint.in_flight == 0]
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            for endpoint in added:
+                subscription.subscribe_endpoint(endpoint)
+            for endpoint in removed:
+                subscription.unsubscribe_endpoint(endpoint)
+        for endpoint in idle_removed:
+            self._retire_endpoint(endpoint)
+        if added or removed:
+            logger.info("Balancing %s across %s", self._server_label, sorted(targets))
+
+    def _retire_endpoint(self, endpoint):
+        """Close the channel of a removed endpoint and drop its metrics"""
+        endpoint.channel.close()
+        labels = (self._client_label, self._server_label, endpoint.target)
+        ENDPOINT_IN_FLIGHT_GAUGE.remove(*labels)
+        ENDPOINT_LATENCY_GAUGE.remove(*labels)
+
+    def _refresh_loop(self, dns_target, dns_refresh_interval):
+        """Periodically re-resolve the dns target"""
+        while not self._closed.wait(dns_refresh_interval):
+            try:
+                targets = resolve_endpoints(dns_target)
+            except (OSError, ValueError) as exc:
+                logger.warning("Could not resolve %s: %r", dns_target, exc)
+                continue
+            if targets:
+                self._set_endpoints(targets)
+            else:
+                logger.warning("Resolving %s returned no endpoints", dns_target)
+
+    def _latency_prior(self):
+        """Latency assumed for endpoints without samples: the mean latency of the others
+
+        Must be called with the lock held.
+        """
+        known_latencies = [
+            endpoint.ewma_latency
+            for endpoint in self._endpoints
+            if endpoint.ewma_latency is not None
+        ]
+        if not known_latencies:
+            # Only in-flight counts tell the endpoints apart
+            return 1.0
+        return sum(known_latencies) / len(known_latencies)
+
+    def _score(self, endpoint, latency_prior):
+        """Score of an endpoint, lower is better"""
+        latency = endpoint.ewma_latency
+        if latency is None:
+            # An endpoint whose first calls hang must not look infinitely fast
+            latency = latency_prior
+        failure_factor = 1 + self._failure_penalty * endpoint.ewma_error_rate
+        return (endpoint.in_flight + 1) * latency * failure_factor
+
+    def _acquire(self):
+        """Pick an endpoint with power-of-two-choices and count a call in flight on it
+
+        Returns:
+            the endpoint, or None once the channel is closed
+        """
+        with self._lock:
+            if not self._endpoints:
+                return None
+            if len(self._endpoints) == 1:
+                endpoint = self._endpoints[0]
+            else:
+                first, second = random.sample(self._endpoints, 2)
+                latency_prior = None
+                if first.ewma_latency is None or second.ewma_latency is None:
+                    latency_prior = self._latency_prior()
+                first_score = self._score(first, latency_prior)
+                second_score = self._score(second, latency_prior)
+                endpoint = first if first_score <= second_score else second
+            endpoint.in_flight += 1
+            endpoint.calls += 1
+        endpoint.in_flight_gauge.inc()
+        return endpoint
+
+    def _release(self, endpoint, latency, failed):
+        """Record the end of a call on an endpoint"""
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.ewma_error_rate += self._ewma_weight * (failed - endpoint.ewma_error_rate)
+            if failed:
+                endpoint.errors += 1
+            elif endpoint.ewma_latency is None:
+                endpoint.ewma_latency = latency
+            else:
+                endpoint.ewma_latency += self._ewma_weight * (latency - endpoint.ewma_latency)
+            ewma_latency = endpoint.ewma_latency
+            retire = endpoint.removed and endpoint.in_flight == 0
+        endpoint.in_flight_gauge.dec()
+        if retire:
+            self._retire_endpoint(endpoint)
+        elif ewma_latency is not None:
+            endpoint.latency_gauge.set(ewma_latency)
+
+    def endpoint_stats(self):
+        """Get a dict of endpoint target to EndpointStats"""
+        with self._lock:
+            return {
+                endpoint.target: EndpointStats(
+                    endpoint.in_flight, endpoint.ewma_latency, endpoint.calls, endpoint.errors
+                )
+                for endpoint in self._endpoints
+            }
+
+    def subscribe(self, callback, try_to_connect=False):
+        """Subscribe to the connectivity of the channel
+
+        The channel is in the best connectivity state of its endpoint channels, e.g. it is ready
+        as soon as any endpoint is ready.
+        """
+        subscription = _ConnectivitySubscription(callback, try_to_connect)
+        with self._lock:
+            self._subscriptions.append(subscription)
+            endpoints = list(self._endpoints)
+        for endpoint in endpoints:
+            subscription.subscribe_endpoint(endpoint)
+
+    def unsubscribe(self, callback):
+        """Unsubscribe from the connectivity of the channel"""
+        with self._lock:
+            subscriptions = [
+                subscription
+                for subscription in self._subscriptions
+                if subscription.callback == callback
+            ]
+            self._subscriptions = [
+                subscription
+                for subscription in self._subscriptions
+                if subscription.callback != callback
+            ]
+            endpoints = list(self._endpoints)
+        for subscription in subscriptions:
+            for endpoint in endpoints:
+                subscription.unsubscribe_endpoint(endpoint)
+
+    def unary_unary(self, method, *args, **kwargs):
+        """Create a balanced unary-unary multicallable"""
+        return _BalancedUnaryResponseMultiCallable(self, "unary_unary", method, args, kwargs)
+
+    def unary_stream(self, method, *args, **kwargs):
+        """Create a balanced unary-stream multicallable"""
+        return _BalancedStreamResponseMultiCallable(self, "unary_stream", method, args, kwargs)
+
+    def stream_unary(self, method, *args, **kwargs):
+        """Create a balanced stream-unary multicallable"""
+        return _BalancedUnaryResponseMultiCallable(self, "stream_unary", method, args, kwargs)
+
+    def stream_stream(self, method, *args, **kwargs):
+        """Create a balanced stream-stream multicallable"""
+        return _BalancedStreamResponseMultiCallable(self, "stream_stream", method, args, kwargs)
+
+    def close(self):
+        """Stop refreshing endpoints and close all endpoint channels"""
+        self._closed.set()
+        with self._lock:
+            endpoints, self._endpoints = self._endpoints, []
+        for endpoint in endpoints:
+            endpoint.channel.close()
+
+    def __enter__(self):
+        """Enter the runtime context"""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Close the channel when leaving the runtime context"""
+        self.close()
+        return False
+
+
+class _BalancedMultiCallable(object):
+    """Multicallable that picks an endpoint for every call"""
+
+    def __init__(self, balancer, kind, method, args, kwargs):
+        """Capture the balancer and the arguments to create endpoint multicallables with"""
+        self._balancer = balancer
+        self._kind = kind
+        self._method = method
+        self._args = args
+        self._kwargs = kwargs
+
+    @staticmethod
+    def _reject():
+        """Make the failed call of a call made on the closed channel"""
+        return RejectedCall(grpc.StatusCode.UNAVAILABLE, "Channel is closed")
+
+    def _get_multicallable(self, endpoint):
+        """Get the endpoint's multicallable for this method"""
+        return endpoint.get_multicallable(self._kind, self._method, self._args, self._kwargs)
+
+    def _release_when_done(self, endpoint, started_at, call):
+        """Release the endpoint once the call completes"""
+
+        def on_done(done_call):
+            """Record the outcome of the call"""
+            failed = done_call.cancelled() or done_call.exception() is not None
+            self._balancer._release(endpoint, time.monotonic() - started_at, failed)
+
+        call.add_done_callback(on_done)
+        return call
+
+
+class _BalancedUnaryResponseMultiCallable(
+    _BalancedMultiCallable, grpc.UnaryUnaryMultiCallable, grpc.StreamUnaryMultiCallable
+):
+    """Balanced multicallable for methods with a unary response"""
+
+    def _invoke_blocking(self, invocation, request, kwargs):
+        """Invoke a blocking call on the picked endpoint"""
+        endpoint = self._balancer._acquire()
+        if endpoint is None:
+            raise self._reject()
+        started_at = time.monotonic()
+        failed = True
+        try:
+            result = getattr(self._get_multicallable(endpoint), invocation)(request, **kwargs)
+            failed = False
+            return result
+        finally:
+            self._balancer._release(endpoint, time.monotonic() - started_at, failed)
+
+    def __call__(self, request, **kwargs):
+        """Invoke the method synchronously"""
+        return self._invoke_blocking("__call__", request, kwargs)
+
+    def with_call(self, request, **kwargs):
+        """Invoke the method synchronously, returning the response and the call"""
+        return self._invoke_blocking("with_call", request, kwargs)
+
+    def future(self, request, **kwargs):
+        """Invoke the method asynchronously"""
+        endpoint = self._balancer._acquire()
+        if endpoint is None:
+            return self._reject()
+        started_at = time.monotonic()
+        try:
+            call = self._get_multicallable(endpoint).future(request, **kwargs)
+        except Exception:
+            self._balancer._release(endpoint, time.monotonic() - started_at, True)
+            raise
+        return self._release_when_done(endpoint, started_at, call)
+
+
+class _BalancedStreamResponseMultiCallable(
+    _BalancedMultiCallable, grpc.UnaryStreamMultiCallable, grpc.StreamStreamMultiCallable
+):
+    """Balanced multicallable for methods with a streaming response"""
+
+    def __call__(self, request_or_iterator, **kwargs):
+        """Invoke the method, returning the response iterator"""
+        endpoint = self._balancer._acquire()
+        if endpoint is None:
+            return self._reject()
+        started_at = time.monotonic()
+        try:
+            call = self._get_multicallable(endpoint)(request_or_iterator, **kwargs)
+        except Exception:
+            self._balancer._release(endpoint, time.monotonic() - started_at, True)
+            raise
+        return self._release_when_done(endpoint, started_at, call)
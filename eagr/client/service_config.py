@@ -0,0 +1,78 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""Looking up the per-method settings of a gRPC service config
+
+The service config is described in https://github.com/grpc/grpc/blob/master/doc/service_config.md
+and its retry and hedging policies in https://github.com/grpc/proposal/blob/master/A6-client-retries.md
+"""
+import json
+
+
+def parse_service_config(service_config):
+    """Parse a service config given as a JSON string or as a dict
+
+    Args:
+        service_config: JSON string or dict of the service config
+
+    Returns:
+        dict of the service config
+    """
+    if isinstance(service_config, (str, bytes)):
+        service_config = json.loads(service_config)
+    if not isinstance(service_config, dict):
+        raise ValueError("Service config must be a JSON object, got {!r}".format(service_config))
+    return service_config
+
+
+class MethodConfigMatcher(object):
+    """Finds the method config that applies to a method, as the gRPC core does.
+
+    A name with a service and a method applies to that method, a name with only a service to all
+    methods of the service, and an empty name to all methods. The most specific name wins.
+    """
+
+    def __init__(self, service_config):
+        """Initialize
+
+        Args:
+            service_config: JSON string or dict of the service config, or None
+        """
+        self._method_configs = {}
+        if service_config is None:
+            return
+        for method_config in parse_service_config(service_config).get("methodConfig", ()):
+            for name in method_config.get("name", ()):
+                service = name.get("service", "")
+                method = name.get("method", "")
+                if method and not service:
+                    raise ValueError(
+                        "Method config name {} has a method but no service".format(name)
+                    )
+                key = (service, method)
+                if key in self._method_configs:
+                    raise ValueError("Duplicate method config name {}".format(name))
+                self._method_configs[key] = method_config
+
+    def get_method_config(self, method_name):
+        """Get the method config of a method
+
+        Args:
+            method_name: full method name, e.g. /eagr.TestService/UnaryUnary
+
+        Returns:
+            dict of the method config, or None if none applies
+        """
+        _, service, method = method_name.split("/")
+        for key in ((service, method), (service, ""), ("", "")):
+            method_config = self._method_configs.get(key)
+            if method_config is not None:
+                return method_config
+        return None
+
+    def covers_retries(self, method_name):
+        """Whether the core retries or hedges the calls of a method"""
+        method_config = self.get_method_config(method_name) or {}
+        return "retryPolicy" in method_config or "hedgingPolicy" in method_config
+
+    def covers_timeout(self, method_name):
+        """Whether the core applies a timeout to the calls of a method"""
+        return "timeout" in (self.get_method_config(method_name) or {})
@@ -0,0 +1,126 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""Helpers for consuming server-streaming responses"""
+import queue
+import sys
+import threading
+
+
+DEFAULT_READ_AHEAD_BUFFER_SIZE = 32
+
+# How often the background reader checks whether the consumer went away while the buffer is full
+_PUT_POLL_INTERVAL_SECONDS = 0.1
+
+_END_OF_STREAM = object()
+
+
+class ReadAheadIterator(object):
+    """Iterator over a response stream that is drained into a bounded buffer by a background thread
+
+    Use read_ahead() to create one.
+    """
+
+    def __init__(self, response_iterator, buffer_size):
+        """Initialize and start reading
+
+        Args:
+            response_iterator: iterator of response messages, usually a streaming grpc call
+            buffer_size: maximum number of messages read ahead of the consumer
+        """
+        if buffer_size < 1:
+            raise ValueError("buffer_size must be positive, got {}".format(buffer_size))
+        self._response_iterator = response_iterator
+        self._buffer = queue.Queue(maxsize=buffer_size)
+        self._closed = threading.Event()
+        self._finished = False
+        self._end_buffered = False
+        self._reader = threading.Thread(target=self._read, name="grpc-read-ahead", daemon=True)
+        self._reader.start()
+
+    def _put(self, item):
+        """Put an item into the buffer, giving up if the iterator gets closed. Returns success"""
+        while not self._closed.is_set():
+            try:
+                self._buffer.put(item, timeout=_PUT_POLL_INTERVAL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read(self):
+        """Read the response stream into the buffer until it ends, fails or gets closed"""
+        try:
+            for message in self._response_iterator:
+                if not self._put((message, None)):
+                    return
+        except Exception:  # pylint: disable=broad-except
+            # The exception is re-raised on the consumer's thread
+            self._put_end_of_stream(sys.exc_info()[1])
+        else:
+            self._put_end_of_stream(None)
+
+    def _put_end_of_stream(self, exception):
+        """Put the end-of-stream marker into the buffer, with the exception the stream failed with"""
+        self._end_buffered = True
+        self._put((_END_OF_STREAM, exception))
+
+    def __iter__(self):
+        """Iterate over the response messages"""
+        return self
+
+    def __next__(self):
+        """Get the next response message, waiting for it if the buffer is empty"""
+        if self._finished:
+            raise StopIteration
+        message, exception = self._buffer.get()
+        if message is _END_OF_STREAM:
+            self._finished = True
+            if exception is not None:
+                raise exception
+            raise StopIteration
+        return message
+
+    def buffered(self):
+        """Number of messages read ahead and not yet consumed"""
+        return max(0, self._buffer.qsize() - int(self._end_buffered and not self._finished))
+
+    def close(self):
+        """Stop reading, cancelling the underlying call if it is still running"""
+        self._closed.set()
+        self._finished = True
+        cancel = getattr(self._response_iterator, "cancel", None)
+        if cancel is not None:
+            cancel()
+
+    def __enter__(self):
+        """Enter the context"""
+        return self
+
+    def __exit__(self, *args):
+        """Close on exiting the context"""
+        self.close()
+
+
+def read_ahead(response_iterator, buffer_size=DEFAULT_READ_AHEAD_BUFFER_SIZE):
+    """Read a response stream ahead of its consumer into a bounded buffer.
+
+    grpc only asks the server for more messages as the client consumes them, so an application
+    that does slow work per message stalls the stream under HTTP/2 flow control. Wrapping the
+    stream in read_ahead keeps up to buffer_size messages flowing while the application works;
+    once the buffer is full the background reader stops reading, which applies back pressure to
+    the server as before. Errors of the stream are raised to the consumer after the buffered
+    messages. Closing the iterator cancels the call.
+
+    Sample usage:
+
+        with read_ahead(client.ListThings(request), buffer_size=64) as things:
+            for thing in things:
+                process(thing)
+
+    Args:
+        response_iterator: iterator of response messages, usually a streaming grpc call
+        buffer_size: optional maximum number of messages read ahead of the consumer
+
+    Returns:
+        ReadAheadIterator over the response messages
+    """
+    return ReadAheadIterator(response_iterator, buffer_size)
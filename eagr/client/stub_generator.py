@@ -1,13 +1,21 @@
 # Copyright 2020-present Kensho Technologies, LLC.
 """Code for generating gRPC stubs in Kensho-approved way"""
-import itertools
+import json
+import logging
 
 import grpc
 
 from eagr.client import client_side_middleware
+from eagr.client.channel_monitoring import ChannelConnectivityMonitor, wait_for_channel_ready
 from eagr.client.client_tracing import wrap_grpc_client_channel
+from eagr.client.in_process import InProcessChannel
+from eagr.client.load_balancing import LATENCY_AWARE_CHANNEL_ATTRIBUTE, LatencyAwareChannel
+from eagr.client.service_config import parse_service_config
+from eagr.client.tunnel import UnaryTunnelChannel
 
 
+logger = logging.getLogger(__name__)
+
 DEFAULT_CHANNEL_OPTIONS = {
     # We want to round-robin between servers
     "grpc.lb_policy_name": "round_robin",
@@ -31,6 +39,9 @@ DEFAULT_CHANNEL_OPTIONS = {
     "grpc.http2.min_time_between_pings_ms": 120000,
 }
 
+# Outbound calls made inside a server handler get the inbound time remaining minus this margin
+DEFAULT_DEADLINE_PROPAGATION_MARGIN = 0.05  # seconds
+
 
 def make_grpc_client(
     client_group,
@@ -42,6 +53,25 @@ def make_grpc_client(
     code_to_exception_class_func=None,
     num_retries=3,
     exceptions_to_retry=None,
+    default_timeout=None,
+    method_timeouts=None,
+    deadline_propagation_margin=DEFAULT_DEADLINE_PROPAGATION_MARGIN,
+    dns_refresh_interval=None,
+    connect_eagerly=False,
+    ready_timeout=None,
+    monitor_connectivity=False,
+    tracing_sampling_predicate=None,
+    compression_policy=None,
+    method_compression_policies=None,
+    enable_singleflight=False,
+    singleflight_metadata_keys=(),
+    enable_adaptive_throttling=False,
+    throttling_k=client_side_middleware.DEFAULT_THROTTLING_K,
+    tunnel_unary_calls=False,
+    in_process_servers=None,
+    in_process_middlewares=None,
+    skip_serialization=False,
+    service_config=None,
 ):
     """Generate a gRPC client with appropriate middleware and options.
 
@@ -51,7 +81,8 @@ def make_grpc_client(
     Args:
         client_group: human readable description of the client group
         service_name: human-readable name of the service for metrics/logging purposes
-        service_url: host:port string to connect to
+        service_url: host:port string to connect to, or a list of host:port strings to balance
+        across with latency-aware load balancing
         stub_cls: stub class to instantiate
         extra_channel_options: optional dict of grpc channel options as described in
         disable_tracing: boolean, set to disable tracing for this client
@@ -59,6 +90,54 @@ def make_grpc_client(
         num_retries: number of times to retry (retriable) exceptions
         exceptions_to_retry: optional list of retriable exceptions. (ConnectionRefusedError,)
         by default
+        default_timeout: optional timeout in seconds for calls made without an explicit timeout
+        method_timeouts: optional dict of method name to default timeout in seconds, overriding
+        default_timeout for that method
+        deadline_propagation_margin: safety margin in seconds subtracted from the inbound
+        deadline when the client is called inside a server handler. None disables propagation
+        dns_refresh_interval: optional interval in seconds. If set, service_url is resolved into
+        its addresses every interval and calls are balanced across them in a latency-aware way
+        connect_eagerly: boolean, set to start connecting the channel right away instead of on
+        the first call
+        ready_timeout: optional timeout in seconds. If set, the channel connects eagerly and this
+        function blocks until it is ready or the timeout expires, in which case a warning is
+        logged and the client is returned regardless
+        monitor_connectivity: boolean, set to export the connectivity state transitions of the
+        channel as metrics. Implied by connect_eagerly and ready_timeout. grpc polls the
+        connectivity of a monitored channel in a thread until it is closed with close_grpc_client
+        tracing_sampling_predicate: optional function taking the tracer and the active span (or
+        None) and returning whether a call should be traced. By default calls are not traced if
+        the active span is not sampled
+        compression_policy: optional client_side_middleware.CompressionPolicy. If set, requests
+        whose serialized size reaches its threshold are compressed with its algorithm
+        method_compression_policies: optional dict of method name to CompressionPolicy,
+        overriding compression_policy for that method. None disables compression for the method
+        enable_singleflight: boolean, set to send only one of several identical unary calls that
+        are in flight at the same time and complete all of them with its outcome
+        singleflight_metadata_keys: optional iterable of metadata keys whose values are part of
+        the identity of a call for singleflight
+        enable_adaptive_throttling: boolean, set to reject calls locally with a probability that
+        grows as the share of calls rejected by the server grows
+        throttling_k: the client sends up to throttling_k times as many calls as the server
+        accepts before adaptive throttling starts rejecting calls
+        tunnel_unary_calls: boolean, set to send unary-unary calls over one long-lived stream
+        instead of a stream per call. The server must serve an eagr.server.tunnel.
+        UnaryTunnelServicer. Note that with several endpoints, the stream is balanced only once
+        in_process_servers: optional GRPCBase instance or list of them living in this process.
+        If set, unary-unary calls are dispatched to them directly instead of going through the
+        network, still applying the client middlewares and in_process_middlewares. The other
+        kinds of calls, and the calls of methods they do not serve, go to service_url, which may
+        be None if there are none
+        in_process_middlewares: optional list of GRPCMiddleware objects applied to the calls
+        dispatched in-process, like the middlewares passed to run_grpc_servers
+        skip_serialization: boolean, set to hand messages to the in-process servers without
+        serializing them. The caller and the servicer then share the request and response
+        objects, so neither may modify them afterwards
+        service_config: optional gRPC service config, as a JSON string or a dict, for the gRPC
+        core to apply per-method retry and hedging policies, timeouts and wait-for-ready. The
+        Python retries step aside for the methods it gives a retry or hedging policy, and
+        default_timeout for the methods it gives a timeout, unless the unary calls are tunneled
+        or dispatched in-process, which the core does not see as separate calls
 
     Returns:
         an instance of the stub class
@@ -66,10 +145,75 @@ def make_grpc_client(
     # Start by creating a set of options
     channel_options = dict(DEFAULT_CHANNEL_OPTIONS)
 
+    if service_config is not None:
+        channel_options.update(
+            {
+                "grpc.service_config": json.dumps(parse_service_config(service_config)),
+                "grpc.enable_retries": 1,
+                # Keep the resolver from replacing our config with one published in DNS
+                "grpc.service_config_disable_resolution": 1,
+            }
+        )
+
     if extra_channel_options:
         channel_options.update(extra_channel_options)
 
-    channel = grpc.insecure_channel(service_url, options=tuple(channel_options.items()))
+    def make_channel(target):
+        """Make a channel to the target with the channel options"""
+        return grpc.insecure_channel(target, options=tuple(channel_options.items()))
+
+    if service_url is None:
+        if not in_process_servers:
+            raise ValueError("service_url is required without in_process_servers")
+        channel = None
+    elif isinstance(service_url, (list, tuple)):
+        channel = LatencyAwareChannel(
+            make_channel, client_group, service_name, endpoints=list(service_url)
+        )
+    elif dns_refresh_interval:
+        channel = LatencyAwareChannel(
+            make_channel,
+            client_group,
+            service_name,
+            dns_target=service_url,
+            dns_refresh_interval=dns_refresh_interval,
+        )
+    else:
+        channel = make_channel(service_url)
+
+    latency_aware_channel = channel if isinstance(channel, LatencyAwareChannel) else None
+    if tunnel_unary_calls and channel is not None:
+        channel = UnaryTunnelChannel(channel)
+    if in_process_servers:
+        if not isinstance(in_process_servers, (list, tuple)):
+            in_process_servers = [in_process_servers]
+        channel = InProcessChannel(
+            in_process_servers,
+            middlewares=in_process_middlewares,
+            skip_serialization=skip_serialization,
+            fallback_channel=channel,
+        )
+
+    # Connectivity transitions are exported as metrics. Asking the channel to connect right away
+    # takes DNS resolution and the TCP and HTTP/2 handshakes out of the first call. Each
+    # subscription costs a polling thread, so only the clients asking for it are monitored
+    connectivity_monitor = None
+    try_to_connect = connect_eagerly or ready_timeout is not None
+    if monitor_connectivity or try_to_connect:
+        connectivity_monitor = ChannelConnectivityMonitor(channel, client_group, service_name)
+        connectivity_monitor.start(try_to_connect=try_to_connect)
+    if ready_timeout is not None and not wait_for_channel_ready(channel, ready_timeout):
+        logger.warning(
+            "Channel of %s to %s at %s was not ready after %s seconds",
+            client_group,
+            service_name,
+            service_url,
+            ready_timeout,
+        )
+
+    # The core applies the service config to the calls that it sees individually
+    if tunnel_unary_calls or in_process_servers:
+        service_config = None
 
     # We retry connection refused errors (grpc.StatusCode.UNAVAILABLE) because those are
     # generally transient
@@ -81,21 +225,62 @@ def make_grpc_client(
     middlewares = [
         client_side_middleware.ClientSideExceptionCountMiddleware(client_group, service_name),
         client_side_middleware.ClientRetryingMiddlewareUnaryOutput(
-            client_group, service_name, exceptions_to_retry, num_retries
+            client_group,
+            service_name,
+            exceptions_to_retry,
+            num_retries,
+            service_config=service_config,
         ),
         client_side_middleware.ClientExceptionTranslationMiddlewareUnaryOutput(
             client_group, service_name, code_to_exception_class_func
         ),
         client_side_middleware.ClientSideMetricsMiddleware(client_group, service_name),
+        client_side_middleware.ClientSideStreamMetricsMiddleware(client_group, service_name),
+        # The deadline is applied closest to the wire so that every retry attempt gets
+        # a timeout computed from the inbound time remaining at the moment of the attempt
+        client_side_middleware.ClientDeadlineMiddleware(
+            client_group,
+            service_name,
+            default_timeout=default_timeout,
+            method_timeouts=method_timeouts,
+            propagation_margin=deadline_propagation_margin,
+            service_config=service_config,
+        ),
     ]
-    interceptors = list(
-        itertools.chain.from_iterable(middleware.get_interceptors() for middleware in middlewares)
-    )
-    decorated_channel = grpc.intercept_channel(channel, *interceptors)
+    if enable_singleflight:
+        # Outermost, so that a deduplicated call is retried, translated and measured only once
+        middlewares.insert(
+            0,
+            client_side_middleware.ClientSingleflightMiddleware(
+                client_group, service_name, metadata_keys=singleflight_metadata_keys
+            ),
+        )
+    if enable_adaptive_throttling:
+        # Innermost, so that every retry attempt counts as a request
+        middlewares.append(
+            client_side_middleware.ClientAdaptiveThrottlingMiddleware(
+                client_group, service_name, k=throttling_k
+            )
+        )
+    if compression_policy is not None or method_compression_policies:
+        middlewares.append(
+            client_side_middleware.ClientCompressionMiddleware(
+                client_group,
+                service_name,
+                default_policy=compression_policy,
+                method_policies=method_compression_policies,
+            )
+        )
+    # All middlewares are applied by one fused interceptor, which computes their per-method state
+    # once instead of on every call in every interceptor layer
+    interceptor = client_side_middleware.FusedClientInterceptor(middlewares)
+    decorated_channel = grpc.intercept_channel(channel, interceptor)
     if disable_tracing:
         traced_channel = decorated_channel
     else:
-        traced_channel = wrap_grpc_client_channel(decorated_channel)
+        traced_channel = wrap_grpc_client_channel(
+            decorated_channel, sampling_predicate=tracing_sampling_predicate
+        )
 
     stub = stub_cls(traced_channel)
 
@@ -103,5 +288,20 @@ def make_grpc_client(
     # collect it in the middle of interaction
     # cf. https://blog.jeffli.me/blog/2017/08/02/keep-python-grpc-client-connection-truly-alive/
     setattr(stub, "_channel_attribute_for_no_gc", decorated_channel)
+    setattr(stub, "_connectivity_monitor", connectivity_monitor)
+    if latency_aware_channel is not None:
+        setattr(stub, LATENCY_AWARE_CHANNEL_ATTRIBUTE, latency_aware_channel)
 
     return stub
+
+
+def close_grpc_client(stub):
+    """Stop monitoring the channel of a client made by make_grpc_client and close it
+
+    Args:
+        stub: stub returned by make_grpc_client
+    """
+    connectivity_monitor = getattr(stub, "_connectivity_monitor", None)
+    if connectivity_monitor is not None:
+        connectivity_monitor.stop()
+    stub._channel_attribute_for_no_gc.close()
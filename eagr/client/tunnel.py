@@ -0,0 +1,242 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""Sending unary calls over one long-lived tunnel stream, see eagr.server.tunnel"""
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+
+import grpc
+
+from eagr.client.call_futures import LocalCall
+from eagr.protos import tunnel_pb2
+
+
+logger = logging.getLogger(__name__)
+
+TUNNEL_METHOD = "/eagr.UnaryTunnel/Tunnel"
+
+_STATUS_CODES = {code.value[0]: code for code in grpc.StatusCode}
+
+_END_OF_STREAM = object()
+
+
+class _TunnelStream(object):
+    """One tunnel stream with its calls in flight"""
+
+    def __init__(self, tunnel_method):
+        """Open the stream
+
+        Args:
+            tunnel_method: stream-stream multicallable of the tunnel method
+        """
+        self._requests = queue.Queue()
+        self._condition = threading.Condition()
+        self._pending = {}
+        self._correlation_ids = itertools.count(1)
+        # Heap of (deadline, correlation id) of the calls with a timeout
+        self._deadlines = []
+        self.broken = False
+        self._responses = tunnel_method(iter(self._requests.get, _END_OF_STREAM))
+        threading.Thread(target=self._read, name="UnaryTunnelReader", daemon=True).start()
+        threading.Thread(
+            target=self._enforce_deadlines, name="UnaryTunnelDeadlines", daemon=True
+        ).start()
+
+    def send(self, method, payload, metadata, timeout, response_deserializer):
+        """Send a call over the stream and return its LocalCall"""
+        metadata = tuple(metadata or ())
+        binary_keys = [key for key, value in metadata if not isinstance(value, str)]
+        request = None
+        if not binary_keys:
+            # Built before the call is registered, so that a failure leaves nothing pending
+            request = tunnel_pb2.TunnelRequest(
+                method=method,
+                payload=payload,
+                metadata=[
+                    tunnel_pb2.TunnelMetadatum(key=key, value=value) for key, value in metadata
+                ],
+                timeout=timeout or 0,
+            )
+
+        with self._condition:
+            correlation_id = next(self._correlation_ids)
+            call = LocalCall(response_deserializer, lambda _: self._forget(correlation_id), timeout)
+            if binary_keys:
+                call._complete(
+                    grpc.StatusCode.INVALID_ARGUMENT,
+                    "Binary metadata cannot be tunneled: {}".format(", ".join(binary_keys)),
+                )
+                return call
+            if self.broken:
+                call._complete(grpc.StatusCode.UNAVAILABLE, "Tunnel stream is closed")
+                return call
+            if timeout is not None and timeout <= 0:
+                # A timeout of 0 tells the server there is no deadline, so the call fails here
+                call._complete(grpc.StatusCode.DEADLINE_EXCEEDED, "Deadline Exceeded")
+                return call
+            self._pending[correlation_id] = call
+            if timeout is not None:
+                heapq.heappush(self._deadlines, (time.monotonic() + timeout, correlation_id))
+                self._condition.notify()
+
+        request.correlation_id = correlation_id
+        self._requests.put(request)
+        return call
+
+    def _forget(self, correlation_id):
+        """Stop waiting for the response of a call"""
+        with self._condition:
+            self._pending.pop(correlation_id, None)
+
+    def _read(self):
+        """Complete the calls as their responses arrive"""
+        code, details = grpc.StatusCode.UNAVAILABLE, "Tunnel stream ended"
+        try:
+            for response in self._responses:
+                with self._condition:
+                    call = self._pending.pop(response.correlation_id, None)
+                if call is not None:
+                    call._complete(
+                        _STATUS_CODES.get(response.code, grpc.StatusCode.UNKNOWN),
+                        response.details or None,
+                        response.payload,
+                        (
+                            (metadatum.key, metadatum.value)
+                            for metadatum in response.trailing_metadata
+                        ),
+                    )
+        except grpc.RpcError as exc:
+            code, details = exc.code(), exc.details()
+            logger.warning("Tunnel stream failed with %s: %s", code, details)
+        finally:
+            with self._condition:
+                self.broken = True
+                pending, self._pending = self._pending, {}
+                self._condition.notify()
+            for call in pending.values():
+                call._complete(code, details)
+
+    def _enforce_deadlines(self):
+        """Fail the calls whose deadline passed"""
+        while True:
+            expired_calls = []
+            with self._condition:
+                if self.broken:
+                    return
+                now = time.monotonic()
+                while self._deadlines and self._deadlines[0][0] <= now:
+                    _, correlation_id = heapq.heappop(self._deadlines)
+                    call = self._pending.pop(correlation_id, None)
+                    if call is not None:
+                        expired_calls.append(call)
+                if not expired_calls:
+                    self._condition.wait(self._deadlines[0][0] - now if self._deadlines else None)
+            for call in expired_calls:
+                call._complete(grpc.StatusCode.DEADLINE_EXCEEDED, "Deadline Exceeded")
+
+    def close(self):
+        """Close the stream, failing the calls in flight"""
+        self._requests.put(_END_OF_STREAM)
+        self._responses.cancel()
+
+
+class _TunnelUnaryUnaryMultiCallable(grpc.UnaryUnaryMultiCallable):
+    """Multicallable sending the calls of a unary method over the tunnel stream"""
+
+    def __init__(self, channel, method, request_serializer, response_deserializer):
+        """Capture the channel, the method and its serialization functions"""
+        self._channel = channel
+        self._method = method
+        self._request_serializer = request_serializer
+        self._response_deserializer = response_deserializer
+
+    def future(self, request, timeout=None, metadata=None, **kwargs):
+        """Send the call, returning its LocalCall"""
+        payload = request if self._request_serializer is None else self._request_serializer(request)
+        return self._channel._get_stream().send(
+            self._method, payload, metadata, timeout, self._response_deserializer
+        )
+
+    def with_call(self, request, timeout=None, metadata=None, **kwargs):
+        """Send the call and wait for the response, returning it with the call"""
+        call = self.future(request, timeout=timeout, metadata=metadata)
+        return call.result(), call
+
+    def __call__(self, request, timeout=None, metadata=None, **kwargs):
+        """Send the call and wait for the response"""
+        return self.future(request, timeout=timeout, metadata=metadata).result()
+
+
+class UnaryTunnelChannel(grpc.Channel):
+    """A grpc channel sending unary-unary calls over one long-lived tunnel stream.
+
+    The server must serve an eagr.server.tunnel.UnaryTunnelServicer. Calls of the other kinds go
+    through the underlying channel as usual. If the stream breaks, the calls in flight fail with
+    UNAVAILABLE and the next call opens a new stream. Credentials, wait_for_ready, compression,
+    binary metadata and initial metadata are not supported for tunneled calls.
+    """
+
+    def __init__(self, channel):
+        """Initialize with the underlying channel"""
+        self._channel = channel
+        self._tunnel_method = channel.stream_stream(
+            TUNNEL_METHOD,
+            request_serializer=tunnel_pb2.TunnelRequest.SerializeToString,
+            response_deserializer=tunnel_pb2.TunnelResponse.FromString,
+        )
+        self._lock = threading.Lock()
+        self._stream = None
+
+    def _get_stream(self):
+        """Get the tunnel stream, opening a new one if there is none or it broke"""
+        with self._lock:
+            if self._stream is None or self._stream.broken:
+                self._stream = _TunnelStream(self._tunnel_method)
+            return self._stream
+
+    def unary_unary(
+        self, method, request_serializer=None, response_deserializer=None, *args, **kwargs
+    ):
+        """Create a multicallable sending its calls over the tunnel"""
+        return _TunnelUnaryUnaryMultiCallable(
+            self, method, request_serializer, response_deserializer
+        )
+
+    def unary_stream(self, method, *args, **kwargs):
+        """Create a unary-stream multicallable of the underlying channel"""
+        return self._channel.unary_stream(method, *args, **kwargs)
+
+    def stream_unary(self, method, *args, **kwargs):
+        """Create a stream-unary multicallable of the underlying channel"""
+        return self._channel.stream_unary(method, *args, **kwargs)
+
+    def stream_stream(self, method, *args, **kwargs):
+        """Create a stream-stream multicallable of the underlying channel"""
+        return self._channel.stream_stream(method, *args, **kwargs)
+
+    def subscribe(self, callback, try_to_connect=False):
+        """Subscribe to the connectivity of the underlying channel"""
+        self._channel.subscribe(callback, try_to_connect=try_to_connect)
+
+    def unsubscribe(self, callback):
+        """Unsubscribe from the connectivity of the underlying channel"""
+        self._channel.unsubscribe(callback)
+
+    def close(self):
+        """Close the tunnel stream and the underlying channel"""
+        with self._lock:
+            stream, self._stream = self._stream, None
+        if stream is not None:
+            stream.close()
+        self._channel.close()
+
+    def __enter__(self):
+        """Enter the runtime context"""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Close the channel when leaving the runtime context"""
+        self.close()
+        return False
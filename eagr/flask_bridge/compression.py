@@ -0,0 +1,147 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""Gzip compression of the responses of bridged routes"""
+import collections
+import functools
+import time
+import zlib
+
+import flask
+import prometheus_client
+
+
+BRIDGE_COMPRESSION_RATIO_HISTO = prometheus_client.Histogram(
+    "bridge_response_compression_ratio",
+    "Ratio of the compressed to the uncompressed size of compressed responses of bridged routes",
+    labelnames=("route",),
+    buckets=(0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.75, 1.0, float("inf")),
+)
+BRIDGE_COMPRESSION_CPU_COUNTER = prometheus_client.Counter(
+    "bridge_response_compression_cpu_seconds",
+    "CPU time spent compressing the responses of bridged routes",
+    labelnames=("route",),
+)
+
+# Responses of at least threshold_bytes are compressed at the given zlib level (1 to 9) for
+# requests accepting gzip. Streamed responses, whose size is unknown, always are
+ResponseCompression = collections.namedtuple("ResponseCompression", ("threshold_bytes", "level"))
+
+DEFAULT_RESPONSE_COMPRESSION = ResponseCompression(threshold_bytes=1024, level=6)
+
+# CPU time of the current thread, where available
+_cpu_time = getattr(time, "thread_time", time.process_time)
+
+
+class _GzipCompressor(object):
+    """Compresses a body into the gzip format, counting the bytes and CPU time it takes"""
+
+    def __init__(self, route, level):
+        """Initialize
+
+        Args:
+            route: route label for metrics
+            level: zlib compression level
+        """
+        self._route = route
+        # 16 + MAX_WBITS for the gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self._uncompressed_bytes = 0
+        self._compressed_bytes = 0
+        self._cpu_seconds = 0.0
+
+    def compress(self, data, flush_mode=None):
+        """Compress a chunk of the body, flushing the compressor with the mode if given"""
+        started_at = _cpu_time()
+        compressed = self._compressor.compress(data)
+        if flush_mode is not None:
+            compressed += self._compressor.flush(flush_mode)
+        self._cpu_seconds += _cpu_time() - started_at
+        self._uncompressed_bytes += len(data)
+        self._compressed_bytes += len(compressed)
+        return compressed
+
+    def finish(self):
+        """Get the end of the compressed body"""
+        return self.compress(b"", zlib.Z_FINISH)
+
+    def record(self):
+        """Record the metrics of the compression"""
+        BRIDGE_COMPRESSION_CPU_COUNTER.labels(self._route).inc(self._cpu_seconds)
+        if self._uncompressed_bytes:
+            BRIDGE_COMPRESSION_RATIO_HISTO.labels(self._route).observe(
+                self._compressed_bytes / self._uncompressed_bytes
+            )
+
+
+def _iter_compressed(chunks, compressor):
+    """Compress the chunks of a streamed body as they come
+
+    Every chunk is flushed out of the compressor, so that e.g. lines of streamed JSON reach the
+    client as soon as they are written. Only the compressor's window is held in memory.
+    """
+    try:
+        for chunk in chunks:
+            compressed = compressor.compress(chunk, zlib.Z_SYNC_FLUSH)
+            if compressed:
+                yield compressed
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+        compressor.record()
+
+
+def _accepts_gzip():
+    """Whether the flask request accepts gzip-encoded responses"""
+    return flask.request.accept_encodings.quality("gzip") > 0
+
+
+def compress_response(response, route, compression):
+    # type (flask.Response, str, ResponseCompression) -> flask.Response
+    """Compress a response with gzip if the request accepts it.
+
+    Compressed responses with a strong ETag get a weak one instead, since their bytes depend on
+    the encoding. Conditional requests compare ETags weakly, so they still get a 304.
+
+    Args:
+        response: flask response
+        route: route label for metrics
+        compression: ResponseCompression
+
+    Returns:
+        the response, compressed or not
+    """
+    if response.status_code in (204, 304) or "Content-Encoding" in response.headers:
+        return response
+    response.vary.add("Accept-Encoding")
+    if not _accepts_gzip():
+        return response
+
+    compressor = _GzipCompressor(route, compression.level)
+    if response.is_streamed:
+        response.response = _iter_compressed(response.response, compressor)
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < compression.threshold_bytes:
+            return response
+        response.set_data(compressor.compress(body, zlib.Z_FINISH))
+        compressor.record()
+    response.headers["Content-Encoding"] = "gzip"
+    etag, is_weak = response.get_etag()
+    if etag is not None and not is_weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def compress_responses(handler, route, compression):
+    # type (Callable, str, ResponseCompression) -> Callable
+    """Wrap a flask handler so that its responses are compressed, see compress_response"""
+
+    @functools.wraps(handler)
+    def compressing_handler(*args, **kwargs):
+        """Handle the request, then compress the response"""
+        response = flask.make_response(handler(*args, **kwargs))
+        return compress_response(response, route, compression)
+
+    return compressing_handler
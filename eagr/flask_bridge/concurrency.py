@@ -0,0 +1,149 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""Per-route concurrency limits of bridged routes"""
+import asyncio
+import collections
+import threading
+
+import prometheus_client
+
+
+BRIDGE_IN_FLIGHT_GAUGE = prometheus_client.Gauge(
+    "bridge_in_flight_requests",
+    "Requests being handled by bridged routes",
+    labelnames=("route",),
+)
+BRIDGE_QUEUED_GAUGE = prometheus_client.Gauge(
+    "bridge_queued_requests",
+    "Requests waiting for a free slot of a concurrency-limited bridged route",
+    labelnames=("route",),
+)
+BRIDGE_SHED_COUNTER = prometheus_client.Counter(
+    "bridge_shed_requests",
+    "Requests rejected by concurrency-limited bridged routes, by reason",
+    labelnames=("route", "reason"),
+)
+
+# Requests to a route that has max_concurrency requests in flight wait in a queue of up to
+# max_queue requests for at most queue_timeout seconds (or until their own deadline)
+ConcurrencyLimit = collections.namedtuple(
+    "ConcurrencyLimit", ("max_concurrency", "max_queue", "queue_timeout")
+)
+
+
+class RouteConcurrencyLimiter(object):
+    """Counts the requests in flight for a route and enforces its concurrency limit, if any"""
+
+    def __init__(self, route, limit=None):
+        """Initialize
+
+        Args:
+            route: route label for metrics
+            limit: optional ConcurrencyLimit. Requests are only counted without one
+        """
+        self._limit = limit
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._queued = 0
+        self._in_flight_gauge = BRIDGE_IN_FLIGHT_GAUGE.labels(route)
+        self._queued_gauge = BRIDGE_QUEUED_GAUGE.labels(route)
+        self._queue_full_counter = BRIDGE_SHED_COUNTER.labels(route, "queue_full")
+        self._queue_timeout_counter = BRIDGE_SHED_COUNTER.labels(route, "queue_timeout")
+
+    def _has_free_slot(self):
+        """Whether a request can start right away; must hold the condition"""
+        return self._limit is None or self._in_flight < self._limit.max_concurrency
+
+    def acquire(self, timeout=None):
+        """Take a slot, waiting in the queue while all slots are taken
+
+        Args:
+            timeout: optional time in seconds the request can wait at most, e.g. its deadline
+
+        Returns:
+            True if the request got a slot and must release it, False if it was shed
+        """
+        with self._condition:
+            if not self._has_free_slot():
+                if self._queued >= self._limit.max_queue:
+                    self._queue_full_counter.inc()
+                    return False
+                wait_timeout = self._limit.queue_timeout
+                if timeout is not None and (wait_timeout is None or timeout < wait_timeout):
+                    wait_timeout = timeout
+                self._queued += 1
+                self._queued_gauge.inc()
+                try:
+                    got_slot = self._condition.wait_for(self._has_free_slot, timeout=wait_timeout)
+                finally:
+                    self._queued -= 1
+                    self._queued_gauge.dec()
+                if not got_slot:
+                    self._queue_timeout_counter.inc()
+                    return False
+            self._in_flight += 1
+        self._in_flight_gauge.inc()
+        return True
+
+    def release(self):
+        """Release the slot of a finished request"""
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+        self._in_flight_gauge.dec()
+
+
+class AsyncRouteConcurrencyLimiter(RouteConcurrencyLimiter):
+    """RouteConcurrencyLimiter for routes served by an asyncio event loop"""
+
+    def __init__(self, route, limit=None):
+        """Initialize
+
+        Args:
+            route: route label for metrics
+            limit: optional ConcurrencyLimit. Requests are only counted without one
+        """
+        super(AsyncRouteConcurrencyLimiter, self).__init__(route, limit=limit)
+        # Created by the event loop serving the route
+        self._condition = None
+
+    async def acquire(self, timeout=None):
+        """Take a slot, waiting in the queue while all slots are taken
+
+        Args:
+            timeout: optional time in seconds the request can wait at most, e.g. its deadline
+
+        Returns:
+            True if the request got a slot and must release it, False if it was shed
+        """
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            if not self._has_free_slot():
+                if self._queued >= self._limit.max_queue:
+                    self._queue_full_counter.inc()
+                    return False
+                wait_timeout = self._limit.queue_timeout
+                if timeout is not None and (wait_timeout is None or timeout < wait_timeout):
+                    wait_timeout = timeout
+                self._queued += 1
+                self._queued_gauge.inc()
+                try:
+                    await asyncio.wait_for(
+                        self._condition.wait_for(self._has_free_slot), wait_timeout
+                    )
+                except asyncio.TimeoutError:
+                    self._queue_timeout_counter.inc()
+                    return False
+                finally:
+                    self._queued -= 1
+                    self._queued_gauge.dec()
+            self._in_flight += 1
+        self._in_flight_gauge.inc()
+        return True
+
+    async def release(self):
+        """Release the slot of a finished request"""
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+        self._in_flight_gauge.dec()
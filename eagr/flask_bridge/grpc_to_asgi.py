@@ -0,0 +1,353 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""ASGI counterpart of grpc_to_json, calling the grpc services through grpc.aio channels
+
+The flask bridge holds a thread for every request in flight. Here requests are coroutines of an
+event loop, so that one process can wait on thousands of slow grpc calls at once. Routes are
+mounted with the same semantics as grpc_to_json.map_and_mount: unary methods answer with a JSON
+object, methods streaming their responses with newline-delimited JSON, and the concurrency limits
+and request timeouts work the same way.
+
+The app is a bare ASGI application, which any ASGI server (e.g. uvicorn) can serve and other ASGI
+frameworks can mount.
+"""
+import json
+import logging
+from timeit import default_timer
+
+from google.protobuf import descriptor_pool, json_format, symbol_database
+import grpc
+
+from eagr.flask_bridge.concurrency import AsyncRouteConcurrencyLimiter
+from eagr.flask_bridge.grpc_to_json import (
+    DEFAULT_RETRY_AFTER_SECONDS,
+    DEFAULT_TIMEOUT_HEADER,
+    JSON_MIMETYPE,
+    NDJSON_MIMETYPE,
+    make_input_message,
+    parse_request_timeout,
+)
+from eagr.grpc_utils.json_encoding import message_to_json_bytes
+from eagr.grpc_utils.method import (
+    get_method_streaming,
+    make_grpc_unary_method,
+    make_grpc_unary_stream_method,
+)
+from eagr.reflection.reflection_descriptor_database import build_database_from_channel
+
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_json(value):
+    """Encode a value as compact JSON with sorted keys, like flask.json.jsonify"""
+    return json.dumps(value, separators=(",", ":"), sort_keys=True).encode("utf-8") + b"\n"
+
+
+async def _send_response(send, status, body, content_type=JSON_MIMETYPE, headers=None):
+    """Send a complete response"""
+    raw_headers = [
+        (b"content-type", content_type.encode("latin-1")),
+        (b"content-length", str(len(body)).encode("latin-1")),
+    ]
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.lower().encode("latin-1"), value.encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_error(send, status, message, headers=None):
+    """Send a JSON error response, shaped like those of the flask bridge"""
+    await _send_response(send, status, _encode_json({"error": message}), headers=headers)
+
+
+async def _read_body(receive):
+    """Read the whole body of a request"""
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ConnectionResetError("Client disconnected before sending the whole request")
+        chunks.append(message.get("body", b""))
+        more_body = message.get("more_body", False)
+    return b"".join(chunks)
+
+
+def _get_header(scope, name):
+    """Get the value of a request header, or None"""
+    raw_name = name.lower().encode("latin-1")
+    for header_name, header_value in scope["headers"]:
+        if header_name == raw_name:
+            return header_value.decode("latin-1")
+    return None
+
+
+class _RouteHandler(object):
+    """Handles the requests of the route of a method"""
+
+    def __init__(
+        self,
+        method,
+        input_type,
+        symbol_database_instance,
+        server_streaming,
+        limiter,
+        timeout_header,
+        default_timeout,
+        retry_after,
+    ):
+        """Initialize, see map_and_mount"""
+        self._method = method
+        self._input_type = input_type
+        self._symbol_database = symbol_database_instance
+        self._server_streaming = server_streaming
+        self._limiter = limiter
+        self._timeout_header = timeout_header
+        self._default_timeout = default_timeout
+        self._retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        """Handle a request"""
+        started_at = default_timer()
+        header_value = _get_header(scope, self._timeout_header) if self._timeout_header else None
+        try:
+            timeout = parse_request_timeout(header_value, self._default_timeout)
+        except ValueError as exc:
+            await _send_error(send, 400, str(exc))
+            return
+        try:
+            input_dict = json.loads(await _read_body(receive))
+            input_message = make_input_message(self._input_type, input_dict, self._symbol_database)
+        except (ValueError, json_format.ParseError) as exc:
+            # Malformed JSON, or JSON not matching the input message
+            await _send_error(send, 400, str(exc))
+            return
+
+        if self._limiter is not None and not await self._limiter.acquire(timeout):
+            await _send_error(
+                send, 503, "Too many concurrent requests", {"Retry-After": str(self._retry_after)}
+            )
+            return
+        try:
+            if timeout is not None:
+                # Time spent waiting for a slot counts against the deadline
+                timeout = max(timeout - (default_timer() - started_at), 0)
+            if self._server_streaming:
+                await self._stream(input_message, timeout, send)
+            else:
+                await self._unary(input_message, timeout, send)
+        finally:
+            if self._limiter is not None:
+                await self._limiter.release()
+
+    async def _unary(self, input_message, timeout, send):
+        """Call a unary method and send its response"""
+        try:
+            response = await self._method(input_message, timeout=timeout)
+        except grpc.RpcError as exc:
+            await self._send_rpc_error(send, exc)
+            return
+        await _send_response(send, 200, message_to_json_bytes(response, self._symbol_database.pool))
+
+    async def _stream(self, input_message, timeout, send):
+        """Call a method streaming its responses and send them as lines of JSON
+
+        Each line is sent before the next response is read, so that slow HTTP clients slow the
+        grpc stream down through its flow control. An error after the first response ends the
+        stream with a {"code": ..., "error": ...} line.
+        """
+        call = self._method(input_message, timeout=timeout)
+        try:
+            try:
+                response = await call.read()
+            except grpc.RpcError as exc:
+                await self._send_rpc_error(send, exc)
+                return
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [(b"content-type", NDJSON_MIMETYPE.encode("latin-1"))],
+                }
+            )
+            while response is not grpc.aio.EOF:
+                line = message_to_json_bytes(response, self._symbol_database.pool) + b"\n"
+                await send({"type": "http.response.body", "body": line, "more_body": True})
+                try:
+                    response = await call.read()
+                except grpc.RpcError as exc:
+                    error = {"code": exc.code().name, "error": exc.details()}
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": _encode_json(error),
+                            "more_body": True,
+                        }
+                    )
+                    break
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            # No-op once the stream ended, cancels it if the client went away
+            call.cancel()
+
+    @staticmethod
+    async def _send_rpc_error(send, exc):
+        """Send the response to a failed call"""
+        if exc.code() is grpc.StatusCode.DEADLINE_EXCEEDED:
+            await _send_error(send, 504, "Deadline exceeded")
+        else:
+            logger.error("Bridged call failed with %s: %s", exc.code(), exc.details())
+            await _send_error(send, 500, "Internal Server Error")
+
+
+class GrpcAsgiApp(object):
+    """ASGI application serving the routes mounted on it with map_and_mount"""
+
+    def __init__(self):
+        """Initialize without routes"""
+        self._routes = {}
+
+    def add_route(self, path, handler):
+        """Serve POST requests to path with an ASGI handler"""
+        if path in self._routes:
+            raise ValueError("Route {} is already mounted".format(path))
+        self._routes[path] = handler
+
+    async def __call__(self, scope, receive, send):
+        """Handle an ASGI connection"""
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise NotImplementedError("Unsupported ASGI scope type {}".format(scope["type"]))
+
+        handler = self._routes.get(scope["path"])
+        if handler is None:
+            await _send_error(send, 404, "Not Found")
+        elif scope["method"] != "POST":
+            await _send_error(send, 405, "Method Not Allowed", {"Allow": "POST"})
+        else:
+            await handler(scope, receive, send)
+
+    @staticmethod
+    async def _lifespan(receive, send):
+        """Acknowledge the startup and shutdown of the server, there is nothing to do"""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def map_and_mount(
+    asgi_app,
+    channel,
+    service_name,
+    json_service_path,
+    descriptor_pool_instance=None,
+    symbol_database_instance=None,
+    concurrency_limit=None,
+    method_concurrency_limits=None,
+    timeout_header=DEFAULT_TIMEOUT_HEADER,
+    default_timeout=None,
+    retry_after=DEFAULT_RETRY_AFTER_SECONDS,
+):
+    # type (GrpcAsgiApp, aio.Channel, str, str, Any, Any, Any, Dict, str, Optional[float], int) -> None
+    """Mount all json passthrough methods on specific path.
+
+    Same as grpc_to_json.map_and_mount, for an ASGI app and a grpc.aio channel.
+
+    Args:
+        asgi_app: GrpcAsgiApp
+        channel: grpc.aio channel, created by the event loop serving the app
+        service_name: service name
+        json_service_path: jsons service path
+        descriptor_pool_instance: descriptor pool instance
+        symbol_database_instance: symbol db instance
+        concurrency_limit: optional concurrency.ConcurrencyLimit of every route
+        method_concurrency_limits: optional dict of method name to ConcurrencyLimit, overriding
+            concurrency_limit for that method. None disables the limit for the method
+        timeout_header: optional name of the HTTP header carrying the request timeout in seconds,
+            which becomes the deadline of the grpc call. None to ignore request timeouts
+        default_timeout: optional timeout in seconds for requests without a (shorter) timeout
+        retry_after: value of the Retry-After header of shed requests, in seconds
+    """
+    method_concurrency_limits = method_concurrency_limits or {}
+    if descriptor_pool_instance is None:
+        descriptor_pool_instance = descriptor_pool.Default()
+    if symbol_database_instance is None:
+        symbol_database_instance = symbol_database.Default()
+    service_descriptor = descriptor_pool_instance.FindServiceByName(service_name)
+    for method_descriptor in service_descriptor.methods:
+        method_name = method_descriptor.name
+        client_streaming, server_streaming = get_method_streaming(method_descriptor)
+        if client_streaming:
+            continue
+        make_method = make_grpc_unary_stream_method if server_streaming else make_grpc_unary_method
+        method_callable = make_method(
+            channel, service_name, method_descriptor, symbol_database_instance
+        )
+        method_route = "{}/{}".format(json_service_path, method_name)
+        limiter = AsyncRouteConcurrencyLimiter(
+            method_route, method_concurrency_limits.get(method_name, concurrency_limit)
+        )
+        handler = _RouteHandler(
+            method_callable,
+            method_descriptor.input_type,
+            symbol_database_instance,
+            server_streaming,
+            limiter,
+            timeout_header,
+            default_timeout,
+            retry_after,
+        )
+        asgi_app.add_route(method_route, handler)
+
+
+def map_and_mount_remote_server(
+    asgi_app, channel, service_name, json_service_path, reflection_channel, **kwargs
+):
+    # type (GrpcAsgiApp, aio.Channel, str, str, Channel, **Any) -> None
+    """Mount a remote service onto the ASGI app.
+
+    Args:
+        asgi_app: GrpcAsgiApp
+        channel: grpc.aio channel, created by the event loop serving the app
+        service_name: service name
+        json_service_path: json_service_path
+        reflection_channel: blocking grpc channel to the same server, used once to load the
+            descriptors of its services through reflection
+        kwargs: optional keyword arguments of map_and_mount, e.g. concurrency_limit
+    """
+    descriptor_pool_instance, symbol_database_instance = build_database_from_channel(
+        reflection_channel
+    )
+    return map_and_mount(
+        asgi_app,
+        channel,
+        service_name,
+        json_service_path,
+        descriptor_pool_instance=descriptor_pool_instance,
+        symbol_database_instance=symbol_database_instance,
+        **kwargs
+    )
+
+
+def make_asgi_app(channel, service_name, json_service_path, **kwargs):
+    # type (aio.Channel, str, str, **Any) -> GrpcAsgiApp
+    """Make an ASGI app serving the methods of a service.
+
+    Args:
+        channel: grpc.aio channel, created by the event loop serving the app
+        service_name: service name
+        json_service_path: json_service_path
+        kwargs: optional keyword arguments of map_and_mount, e.g. concurrency_limit
+
+    Returns:
+        GrpcAsgiApp, on which more services can be mounted
+    """
+    asgi_app = GrpcAsgiApp()
+    map_and_mount(asgi_app, channel, service_name, json_service_path, **kwargs)
+    return asgi_app
@@ -1,18 +1,89 @@
 # Copyright 2020-present Kensho Technologies, LLC.
 """Generic code that allows mounting grpc service calls on "REST" passthroughs"""
+import hashlib
+import json
+from timeit import default_timer
 
 import flask
 from google.protobuf import descriptor_pool, json_format, symbol_database
+from google.protobuf.message import DecodeError
+import grpc
+from grpc_reflection.v1alpha import reflection, reflection_pb2_grpc
 
 # Fetch a selected set of primitive types for which the protodict clean up involves
 # a flattening of the namespace.
-from eagr.grpc_utils.method import make_grpc_unary_method
-from eagr.grpc_utils.response_translation import translate_message_to_dict
-from eagr.reflection.reflection_descriptor_database import build_database_from_channel
+from eagr.flask_bridge.compression import compress_responses
+from eagr.flask_bridge.concurrency import RouteConcurrencyLimiter
+from eagr.flask_bridge.http_get import http_template_to_flask_route, make_input_dict
+from eagr.flask_bridge.response_cache import ResponseCache
+from eagr.flask_bridge.timing import (
+    STAGE_CALL,
+    STAGE_DECODE,
+    STAGE_ENCODE,
+    STAGE_QUEUE,
+    STAGE_TO_MESSAGE,
+    StageTimer,
+)
+from eagr.grpc_utils.json_encoding import message_to_clean_value, message_to_json_bytes
+from eagr.grpc_utils.method import (
+    get_http_get_template,
+    get_method_streaming,
+    make_grpc_unary_bytes_method,
+    make_grpc_unary_method,
+    make_grpc_unary_stream_method,
+)
+from eagr.reflection.reflection_descriptor_database import (
+    build_database_from_channel,
+    build_database_from_stub,
+    get_service_names,
+)
 
 
-def dict_to_grpc_method_handler(method, input_type, input_dict, symbol_database_instance):
-    # type (Callable, MessageDescriptor, Dict[str, Any], Any) -> Dict
+# HTTP header carrying the time in seconds the caller is willing to wait for the response
+DEFAULT_TIMEOUT_HEADER = "X-Request-Timeout"
+# Seconds after which callers are asked to retry requests shed by a saturated route
+DEFAULT_RETRY_AFTER_SECONDS = 1
+JSON_MIMETYPE = "application/json"
+# Content type of serialized protobuf requests and responses
+PROTOBUF_MIMETYPE = "application/x-protobuf"
+# Content type of streamed responses: one JSON message per line
+NDJSON_MIMETYPE = "application/x-ndjson"
+# Name of the route of a service taking a batch of calls to its unary methods
+BATCH_ROUTE_NAME = "_batch"
+# Maximum number of calls in a batch
+DEFAULT_MAX_BATCH_SIZE = 50
+
+
+def make_input_message(input_type, input_dict, symbol_database_instance):
+    # type (MessageDescriptor, Dict[str, Any], Any) -> Message
+    """Convert the dict payload of a request into the input protobuf of a method
+
+    Raises json_format.ParseError if the payload does not match the input message.
+    """
+    # Note that this is smart enough to process even well-known types e.g. StringValue
+    input_prototype = symbol_database_instance.GetPrototype(input_type)
+    input_message = input_prototype()
+    try:
+        json_format.ParseDict(input_dict, input_message)
+    except TypeError as exc:
+        # e.g. a number where the message expects a JSON object
+        raise json_format.ParseError(
+            "Invalid value for message {}: {}".format(input_type.full_name, exc)
+        )
+    return input_message
+
+
+def _call_with_dict(method, input_type, input_dict, symbol_database_instance, timeout=None):
+    # type (Callable, MessageDescriptor, Dict[str, Any], Any, Optional[float]) -> Any
+    """Invoke method by converting dict payload into protobuf, returning what the method returns"""
+    input_message = make_input_message(input_type, input_dict, symbol_database_instance)
+    return method(input_message, timeout=timeout)
+
+
+def dict_to_grpc_method_handler(
+    method, input_type, input_dict, symbol_database_instance, timeout=None
+):
+    # type (Callable, MessageDescriptor, Dict[str, Any], Any, Optional[float]) -> Dict
     """Invoke method identified by method_name of stub by converting dict payload into protobuf.
 
     Can handle only methods that accept a single protobuf as an input and produce a single
@@ -24,37 +95,482 @@ def dict_to_grpc_method_handler(method, input_type, input_dict, symbol_database_
         input_dict: dictionary containing input data (that can be converted into proto using
             json_format.ParseDict)
         symbol_database_instance: symbol_database_instance
+        timeout: optional timeout of the grpc call in seconds
 
     Returns:
         dict containing the response
     """
-    # Note that this is smart enough to process even well-known types e.g. StringValue
-    input_prototype = symbol_database_instance.GetPrototype(input_type)
-    input_message = input_prototype()
-    json_format.ParseDict(input_dict, input_message)
-    response_as_message = method(input_message)
-    response_as_dict = translate_message_to_dict(response_as_message)
-    return response_as_dict
+    response_as_message = _call_with_dict(
+        method, input_type, input_dict, symbol_database_instance, timeout=timeout
+    )
+    return message_to_clean_value(response_as_message, symbol_database_instance.pool)
+
+
+def _error_response(status, message, headers=None):
+    """Make a JSON error response"""
+    return flask.json.jsonify({"error": message}), status, headers or {}
 
 
-def make_flask_dict_handler(method, func_name, input_type, symbol_database_instance):
-    # type (Channel, str, MessageDescriptor, Any) -> Callable
+def parse_request_timeout(header_value, default_timeout):
+    # type (Optional[str], Optional[float]) -> Optional[float]
+    """Get the timeout of a request from the value of its timeout header, or the default timeout
+
+    Returns:
+        the shorter of the two timeouts in seconds or None, raising ValueError if the header value
+        is malformed
+    """
+    timeout = default_timeout
+    if header_value is not None:
+        header_timeout = float(header_value)
+        if not header_timeout >= 0:
+            raise ValueError("Negative or invalid timeout {}".format(header_value))
+        if timeout is None or header_timeout < timeout:
+            timeout = header_timeout
+    return timeout
+
+
+def _get_request_timeout(timeout_header, default_timeout):
+    """Get the timeout of the flask request from its header, or the default timeout"""
+    header_value = flask.request.headers.get(timeout_header) if timeout_header else None
+    return parse_request_timeout(header_value, default_timeout)
+
+
+def _accepts_protobuf():
+    """Whether the flask request prefers protobuf responses to JSON ones"""
+    best_match = flask.request.accept_mimetypes.best_match((JSON_MIMETYPE, PROTOBUF_MIMETYPE))
+    return best_match == PROTOBUF_MIMETYPE
+
+
+def make_flask_dict_handler(
+    method,
+    func_name,
+    input_type,
+    symbol_database_instance,
+    limiter=None,
+    timeout_header=DEFAULT_TIMEOUT_HEADER,
+    default_timeout=None,
+    retry_after=DEFAULT_RETRY_AFTER_SECONDS,
+    bytes_method=None,
+    route=None,
+    server_timing=False,
+):
+    # type (Channel, str, MessageDescriptor, Any, Any, str, Optional[float], int, Callable, Optional[str], bool) -> Callable
     """Make a flask handler for the method.
 
+    Requests are shed with a 503 when the limiter has no slot for them, and calls that exceed
+    their deadline are answered with a 504. Requests whose body does not match the input message
+    are answered with a 400 before taking a slot.
+
+    Given bytes_method, requests can also be sent as serialized protobuf with the
+    application/x-protobuf content type, and responses asked for in that content type with the
+    Accept header. Serialized protobuf is passed through without any JSON conversion.
+
+    The stages of handling requests (see timing) are timed in the bridge_request_stage histogram,
+    and the sizes of request and response bodies recorded in the bridge_request_bytes and
+    bridge_response_bytes histograms.
+
     Args:
         method: method
         func_name: function name.
         input_type: type of input
         symbol_database_instance: symbol db instance
+        limiter: optional RouteConcurrencyLimiter of the route
+        timeout_header: optional name of the HTTP header carrying the request timeout in seconds,
+            which becomes the deadline of the grpc call. None to ignore request timeouts
+        default_timeout: optional timeout in seconds for requests without a (shorter) timeout
+        retry_after: value of the Retry-After header of shed requests, in seconds
+        bytes_method: optional method taking and returning serialized protobuf, see
+            method.make_grpc_unary_bytes_method
+        route: optional route label of the metrics, which are only recorded given one
+        server_timing: whether to send the durations of the stages in a Server-Timing header
+    """
+    input_prototype = symbol_database_instance.GetPrototype(input_type)
+
+    def method_handler():
+        """Method handler."""
+        started_at = default_timer()
+        timer = StageTimer(route)
+        protobuf_request = bytes_method is not None and flask.request.mimetype == PROTOBUF_MIMETYPE
+        protobuf_response = bytes_method is not None and _accepts_protobuf()
+        # Malformed requests are rejected before they take a slot of the limiter
+        try:
+            timeout = _get_request_timeout(timeout_header, default_timeout)
+            if protobuf_request:
+                call_input = flask.request.get_data()
+            else:
+                with timer.stage(STAGE_DECODE):
+                    input_dict = flask.request.get_json()
+            if protobuf_response:
+                # Serialized protobuf is passed to and from the service as is
+                call = bytes_method
+                with timer.stage(STAGE_TO_MESSAGE):
+                    if protobuf_request:
+                        # Parsed only to reject malformed bodies, the bytes are sent as they are
+                        input_prototype.FromString(call_input)
+                    else:
+                        call_input = make_input_message(
+                            input_type, input_dict, symbol_database_instance
+                        ).SerializeToString()
+            else:
+                call = method
+                with timer.stage(STAGE_TO_MESSAGE):
+                    if protobuf_request:
+                        call_input = input_prototype.FromString(call_input)
+                    else:
+                        call_input = make_input_message(
+                            input_type, input_dict, symbol_database_instance
+                        )
+        except (ValueError, json_format.ParseError, DecodeError) as exc:
+            return _error_response(400, str(exc))
+
+        if limiter is not None:
+            with timer.stage(STAGE_QUEUE):
+                acquired = limiter.acquire(timeout)
+            if not acquired:
+                return _error_response(
+                    503, "Too many concurrent requests", {"Retry-After": str(retry_after)}
+                )
+        try:
+            if timeout is not None:
+                # Time spent waiting for a slot counts against the deadline
+                timeout = max(timeout - (default_timer() - started_at), 0)
+            try:
+                with timer.stage(STAGE_CALL):
+                    response = call(call_input, timeout=timeout)
+            except grpc.RpcError as exc:
+                if exc.code() is grpc.StatusCode.DEADLINE_EXCEEDED:
+                    return _error_response(504, "Deadline exceeded")
+                raise
+
+            if protobuf_response:
+                body, mimetype = response, PROTOBUF_MIMETYPE
+            else:
+                # The response is encoded in one pass, with the shape of translate_message_to_dict
+                with timer.stage(STAGE_ENCODE):
+                    body = message_to_json_bytes(response, symbol_database_instance.pool)
+                mimetype = JSON_MIMETYPE
+            flask_response = flask.Response(body, mimetype=mimetype)
+            if bytes_method is not None:
+                flask_response.vary.add("Accept")
+            timer.record_sizes(len(flask.request.get_data()), len(body))
+            if server_timing:
+                flask_response.headers["Server-Timing"] = timer.server_timing()
+            return flask_response
+        finally:
+            if limiter is not None:
+                limiter.release()
+
+    method_handler.__name__ = func_name
+    return method_handler
+
+
+def make_flask_get_handler(
+    method,
+    func_name,
+    input_type,
+    symbol_database_instance,
+    path_fields=None,
+    cache=None,
+    limiter=None,
+    timeout_header=DEFAULT_TIMEOUT_HEADER,
+    default_timeout=None,
+    retry_after=DEFAULT_RETRY_AFTER_SECONDS,
+):
+    # type (Channel, str, MessageDescriptor, Any, Dict[str, str], Any, Any, str, Optional[float], int) -> Callable
+    """Make a flask handler for GET requests to a read-only method.
+
+    The input message is made of the query parameters and the variables of the route (see
+    http_get.make_input_dict). Responses carry a strong ETag computed from the serialized response,
+    and conditional requests whose If-None-Match matches it are answered with a 304. Responses
+    found in the cache are served without calling the method, or taking a slot of the limiter.
+
+    Args:
+        method: unary method
+        func_name: function name.
+        input_type: type of input
+        symbol_database_instance: symbol db instance
+        path_fields: optional dict of the variables of the route to the field paths they set
+        cache: optional ResponseCache of the route. Its TTL is also sent as the max-age of the
+            Cache-Control header, which is no-cache otherwise
+        limiter: optional RouteConcurrencyLimiter of the route
+        timeout_header: optional name of the HTTP header carrying the request timeout in seconds,
+            which becomes the deadline of the grpc call. None to ignore request timeouts
+        default_timeout: optional timeout in seconds for requests without a (shorter) timeout
+        retry_after: value of the Retry-After header of shed requests, in seconds
+    """
+    path_fields = path_fields or {}
+    cache_control = "no-cache" if cache is None else "max-age={}".format(int(cache.ttl))
+
+    def method_handler(**path_values):
+        """Method handler."""
+        started_at = default_timer()
+        try:
+            timeout = _get_request_timeout(timeout_header, default_timeout)
+            input_dict = make_input_dict(
+                input_type,
+                flask.request.args,
+                {path_fields[variable]: value for variable, value in path_values.items()},
+            )
+            input_message = make_input_message(input_type, input_dict, symbol_database_instance)
+        except (ValueError, json_format.ParseError) as exc:
+            return _error_response(400, str(exc))
+
+        cache_key = input_message.SerializeToString(deterministic=True)
+        cached = cache.get(cache_key) if cache is not None else None
+        if cached is None:
+            if limiter is not None and not limiter.acquire(timeout):
+                return _error_response(
+                    503, "Too many concurrent requests", {"Retry-After": str(retry_after)}
+                )
+            try:
+                if timeout is not None:
+                    timeout = max(timeout - (default_timer() - started_at), 0)
+                try:
+                    response = method(input_message, timeout=timeout)
+                except grpc.RpcError as exc:
+                    if exc.code() is grpc.StatusCode.DEADLINE_EXCEEDED:
+                        return _error_response(504, "Deadline exceeded")
+                    raise
+            finally:
+                if limiter is not None:
+                    limiter.release()
+            etag = hashlib.sha256(response.SerializeToString(deterministic=True)).hexdigest()
+            cached = (message_to_json_bytes(response, symbol_database_instance.pool), etag)
+            if cache is not None:
+                cache.put(cache_key, cached)
+
+        body, etag = cached
+        flask_response = flask.Response(body, mimetype=JSON_MIMETYPE)
+        flask_response.set_etag(etag)
+        flask_response.headers["Cache-Control"] = cache_control
+        return flask_response.make_conditional(flask.request)
+
+    method_handler.__name__ = func_name
+    return method_handler
+
+
+def _encode_call_error(code_name, message):
+    """Encode the error of a call that is part of a larger response as a JSON object"""
+    error = {"code": code_name, "error": message}
+    return json.dumps(error, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+
+def _iter_ndjson_lines(first_response, responses, descriptor_pool_instance):
+    """Encode the responses of a stream as lines of JSON, as they arrive
+
+    The next response is only read from the stream once the previous line was written out, so
+    that slow HTTP clients slow the grpc stream down through its flow control. An error of the
+    stream is written as a last line of the form {"code": ..., "error": ...}, since the status of
+    the HTTP response has been sent already.
+    """
+    if first_response is None:
+        return
+    yield message_to_json_bytes(first_response, descriptor_pool_instance) + b"\n"
+    try:
+        for response in responses:
+            yield message_to_json_bytes(response, descriptor_pool_instance) + b"\n"
+    except grpc.RpcError as exc:
+        yield _encode_call_error(exc.code().name, exc.details()) + b"\n"
+
+
+def make_flask_stream_handler(
+    method,
+    func_name,
+    input_type,
+    symbol_database_instance,
+    limiter=None,
+    timeout_header=DEFAULT_TIMEOUT_HEADER,
+    default_timeout=None,
+    retry_after=DEFAULT_RETRY_AFTER_SECONDS,
+):
+    # type (Channel, str, MessageDescriptor, Any, Any, str, Optional[float], int) -> Callable
+    """Make a flask handler for a method streaming its responses.
+
+    The responses are sent as a chunked response of newline-delimited JSON, one line per message
+    as it arrives, so that large result sets are never held in memory. The status of the response
+    is decided by the first message: errors before it are answered like those of unary methods,
+    later ones end the stream with an error line. The request timeout is the deadline of the
+    whole stream, and the route's concurrency slot is held until the stream is closed.
+
+    Args:
+        method: unary-stream method
+        func_name: function name.
+        input_type: type of input
+        symbol_database_instance: symbol db instance
+        limiter: optional RouteConcurrencyLimiter of the route
+        timeout_header: optional name of the HTTP header carrying the request timeout in seconds,
+            which becomes the deadline of the grpc call. None to ignore request timeouts
+        default_timeout: optional timeout in seconds for requests without a (shorter) timeout
+        retry_after: value of the Retry-After header of shed requests, in seconds
     """
 
     def method_handler():
         """Method handler."""
-        input_dict = flask.request.get_json()
-        response = dict_to_grpc_method_handler(
-            method, input_type, input_dict, symbol_database_instance
+        started_at = default_timer()
+        try:
+            timeout = _get_request_timeout(timeout_header, default_timeout)
+        except ValueError as exc:
+            return _error_response(400, str(exc))
+
+        if limiter is not None and not limiter.acquire(timeout):
+            return _error_response(
+                503, "Too many concurrent requests", {"Retry-After": str(retry_after)}
+            )
+        # Once the response is returned, closing it releases the slot
+        release_slot = limiter is not None
+        try:
+            if timeout is not None:
+                timeout = max(timeout - (default_timer() - started_at), 0)
+            input_dict = flask.request.get_json()
+            responses = _call_with_dict(
+                method, input_type, input_dict, symbol_database_instance, timeout=timeout
+            )
+            try:
+                first_response = next(responses, None)
+            except grpc.RpcError as exc:
+                if exc.code() is grpc.StatusCode.DEADLINE_EXCEEDED:
+                    return _error_response(504, "Deadline exceeded")
+                raise
+            response = flask.Response(
+                _iter_ndjson_lines(first_response, responses, symbol_database_instance.pool),
+                mimetype=NDJSON_MIMETYPE,
+            )
+            # Clients going away before the end of the stream cancel the call
+            response.call_on_close(responses.cancel)
+            if limiter is not None:
+                response.call_on_close(limiter.release)
+                release_slot = False
+            return response
+        finally:
+            if release_slot:
+                limiter.release()
+
+    method_handler.__name__ = func_name
+    return method_handler
+
+
+def _start_batch_call(methods, entry, symbol_database_instance, timeout):
+    """Start the call of a batch entry
+
+    Returns:
+        tuple of the future of the call and the encoded error of the entry, one of them None
+    """
+    if not isinstance(entry, dict) or not isinstance(entry.get("method"), str):
+        return None, _encode_call_error("INVALID_ARGUMENT", "Entries need a method name")
+    method_name = entry["method"]
+    if method_name not in methods:
+        return None, _encode_call_error("NOT_FOUND", "No unary method {}".format(method_name))
+    method, input_type, limiter = methods[method_name]
+    try:
+        input_message = make_input_message(
+            input_type, entry.get("body") or {}, symbol_database_instance
+        )
+    except json_format.ParseError as exc:
+        return None, _encode_call_error("INVALID_ARGUMENT", str(exc))
+    # Entries do not wait for a slot, since the batch may already hold others
+    if limiter is not None and not limiter.acquire(0):
+        return None, _encode_call_error(
+            "RESOURCE_EXHAUSTED", "Too many concurrent requests to {}".format(method_name)
         )
-        return flask.json.jsonify(response)
+    try:
+        future = method.future(input_message, timeout=timeout)
+    except BaseException:
+        if limiter is not None:
+            limiter.release()
+        raise
+    if limiter is not None:
+        future.add_done_callback(lambda _: limiter.release())
+    return future, None
+
+
+def make_flask_batch_handler(
+    methods,
+    func_name,
+    symbol_database_instance,
+    max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+    limiter=None,
+    timeout_header=DEFAULT_TIMEOUT_HEADER,
+    default_timeout=None,
+    retry_after=DEFAULT_RETRY_AFTER_SECONDS,
+):
+    # type (Dict[str, Tuple[Callable, MessageDescriptor]], str, Any, int, Any, str, Optional[float], int) -> Callable
+    """Make a flask handler for batches of calls to unary methods.
+
+    The request is a JSON array of {"method": ..., "body": ...} entries. All calls are started
+    at once, and the response is the array of their outcomes in the same order: {"response": ...}
+    for calls that succeeded and {"code": ..., "error": ...} for the others. The request timeout
+    is the deadline of every call of the batch. Batches of more than max_batch_size calls are
+    answered with a 413.
+
+    Every call takes a slot of its method's limiter, like a request to the method's route would.
+    Calls finding no free slot fail with RESOURCE_EXHAUSTED instead of waiting for one.
+
+    Args:
+        methods: dict of method name to a tuple of its unary method, its input type and the
+            optional RouteConcurrencyLimiter of its route
+        func_name: function name.
+        symbol_database_instance: symbol db instance
+        max_batch_size: maximum number of calls in a batch
+        limiter: optional RouteConcurrencyLimiter of the route, for which a batch is one request
+        timeout_header: optional name of the HTTP header carrying the request timeout in seconds,
+            which becomes the deadline of the grpc calls. None to ignore request timeouts
+        default_timeout: optional timeout in seconds for requests without a (shorter) timeout
+        retry_after: value of the Retry-After header of shed requests, in seconds
+    """
+
+    def method_handler():
+        """Method handler."""
+        started_at = default_timer()
+        try:
+            timeout = _get_request_timeout(timeout_header, default_timeout)
+        except ValueError as exc:
+            return _error_response(400, str(exc))
+        entries = flask.request.get_json()
+        if not isinstance(entries, list):
+            return _error_response(400, "Batches must be arrays of calls")
+        if len(entries) > max_batch_size:
+            return _error_response(
+                413,
+                "Batch of {} calls exceeds the limit of {}".format(len(entries), max_batch_size),
+            )
+
+        if limiter is not None and not limiter.acquire(timeout):
+            return _error_response(
+                503, "Too many concurrent requests", {"Retry-After": str(retry_after)}
+            )
+        try:
+            if timeout is not None:
+                timeout = max(timeout - (default_timer() - started_at), 0)
+            calls = []
+            try:
+                for entry in entries:
+                    calls.append(
+                        _start_batch_call(methods, entry, symbol_database_instance, timeout)
+                    )
+            except BaseException:
+                # Nobody would wait for the calls already started
+                for future, _ in calls:
+                    if future is not None:
+                        future.cancel()
+                raise
+            results = []
+            for future, error in calls:
+                if future is not None:
+                    try:
+                        response = future.result()
+                    except grpc.RpcError as exc:
+                        error = _encode_call_error(exc.code().name, exc.details())
+                    else:
+                        encoded_response = message_to_json_bytes(
+                            response, symbol_database_instance.pool
+                        )
+                        results.append(b'{"response":' + encoded_response + b"}")
+                        continue
+                results.append(error)
+            return flask.Response(b"[" + b",".join(results) + b"]", mimetype=JSON_MIMETYPE)
+        finally:
+            if limiter is not None:
+                limiter.release()
 
     method_handler.__name__ = func_name
     return method_handler
@@ -67,10 +583,29 @@ def map_and_mount(
     json_service_path,
     descriptor_pool_instance=None,
     symbol_database_instance=None,
+    concurrency_limit=None,
+    method_concurrency_limits=None,
+    timeout_header=DEFAULT_TIMEOUT_HEADER,
+    default_timeout=None,
+    retry_after=DEFAULT_RETRY_AFTER_SECONDS,
+    enable_batch_route=False,
+    max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+    get_routes=None,
+    enable_http_annotations=False,
+    response_cache_ttl=None,
+    enable_protobuf=True,
+    endpoint_prefix="",
+    server_timing=False,
+    response_compression=None,
 ):
-    # type (flask.Flask, Channel, str, str, Any, Any) -> None
+    # type (flask.Flask, Channel, str, str, Any, Any, Any, Dict, str, Optional[float], int, bool, int, Dict[str, str], bool, Optional[float], bool, str, bool, Any) -> None
     """Mount all json passthrough methods on specific path.
 
+    Unary methods answer with a JSON object, and methods streaming their responses with
+    newline-delimited JSON (see make_flask_stream_handler). Methods streaming their requests are
+    not mounted. All routes share the channel. The requests in flight are counted per route in
+    the bridge_in_flight_requests gauge.
+
     Args:
         flask_app: flask app
         channel: grpc channel
@@ -78,27 +613,141 @@ def map_and_mount(
         json_service_path: jsons service path
         descriptor_pool_instance: descriptor pool instance
         symbol_database_instance: symbol db instance
+        concurrency_limit: optional concurrency.ConcurrencyLimit of every route. Requests beyond
+            the limit wait in a bounded queue, and are answered with a 503 and a Retry-After
+            header when the queue is full or they waited too long
+        method_concurrency_limits: optional dict of method name to ConcurrencyLimit, overriding
+            concurrency_limit for that method. None disables the limit for the method
+        timeout_header: optional name of the HTTP header carrying the request timeout in seconds,
+            which becomes the deadline of the grpc call. None to ignore request timeouts
+        default_timeout: optional timeout in seconds for requests without a (shorter) timeout
+        retry_after: value of the Retry-After header of shed requests, in seconds
+        enable_batch_route: whether to also mount {json_service_path}/_batch, taking batches of
+            calls to the unary methods that are made concurrently (see make_flask_batch_handler).
+            Its concurrency limit can be given in method_concurrency_limits as "_batch"
+        max_batch_size: maximum number of calls in a batch
+        get_routes: optional dict of the names of read-only unary methods to the google.api.http
+            path templates of their GET routes, e.g. {"GetBook": "/books/{id}"}, which are mounted
+            under json_service_path (see make_flask_get_handler)
+        enable_http_annotations: whether to also mount GET routes for the unary methods with a
+            GET binding in their google.api.http option, under json_service_path
+        response_cache_ttl: optional time in seconds the responses of GET routes are cached
+        enable_protobuf: whether the POST routes of unary methods also take and return serialized
+            protobuf (application/x-protobuf), passed through without JSON conversion
+        endpoint_prefix: prefix of the flask endpoint names of the routes, which are otherwise
+            named after the methods. Services with methods of the same name mounted on the same app
+            need distinct prefixes
+        server_timing: whether the POST routes of unary methods send the durations of the stages
+            of handling requests in a Server-Timing header, e.g. for browser devtools
+        response_compression: optional compression.ResponseCompression, to compress the responses
+            of all routes with gzip for requests accepting it. Streamed responses are compressed
+            incrementally
     """
+
+    def mount(route, http_method, endpoint, handler):
+        """Mount the handler on the route, compressing its responses if enabled"""
+        if response_compression is not None:
+            handler = compress_responses(handler, route, response_compression)
+        flask_app.route(route, methods=[http_method], endpoint=endpoint_prefix + endpoint)(handler)
+
+    method_concurrency_limits = method_concurrency_limits or {}
+    get_routes = get_routes or {}
+    unary_methods = {}
     if descriptor_pool_instance is None:
         descriptor_pool_instance = descriptor_pool.Default()
     if symbol_database_instance is None:
         symbol_database_instance = symbol_database.Default()
     service_descriptor = descriptor_pool_instance.FindServiceByName(service_name)
+    unknown_get_methods = set(get_routes) - set(service_descriptor.methods_by_name)
+    if unknown_get_methods:
+        raise ValueError("Unknown methods with GET routes: {}".format(sorted(unknown_get_methods)))
+    # Validated before mounting anything, so that a bad GET route does not leave the app with
+    # some of the service's routes
+    for method_name in get_routes:
+        method_descriptor = service_descriptor.methods_by_name[method_name]
+        if any(get_method_streaming(method_descriptor)):
+            raise ValueError("GET routes need unary methods, {} is not".format(method_name))
     for method_descriptor in service_descriptor.methods:
         method_name = method_descriptor.name
-        method_callable = make_grpc_unary_method(
+        client_streaming, server_streaming = get_method_streaming(method_descriptor)
+        if client_streaming:
+            continue
+        if server_streaming:
+            make_method, make_handler = make_grpc_unary_stream_method, make_flask_stream_handler
+        else:
+            make_method, make_handler = make_grpc_unary_method, make_flask_dict_handler
+        method_callable = make_method(
             channel, service_name, method_descriptor, symbol_database_instance
         )
         input_type = method_descriptor.input_type
-        method_handler = make_flask_dict_handler(
-            method_callable, method_name, input_type, symbol_database_instance
-        )
         method_route = "{}/{}".format(json_service_path, method_name)
-        flask_app.route(method_route, methods=["POST"])(method_handler)
+        handler_kwargs = {}
+        if not server_streaming:
+            handler_kwargs.update(route=method_route, server_timing=server_timing)
+            if enable_protobuf:
+                handler_kwargs["bytes_method"] = make_grpc_unary_bytes_method(
+                    channel, service_name, method_descriptor
+                )
+        limiter = RouteConcurrencyLimiter(
+            method_route, method_concurrency_limits.get(method_name, concurrency_limit)
+        )
+        if not server_streaming:
+            # Calls of the batch route share the limit of the method
+            unary_methods[method_name] = (method_callable, input_type, limiter)
+        method_handler = make_handler(
+            method_callable,
+            method_name,
+            input_type,
+            symbol_database_instance,
+            limiter=limiter,
+            timeout_header=timeout_header,
+            default_timeout=default_timeout,
+            retry_after=retry_after,
+            **handler_kwargs
+        )
+        mount(method_route, "POST", method_name, method_handler)
 
+        get_template = get_routes.get(method_name)
+        if get_template is None and enable_http_annotations and not server_streaming:
+            get_template = get_http_get_template(method_descriptor)
+        if get_template is not None:
+            route, path_fields = http_template_to_flask_route(get_template)
+            get_route = json_service_path + route
+            get_handler = make_flask_get_handler(
+                method_callable,
+                "{}_get".format(method_name),
+                input_type,
+                symbol_database_instance,
+                path_fields=path_fields,
+                cache=ResponseCache(get_route, response_cache_ttl) if response_cache_ttl else None,
+                # GET and POST requests to the method share its limit
+                limiter=limiter,
+                timeout_header=timeout_header,
+                default_timeout=default_timeout,
+                retry_after=retry_after,
+            )
+            mount(get_route, "GET", get_handler.__name__, get_handler)
 
-def map_and_mount_remote_server(flask_app, channel, service_name, json_service_path):
-    # type (flask.Flask, Channel, str, str) -> None
+    if enable_batch_route:
+        batch_route = "{}/{}".format(json_service_path, BATCH_ROUTE_NAME)
+        limiter = RouteConcurrencyLimiter(
+            batch_route, method_concurrency_limits.get(BATCH_ROUTE_NAME, concurrency_limit)
+        )
+        batch_handler = make_flask_batch_handler(
+            unary_methods,
+            BATCH_ROUTE_NAME,
+            symbol_database_instance,
+            max_batch_size=max_batch_size,
+            limiter=limiter,
+            timeout_header=timeout_header,
+            default_timeout=default_timeout,
+            retry_after=retry_after,
+        )
+        mount(batch_route, "POST", BATCH_ROUTE_NAME, batch_handler)
+
+
+def map_and_mount_remote_server(flask_app, channel, service_name, json_service_path, **kwargs):
+    # type (flask.Flask, Channel, str, str, **Any) -> None
     """Mount a remote service onto the flask app.
 
     Args:
@@ -106,6 +755,7 @@ def map_and_mount_remote_server(flask_app, channel, service_name, json_service_p
         channel: grpc channel
         service_name: service name
         json_service_path: json_service_path
+        kwargs: optional keyword arguments of map_and_mount, e.g. concurrency_limit
     """
     descriptor_pool_instance, symbol_database_instance = build_database_from_channel(channel)
     return map_and_mount(
@@ -115,4 +765,46 @@ def map_and_mount_remote_server(flask_app, channel, service_name, json_service_p
         json_service_path,
         descriptor_pool_instance=descriptor_pool_instance,
         symbol_database_instance=symbol_database_instance,
+        **kwargs
+    )
+
+
+def map_and_mount_remote_services(flask_app, channel, service_paths=None, root_path="", **kwargs):
+    # type (flask.Flask, Channel, Optional[Dict[str, str]], str, **Any) -> None
+    """Mount several services of a remote server onto the flask app.
+
+    The services share a single reflection pass over the channel, and the descriptor pool and
+    symbol database it builds, so that the prototype classes of their messages are made once.
+    Flask endpoints are named "{service name}.{method name}".
+
+    Args:
+        flask_app: flask_app
+        channel: grpc channel
+        service_paths: optional dict of the names of the services to mount to their json service
+            paths. By default, every service of the server but reflection is mounted on
+            "{root_path}/{service name}"
+        root_path: path under which services are mounted by default
+        kwargs: optional keyword arguments of map_and_mount applying to every service, e.g.
+            concurrency_limit
+    """
+    reflection_client = reflection_pb2_grpc.ServerReflectionStub(channel)
+    if service_paths is None:
+        service_paths = {
+            service_name: "{}/{}".format(root_path, service_name)
+            for service_name in get_service_names(reflection_client)
+            if service_name != reflection.SERVICE_NAME
+        }
+    descriptor_pool_instance, symbol_database_instance = build_database_from_stub(
+        reflection_client, service_names=list(service_paths)
     )
+    for service_name, json_service_path in service_paths.items():
+        map_and_mount(
+            flask_app,
+            channel,
+            service_name,
+            json_service_path,
+            descriptor_pool_instance=descriptor_pool_instance,
+            symbol_database_instance=symbol_database_instance,
+            endpoint_prefix=service_name + ".",
+            **kwargs
+        )
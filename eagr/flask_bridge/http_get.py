@@ -0,0 +1,115 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""Mapping of GET requests onto the input messages of bridged methods
+
+GET routes are given as google.api.http path templates, e.g. "/shelves/{shelf}/books/{book.id}".
+Variables of the path and query parameters set the fields of the input message named by their
+(dotted) field path. Repeated fields take every value of a repeated query parameter.
+"""
+import re
+
+from google.protobuf import descriptor
+
+
+_FieldDescriptor = descriptor.FieldDescriptor
+
+# Variable of a path template: {field.path} or {field.path=pattern}
+_TEMPLATE_VARIABLE_RE = re.compile(r"\{([\w.]+)(?:=([^}]*))?\}")
+
+_TRUE_VALUES = frozenset(("true", "1"))
+_FALSE_VALUES = frozenset(("false", "0"))
+
+
+def http_template_to_flask_route(template):
+    # type (str) -> Tuple[str, Dict[str, str]]
+    """Convert a google.api.http path template into a flask route.
+
+    Variables matching a single path segment become flask string variables, those whose pattern
+    spans segments (e.g. {name=shelves/*}) path variables.
+
+    Args:
+        template: path template
+
+    Returns:
+        tuple of the flask route and the dict of its variable names to the field paths they set
+    """
+    field_paths = {}
+
+    def replace_variable(match):
+        """Replace a variable of the template with a flask variable"""
+        field_path, pattern = match.groups()
+        variable = "var{}".format(len(field_paths))
+        field_paths[variable] = field_path
+        if pattern is not None and ("/" in pattern or "**" in pattern):
+            return "<path:{}>".format(variable)
+        return "<{}>".format(variable)
+
+    route = _TEMPLATE_VARIABLE_RE.sub(replace_variable, template)
+    if not route.startswith("/"):
+        route = "/" + route
+    return route, field_paths
+
+
+def _find_field(message_descriptor, name):
+    """Find a field of a message by name or JSON name"""
+    field = message_descriptor.fields_by_name.get(name)
+    if field is None:
+        field = next(
+            (field for field in message_descriptor.fields if field.json_name == name), None
+        )
+    return field
+
+
+def _convert_value(field, value):
+    """Convert the text of a parameter into the JSON value of a field"""
+    if field.cpp_type == _FieldDescriptor.CPPTYPE_BOOL:
+        if value.lower() in _TRUE_VALUES:
+            return True
+        if value.lower() in _FALSE_VALUES:
+            return False
+        raise ValueError("Invalid boolean {} for {}".format(value, field.name))
+    # Numbers, enums, bytes and well-known types all parse from their JSON string form
+    return value
+
+
+def _set_field_path(input_dict, message_descriptor, field_path, values):
+    """Set the field at the field path of the dict of a message from the texts of a parameter"""
+    names = field_path.split(".")
+    for name in names[:-1]:
+        field = _find_field(message_descriptor, name)
+        if (
+            field is None
+            or field.message_type is None
+            or field.label == _FieldDescriptor.LABEL_REPEATED
+        ):
+            raise ValueError("Unknown parameter {}".format(field_path))
+        input_dict = input_dict.setdefault(field.name, {})
+        message_descriptor = field.message_type
+    field = _find_field(message_descriptor, names[-1])
+    if field is None:
+        raise ValueError("Unknown parameter {}".format(field_path))
+    converted_values = [_convert_value(field, value) for value in values]
+    if field.label == _FieldDescriptor.LABEL_REPEATED:
+        input_dict[field.name] = converted_values
+    else:
+        input_dict[field.name] = converted_values[-1]
+
+
+def make_input_dict(input_type, query_args, path_fields):
+    # type (MessageDescriptor, MultiDict, Dict[str, str]) -> Dict[str, Any]
+    """Make the dict of the input message of a GET request, to parse with json_format.ParseDict.
+
+    Args:
+        input_type: message descriptor of the input message
+        query_args: MultiDict of the query parameters, e.g. flask.request.args
+        path_fields: dict of the field paths set by the path to their values
+
+    Returns:
+        dict of the input message, raising ValueError for unknown fields or invalid values
+    """
+    input_dict = {}
+    for field_path, values in query_args.lists():
+        _set_field_path(input_dict, input_type, field_path, values)
+    # Path variables win over query parameters
+    for field_path, value in path_fields.items():
+        _set_field_path(input_dict, input_type, field_path, [value])
+    return input_dict
@@ -0,0 +1,57 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""In-process cache of the responses of bridged GET routes"""
+import collections
+import threading
+from timeit import default_timer
+
+import prometheus_client
+
+
+BRIDGE_CACHE_COUNTER = prometheus_client.Counter(
+    "bridge_response_cache_lookups",
+    "Lookups of the response cache of bridged GET routes, by result (hit or miss)",
+    labelnames=("route", "result"),
+)
+
+DEFAULT_MAX_CACHE_ENTRIES = 1024
+
+
+class ResponseCache(object):
+    """Least recently used cache of the responses of a route, which expire after a TTL"""
+
+    def __init__(self, route, ttl, max_entries=DEFAULT_MAX_CACHE_ENTRIES):
+        """Initialize
+
+        Args:
+            route: route label for metrics
+            ttl: time in seconds responses are served from the cache
+            max_entries: maximum number of cached responses
+        """
+        self.ttl = ttl
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        # Key to (expiration time, value), from the least to the most recently used
+        self._entries = collections.OrderedDict()
+        self._hit_counter = BRIDGE_CACHE_COUNTER.labels(route, "hit")
+        self._miss_counter = BRIDGE_CACHE_COUNTER.labels(route, "miss")
+
+    def get(self, key):
+        """Get the cached value of the key, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > default_timer():
+                self._entries.move_to_end(key)
+                self._hit_counter.inc()
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+        self._miss_counter.inc()
+        return None
+
+    def put(self, key, value):
+        """Cache the value of the key for the TTL"""
+        with self._lock:
+            self._entries[key] = (default_timer() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
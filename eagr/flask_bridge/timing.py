@@ -0,0 +1,76 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""Per-stage latency and payload size metrics of bridged routes"""
+from contextlib import contextmanager
+from timeit import default_timer
+
+import prometheus_client
+
+
+BRIDGE_STAGE_HISTO = prometheus_client.Histogram(
+    "bridge_request_stage",
+    "Time spent by bridged routes in each stage of handling a request",
+    labelnames=("route", "stage"),
+)
+# From 64 bytes to 16MB, in powers of 4
+_SIZE_BUCKETS = tuple(64 * 4**exponent for exponent in range(10)) + (float("inf"),)
+BRIDGE_REQUEST_BYTES_HISTO = prometheus_client.Histogram(
+    "bridge_request_bytes",
+    "Size of the bodies of requests to bridged routes",
+    labelnames=("route",),
+    buckets=_SIZE_BUCKETS,
+)
+BRIDGE_RESPONSE_BYTES_HISTO = prometheus_client.Histogram(
+    "bridge_response_bytes",
+    "Size of the bodies of responses of bridged routes",
+    labelnames=("route",),
+    buckets=_SIZE_BUCKETS,
+)
+
+# Stages of handling a request
+STAGE_QUEUE = "queue"  # waiting for a slot of the route's concurrency limit
+STAGE_DECODE = "decode"  # decoding the JSON body into a dict
+STAGE_TO_MESSAGE = "to_message"  # making the input message of the dict or of serialized bytes
+STAGE_CALL = "call"  # grpc call
+STAGE_ENCODE = "encode"  # encoding the response message as JSON
+
+
+class StageTimer(object):
+    """Times the stages of handling a request"""
+
+    def __init__(self, route=None):
+        """Initialize
+
+        Args:
+            route: optional route label for metrics. Stages are only timed without one, e.g. for
+                the Server-Timing header
+        """
+        self._route = route
+        # List of (stage, duration in seconds), in order
+        self.durations = []
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage"""
+        started_at = default_timer()
+        try:
+            yield
+        finally:
+            self.record(name, default_timer() - started_at)
+
+    def record(self, name, duration):
+        """Record the duration in seconds of a stage"""
+        self.durations.append((name, duration))
+        if self._route is not None:
+            BRIDGE_STAGE_HISTO.labels(self._route, name).observe(duration)
+
+    def record_sizes(self, request_bytes, response_bytes):
+        """Record the sizes in bytes of the request and response bodies"""
+        if self._route is not None:
+            BRIDGE_REQUEST_BYTES_HISTO.labels(self._route).observe(request_bytes)
+            BRIDGE_RESPONSE_BYTES_HISTO.labels(self._route).observe(response_bytes)
+
+    def server_timing(self):
+        """Get the value of a Server-Timing header with the durations of the stages"""
+        return ", ".join(
+            "{};dur={:.3f}".format(name, duration * 1000) for name, duration in self.durations
+        )
@@ -0,0 +1,474 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""Single-pass translation of protobuf messages into clean JSON
+
+The output has the same shape as response_translation.translate_message_to_dict: default field
+values are included and Any values holding a single value are flattened into that value. It is
+produced by walking the message once, instead of building the dict of MessageToDict and cleaning
+it in a second pass. Object keys are sorted, as flask.json.jsonify sorts them.
+
+How each field is translated is worked out once per message type, so that repeated scalar fields
+are translated with a single map over their values.
+"""
+import base64
+import collections
+from json.encoder import encode_basestring_ascii
+import math
+
+from google.protobuf import descriptor, symbol_database
+from google.protobuf.internal import type_checkers
+
+from eagr.grpc_utils.response_translation import TYPE_KEY
+
+
+_FieldDescriptor = descriptor.FieldDescriptor
+
+_WRAPPER_TYPES = frozenset(
+    "google.protobuf.{}".format(name)
+    for name in (
+        "BoolValue",
+        "BytesValue",
+        "DoubleValue",
+        "FloatValue",
+        "Int32Value",
+        "Int64Value",
+        "StringValue",
+        "UInt32Value",
+        "UInt64Value",
+    )
+)
+_STRING_TYPES = frozenset(
+    ("google.protobuf.Duration", "google.protobuf.FieldMask", "google.protobuf.Timestamp")
+)
+_ANY_TYPE = "google.protobuf.Any"
+_STRUCT_TYPE = "google.protobuf.Struct"
+_LIST_VALUE_TYPE = "google.protobuf.ListValue"
+_VALUE_TYPE = "google.protobuf.Value"
+# Types that an Any holds as a single value rather than as fields
+_SINGLE_VALUE_TYPES = (
+    _WRAPPER_TYPES
+    | _STRING_TYPES
+    | frozenset((_ANY_TYPE, _STRUCT_TYPE, _LIST_VALUE_TYPE, _VALUE_TYPE))
+)
+
+# Ways a field appears in the output
+_SCALAR = 0  # always, with its default value if unset
+_PRESENT_ONLY = 1  # only if set: singular message fields and oneof members
+_REPEATED = 2
+_MAP = 3
+
+# How to translate a field. Items are the values of a repeated field or of a map, or the value of
+# a singular field. to_value and to_json translate a non-message item into a python value and
+# into JSON text, to_value being None when the item is used as is.
+_FieldPlan = collections.namedtuple(
+    "_FieldPlan",
+    ("name", "json_name", "key_json", "kind", "item_is_message", "to_value", "to_json"),
+)
+
+# Message descriptor to the plans of its fields, sorted by JSON name
+_MESSAGE_PLANS = {}
+# Field descriptor to its plan, for the fields of google.protobuf.Value
+_VALUE_FIELD_PLANS = {}
+# Field descriptor to the (to_value, to_json) functions of its items
+_ITEM_CONVERTERS = {}
+
+
+def _non_finite_value(value):
+    """Translate infinite and NaN floating point values as MessageToDict does, or None"""
+    if math.isinf(value):
+        return "-Infinity" if value < 0 else "Infinity"
+    if math.isnan(value):
+        return "NaN"
+    return None
+
+
+def _double_to_value(value):
+    """Translate a double"""
+    non_finite = _non_finite_value(value)
+    return value if non_finite is None else non_finite
+
+
+def _double_to_json(value):
+    """Encode a double"""
+    non_finite = _non_finite_value(value)
+    return float.__repr__(value) if non_finite is None else encode_basestring_ascii(non_finite)
+
+
+def _float_to_value(value):
+    """Translate a float, rounded to the shortest representation of its single precision"""
+    non_finite = _non_finite_value(value)
+    return type_checkers.ToShortestFloat(value) if non_finite is None else non_finite
+
+
+def _float_to_json(value):
+    """Encode a float"""
+    non_finite = _non_finite_value(value)
+    if non_finite is not None:
+        return encode_basestring_ascii(non_finite)
+    return float.__repr__(type_checkers.ToShortestFloat(value))
+
+
+def _bytes_to_value(value):
+    """Translate bytes into base64"""
+    return base64.b64encode(value).decode("utf-8")
+
+
+def _bytes_to_json(value):
+    """Encode bytes as base64"""
+    return '"{}"'.format(base64.b64encode(value).decode("utf-8"))
+
+
+def _int64_to_json(value):
+    """Encode a 64 bit integer, as a string like MessageToDict does"""
+    return '"{}"'.format(value)
+
+
+def _bool_to_json(value):
+    """Encode a boolean"""
+    return "true" if value else "false"
+
+
+def _make_enum_converters(enum_type):
+    """Make the converters of an enum field: names of known values, numbers of the others"""
+    names = {number: value.name for number, value in enum_type.values_by_number.items()}
+    encoded_names = {number: encode_basestring_ascii(name) for number, name in names.items()}
+
+    def to_value(value):
+        """Translate an enum value"""
+        return names.get(value, value)
+
+    def to_json(value):
+        """Encode an enum value"""
+        encoded_name = encoded_names.get(value)
+        return int.__repr__(value) if encoded_name is None else encoded_name
+
+    return to_value, to_json
+
+
+def _get_item_converters(field):
+    """Get the (to_value, to_json) functions of the items of a non-message field"""
+    converters = _ITEM_CONVERTERS.get(field)
+    if converters is None:
+        cpp_type = field.cpp_type
+        if field.type == _FieldDescriptor.TYPE_BYTES:
+            converters = (_bytes_to_value, _bytes_to_json)
+        elif cpp_type == _FieldDescriptor.CPPTYPE_STRING:
+            converters = (None, encode_basestring_ascii)
+        elif cpp_type == _FieldDescriptor.CPPTYPE_ENUM:
+            converters = _make_enum_converters(field.enum_type)
+        elif cpp_type == _FieldDescriptor.CPPTYPE_BOOL:
+            converters = (bool, _bool_to_json)
+        elif cpp_type in (_FieldDescriptor.CPPTYPE_INT64, _FieldDescriptor.CPPTYPE_UINT64):
+            converters = (str, _int64_to_json)
+        elif cpp_type == _FieldDescriptor.CPPTYPE_FLOAT:
+            converters = (_float_to_value, _float_to_json)
+        elif cpp_type == _FieldDescriptor.CPPTYPE_DOUBLE:
+            converters = (_double_to_value, _double_to_json)
+        else:
+            converters = (None, int.__repr__)
+        _ITEM_CONVERTERS[field] = converters
+    return converters
+
+
+def _make_field_plan(field):
+    """Work out how to translate a field"""
+    item_field = field
+    if field.label == _FieldDescriptor.LABEL_REPEATED:
+        message_type = field.message_type
+        if message_type is not None and message_type.GetOptions().map_entry:
+            kind = _MAP
+            item_field = message_type.fields_by_name["value"]
+        else:
+            kind = _REPEATED
+    elif field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE or field.containing_oneof is not None:
+        kind = _PRESENT_ONLY
+    else:
+        kind = _SCALAR
+    item_is_message = item_field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE
+    to_value, to_json = (None, None) if item_is_message else _get_item_converters(item_field)
+    return _FieldPlan(
+        field.name,
+        field.json_name,
+        encode_basestring_ascii(field.json_name) + ":",
+        kind,
+        item_is_message,
+        to_value,
+        to_json,
+    )
+
+
+def _get_message_plan(message_descriptor):
+    """Get the plans of the fields of a message type, sorted by JSON name"""
+    plans = _MESSAGE_PLANS.get(message_descriptor)
+    if plans is None:
+        plans = tuple(
+            sorted(
+                (_make_field_plan(field) for field in message_descriptor.fields),
+                key=lambda plan: plan.json_name,
+            )
+        )
+        _MESSAGE_PLANS[message_descriptor] = plans
+    return plans
+
+
+def _present_fields(message):
+    """Get the plans of the fields that appear in the output of a message"""
+    return [
+        plan
+        for plan in _get_message_plan(message.DESCRIPTOR)
+        if plan.kind != _PRESENT_ONLY or message.HasField(plan.name)
+    ]
+
+
+def _get_value_field_plan(message):
+    """Get the plan of the field set in a google.protobuf.Value, or None for null"""
+    which = message.WhichOneof("kind")
+    if which is None or which == "null_value":
+        return None
+    field = message.DESCRIPTOR.fields_by_name[which]
+    plan = _VALUE_FIELD_PLANS.get(field)
+    if plan is None:
+        plan = _VALUE_FIELD_PLANS[field] = _make_field_plan(field)
+    return plan
+
+
+def _map_key(key):
+    """Get the dict key of a map key, which JSON encoding turns into a string"""
+    if isinstance(key, bool):
+        return "true" if key else "false"
+    return key
+
+
+def _unpack_any(message, pool):
+    """Unpack the message held by an Any, looking its type up in the pool then the default pool"""
+    type_name = message.type_url.split("/")[-1]
+    default_pool = symbol_database.Default().pool
+    pools = (pool,) if pool is default_pool else (pool, default_pool)
+    for candidate_pool in pools:
+        try:
+            message_descriptor = candidate_pool.FindMessageTypeByName(type_name)
+            break
+        except KeyError:
+            pass
+    else:
+        raise TypeError("Can not find message descriptor by type_url: {}".format(message.type_url))
+    sub_message = symbol_database.Default().GetPrototype(message_descriptor)()
+    sub_message.ParseFromString(message.value)
+    return sub_message
+
+
+class _ValueTranslator(object):
+    """Translates messages into clean python values"""
+
+    def __init__(self, pool):
+        """Initialize with the descriptor pool of the types held by Any values"""
+        self._pool = pool
+
+    def message(self, message):
+        """Translate a message"""
+        full_name = message.DESCRIPTOR.full_name
+        if full_name in _WRAPPER_TYPES:
+            return self._item(_get_message_plan(message.DESCRIPTOR)[0], message.value)
+        elif full_name in _STRING_TYPES:
+            return message.ToJsonString()
+        elif full_name == _ANY_TYPE:
+            return self._any(message)
+        elif full_name == _STRUCT_TYPE:
+            fields = message.fields
+            return self._clean_object({key: self._value(fields[key]) for key in fields})
+        elif full_name == _LIST_VALUE_TYPE:
+            return [self._value(value) for value in message.values]
+        elif full_name == _VALUE_TYPE:
+            return self._value(message)
+        return {plan.json_name: self._field(message, plan) for plan in _present_fields(message)}
+
+    def _field(self, message, plan):
+        """Translate the value of a field"""
+        value = getattr(message, plan.name)
+        if plan.kind == _REPEATED:
+            if plan.item_is_message:
+                return [self.message(element) for element in value]
+            return list(value) if plan.to_value is None else list(map(plan.to_value, value))
+        elif plan.kind == _MAP:
+            return self._clean_object(
+                {_map_key(key): self._item(plan, value[key]) for key in value}
+            )
+        return self._item(plan, value)
+
+    def _item(self, plan, value):
+        """Translate a single value of a field"""
+        if plan.item_is_message:
+            return self.message(value)
+        return value if plan.to_value is None else plan.to_value(value)
+
+    def _any(self, message):
+        """Translate an Any, flattening it if it holds a single value"""
+        if not message.ListFields():
+            return {}
+        sub_message = _unpack_any(message, self._pool)
+        if sub_message.DESCRIPTOR.full_name in _SINGLE_VALUE_TYPES:
+            return self.message(sub_message)
+        plans = _present_fields(sub_message)
+        if len(plans) == 1:
+            return self._field(sub_message, plans[0])
+        return {plan.json_name: self._field(sub_message, plan) for plan in plans}
+
+    def _value(self, message):
+        """Translate a google.protobuf.Value"""
+        plan = _get_value_field_plan(message)
+        return None if plan is None else self._item(plan, getattr(message, plan.name))
+
+    @staticmethod
+    def _clean_object(dct):
+        """Flatten or drop the @type key of an object, as the dict cleaning does"""
+        if TYPE_KEY not in dct:
+            return dct
+        if len(dct) == 2:
+            return next(value for key, value in dct.items() if key != TYPE_KEY)
+        return {key: value for key, value in dct.items() if key != TYPE_KEY}
+
+
+class _JsonWriter(object):
+    """Writes messages as clean JSON text fragments"""
+
+    def __init__(self, pool):
+        """Initialize with the descriptor pool of the types held by Any values"""
+        self._pool = pool
+        self.fragments = []
+        self._write = self.fragments.append
+
+    def message(self, message):
+        """Write a message"""
+        full_name = message.DESCRIPTOR.full_name
+        if full_name in _WRAPPER_TYPES:
+            self._item(_get_message_plan(message.DESCRIPTOR)[0], message.value)
+        elif full_name in _STRING_TYPES:
+            self._write(encode_basestring_ascii(message.ToJsonString()))
+        elif full_name == _ANY_TYPE:
+            self._any(message)
+        elif full_name == _STRUCT_TYPE:
+            fields = message.fields
+            self._object(sorted(fields), lambda key: self._value(fields[key]))
+        elif full_name == _LIST_VALUE_TYPE:
+            self._array(message.values, self._value)
+        elif full_name == _VALUE_TYPE:
+            self._value(message)
+        else:
+            self._fields(message, _present_fields(message))
+
+    def _fields(self, message, plans):
+        """Write the given fields of a regular message as an object"""
+        write = self._write
+        separator = "{"
+        for plan in plans:
+            write(separator)
+            separator = ","
+            write(plan.key_json)
+            self._field(message, plan)
+        write("{}" if separator == "{" else "}")
+
+    def _field(self, message, plan):
+        """Write the value of a field"""
+        value = getattr(message, plan.name)
+        if plan.kind == _REPEATED:
+            if plan.item_is_message:
+                self._array(value, self.message)
+            else:
+                self._write("[{}]".format(",".join(map(plan.to_json, value))))
+        elif plan.kind == _MAP:
+            self._object(sorted(value), lambda key: self._item(plan, value[key]))
+        else:
+            self._item(plan, value)
+
+    def _item(self, plan, value):
+        """Write a single value of a field"""
+        if plan.item_is_message:
+            self.message(value)
+        else:
+            self._write(plan.to_json(value))
+
+    def _object(self, keys, write_value):
+        """Write an object of sorted keys, flattening or dropping its @type key"""
+        key_strings = [str(_map_key(key)) for key in keys]
+        if TYPE_KEY in key_strings and len(key_strings) == 2:
+            write_value(next(key for key, string in zip(keys, key_strings) if string != TYPE_KEY))
+            return
+        write = self._write
+        separator = "{"
+        for key, key_string in zip(keys, key_strings):
+            if key_string == TYPE_KEY:
+                continue
+            write(separator)
+            separator = ","
+            write(encode_basestring_ascii(key_string))
+            write(":")
+            write_value(key)
+        write("{}" if separator == "{" else "}")
+
+    def _array(self, elements, write_element):
+        """Write an array"""
+        write = self._write
+        separator = "["
+        for element in elements:
+            write(separator)
+            separator = ","
+            write_element(element)
+        write("[]" if separator == "[" else "]")
+
+    def _any(self, message):
+        """Write an Any, flattening it if it holds a single value"""
+        if not message.ListFields():
+            self._write("{}")
+            return
+        sub_message = _unpack_any(message, self._pool)
+        if sub_message.DESCRIPTOR.full_name in _SINGLE_VALUE_TYPES:
+            self.message(sub_message)
+            return
+        plans = _present_fields(sub_message)
+        if len(plans) == 1:
+            self._field(sub_message, plans[0])
+        else:
+            self._fields(sub_message, plans)
+
+    def _value(self, message):
+        """Write a google.protobuf.Value"""
+        plan = _get_value_field_plan(message)
+        if plan is None:
+            self._write("null")
+        else:
+            self._item(plan, getattr(message, plan.name))
+
+
+#
+#  PUBLIC API
+#
+
+
+def message_to_clean_value(message, descriptor_pool=None):
+    """Translate a protobuf message into a clean python value in a single pass.
+
+    Args:
+        message: protobuf message
+        descriptor_pool: optional descriptor pool of the types held by Any values, e.g. one built
+            by reflection. Types missing from it are looked up in the default pool
+
+    Returns:
+        the value translate_message_to_dict returns for the message: a dict for regular messages
+    """
+    pool = descriptor_pool or symbol_database.Default().pool
+    return _ValueTranslator(pool).message(message)
+
+
+def message_to_json_bytes(message, descriptor_pool=None):
+    """Encode a protobuf message as clean JSON in a single pass.
+
+    Args:
+        message: protobuf message
+        descriptor_pool: optional descriptor pool of the types held by Any values, e.g. one built
+            by reflection. Types missing from it are looked up in the default pool
+
+    Returns:
+        bytes of the compact JSON encoding of message_to_clean_value(message), with sorted keys
+    """
+    writer = _JsonWriter(descriptor_pool or symbol_database.Default().pool)
+    writer.message(message)
+    return "".join(writer.fragments).encode("utf-8")
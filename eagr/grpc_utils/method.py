@@ -1,4 +1,13 @@
 # Copyright 2020-present Kensho Technologies, LLC.
+from google.protobuf import descriptor_pb2
+from google.protobuf.internal import decoder, wire_format
+
+
+# Field number of the google.api.http option of methods, and of the get pattern of its HttpRule
+HTTP_RULE_FIELD_NUMBER = 72295728
+_HTTP_RULE_GET_FIELD_NUMBER = 2
+
+
 def make_grpc_unary_method(channel, service_name, method_descriptor, symbol_database_instance):
     # type (Channel, str, MethodDescriptor, Any) -> Callable
     """Make grp callable on the channel.
@@ -17,3 +26,114 @@ def make_grpc_unary_method(channel, service_name, method_descriptor, symbol_data
         response_deserializer=output_prototype.FromString,
     )
     return method
+
+
+def make_grpc_unary_bytes_method(channel, service_name, method_descriptor):
+    # type (Channel, str, MethodDescriptor) -> Callable
+    """Make grpc callable on the channel taking and returning serialized messages.
+
+    Args:
+        channel: grpc channel
+        service_name: name of service
+        method_descriptor: method descriptor
+    """
+    # Without serializers, grpc passes the bytes through as they are
+    return channel.unary_unary("/{}/{}".format(service_name, method_descriptor.name))
+
+
+def make_grpc_unary_stream_method(
+    channel, service_name, method_descriptor, symbol_database_instance
+):
+    # type (Channel, str, MethodDescriptor, Any) -> Callable
+    """Make grpc callable on the channel for a method streaming its responses.
+
+    Args:
+        channel: grpc channel
+        service_name: name of service
+        method_descriptor: method descriptor
+        symbol_database_instance: symbol db instance
+    """
+    input_prototype = symbol_database_instance.GetPrototype(method_descriptor.input_type)
+    output_prototype = symbol_database_instance.GetPrototype(method_descriptor.output_type)
+    method = channel.unary_stream(
+        "/{}/{}".format(service_name, method_descriptor.name),
+        request_serializer=input_prototype.SerializeToString,
+        response_deserializer=output_prototype.FromString,
+    )
+    return method
+
+
+def get_method_streaming(method_descriptor):
+    # type (MethodDescriptor) -> Tuple[bool, bool]
+    """Get whether the requests and the responses of a method are streamed.
+
+    Method descriptors of older protobuf versions lack the streaming flags, which are then read
+    from the proto of the file defining the service.
+
+    Args:
+        method_descriptor: method descriptor
+
+    Returns:
+        tuple of (client_streaming, server_streaming)
+    """
+    if hasattr(method_descriptor, "server_streaming"):
+        return method_descriptor.client_streaming, method_descriptor.server_streaming
+    service_descriptor = method_descriptor.containing_service
+    file_proto = descriptor_pb2.FileDescriptorProto.FromString(
+        service_descriptor.file.serialized_pb
+    )
+    service_proto = next(
+        service for service in file_proto.service if service.name == service_descriptor.name
+    )
+    method_proto = next(
+        method for method in service_proto.method if method.name == method_descriptor.name
+    )
+    return method_proto.client_streaming, method_proto.server_streaming
+
+
+def _get_http_rule_bytes(method_descriptor):
+    """Get the serialized google.api.http rule of a method, or None"""
+    options = method_descriptor.GetOptions()
+    # The option is an extension if google/api/annotations.proto was imported, unknown otherwise
+    for field_descriptor, value in options.ListFields():
+        if field_descriptor.number == HTTP_RULE_FIELD_NUMBER:
+            return value.SerializeToString()
+    for unknown_field in options.UnknownFields():
+        if unknown_field.field_number == HTTP_RULE_FIELD_NUMBER:
+            return unknown_field.data
+    return None
+
+
+def get_http_get_template(method_descriptor):
+    # type (MethodDescriptor) -> Optional[str]
+    """Get the path template of the GET binding in the google.api.http option of a method.
+
+    The option is read from its wire format, so that googleapis-common-protos is not needed.
+    Additional bindings are ignored.
+
+    Args:
+        method_descriptor: method descriptor
+
+    Returns:
+        path template, e.g. "/v1/shelves/{shelf}", or None if the method has no GET binding
+    """
+    rule_bytes = _get_http_rule_bytes(method_descriptor)
+    if rule_bytes is None:
+        return None
+    position = 0
+    while position < len(rule_bytes):
+        tag, position = decoder._DecodeVarint(rule_bytes, position)
+        field_number, wire_type = wire_format.UnpackTag(tag)
+        if wire_type == wire_format.WIRETYPE_LENGTH_DELIMITED:
+            length, position = decoder._DecodeVarint(rule_bytes, position)
+            if field_number == _HTTP_RULE_GET_FIELD_NUMBER:
+                return rule_bytes[position : position + length].decode("utf-8")
+            position += length
+        elif wire_type == wire_format.WIRETYPE_VARINT:
+            _, position = decoder._DecodeVarint(rule_bytes, position)
+        else:
+            # HttpRule only has strings, messages and booleans
+            raise ValueError(
+                "Malformed google.api.http option of {}".format(method_descriptor.name)
+            )
+    return None
@@ -0,0 +1,179 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+# @generated
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: eagr/protos/bridge_test_service.proto
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import message as _message
+from google.protobuf import reflection as _reflection
+from google.protobuf import symbol_database as _symbol_database
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+from google.protobuf import any_pb2 as google_dot_protobuf_dot_any__pb2
+
+
+DESCRIPTOR = _descriptor.FileDescriptor(
+  name='eagr/protos/bridge_test_service.proto',
+  package='eagr',
+  syntax='proto3',
+  serialized_options=None,
+  create_key=_descriptor._internal_create_key,
+  serialized_pb=b'\n%eagr/protos/bridge_test_service.proto\x12\x04\x65\x61gr\x1a\x19google/protobuf/any.proto\"1\n\x11\x42ridgeTestRequest\x12\r\n\x05query\x18\x01 \x01(\t\x12\r\n\x05\x63ount\x18\x02 \x01(\x05\"f\n\x12\x42ridgeTestResponse\x12\r\n\x05query\x18\x01 \x01(\t\x12\r\n\x05items\x18\x02 \x03(\t\x12\r\n\x05total\x18\x03 \x01(\x03\x12#\n\x05\x65xtra\x18\x04 \x01(\x0b\x32\x14.google.protobuf.Any2\x99\x01\n\x11\x42ridgeTestService\x12=\n\x06Search\x12\x17.eagr.BridgeTestRequest\x1a\x18.eagr.BridgeTestResponse\"\x00\x12\x45\n\x0cStreamSearch\x12\x17.eagr.BridgeTestRequest\x1a\x18.eagr.BridgeTestResponse\"\x00\x30\x01\x62\x06proto3'
+  ,
+  dependencies=[google_dot_protobuf_dot_any__pb2.DESCRIPTOR,])
+
+
+
+
+_BRIDGETESTREQUEST = _descriptor.Descriptor(
+  name='BridgeTestRequest',
+  full_name='eagr.BridgeTestRequest',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  create_key=_descriptor._internal_create_key,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='query', full_name='eagr.BridgeTestRequest.query', index=0,
+      number=1, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='count', full_name='eagr.BridgeTestRequest.count', index=1,
+      number=2, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto3',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=74,
+  serialized_end=123,
+)
+
+
+_BRIDGETESTRESPONSE = _descriptor.Descriptor(
+  name='BridgeTestResponse',
+  full_name='eagr.BridgeTestResponse',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  create_key=_descriptor._internal_create_key,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='query', full_name='eagr.BridgeTestResponse.query', index=0,
+      number=1, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='items', full_name='eagr.BridgeTestResponse.items', index=1,
+      number=2, type=9, cpp_type=9, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='total', full_name='eagr.BridgeTestResponse.total', index=2,
+      number=3, type=3, cpp_type=2, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='extra', full_name='eagr.BridgeTestResponse.extra', index=3,
+      number=4, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto3',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=125,
+  serialized_end=227,
+)
+
+_BRIDGETESTRESPONSE.fields_by_name['extra'].message_type = google_dot_protobuf_dot_any__pb2._ANY
+DESCRIPTOR.message_types_by_name['BridgeTestRequest'] = _BRIDGETESTREQUEST
+DESCRIPTOR.message_types_by_name['BridgeTestResponse'] = _BRIDGETESTRESPONSE
+_sym_db.RegisterFileDescriptor(DESCRIPTOR)
+
+BridgeTestRequest = _reflection.GeneratedProtocolMessageType('BridgeTestRequest', (_message.Message,), {
+  'DESCRIPTOR' : _BRIDGETESTREQUEST,
+  '__module__' : 'eagr.protos.bridge_test_service_pb2'
+  # @@protoc_insertion_point(class_scope:eagr.BridgeTestRequest)
+  })
+_sym_db.RegisterMessage(BridgeTestRequest)
+
+BridgeTestResponse = _reflection.GeneratedProtocolMessageType('BridgeTestResponse', (_message.Message,), {
+  'DESCRIPTOR' : _BRIDGETESTRESPONSE,
+  '__module__' : 'eagr.protos.bridge_test_service_pb2'
+  # @@protoc_insertion_point(class_scope:eagr.BridgeTestResponse)
+  })
+_sym_db.RegisterMessage(BridgeTestResponse)
+
+
+
+_BRIDGETESTSERVICE = _descriptor.ServiceDescriptor(
+  name='BridgeTestService',
+  full_name='eagr.BridgeTestService',
+  file=DESCRIPTOR,
+  index=0,
+  serialized_options=None,
+  create_key=_descriptor._internal_create_key,
+  serialized_start=230,
+  serialized_end=383,
+  methods=[
+  _descriptor.MethodDescriptor(
+    name='Search',
+    full_name='eagr.BridgeTestService.Search',
+    index=0,
+    containing_service=None,
+    input_type=_BRIDGETESTREQUEST,
+    output_type=_BRIDGETESTRESPONSE,
+    serialized_options=None,
+    create_key=_descriptor._internal_create_key,
+  ),
+  _descriptor.MethodDescriptor(
+    name='StreamSearch',
+    full_name='eagr.BridgeTestService.StreamSearch',
+    index=1,
+    containing_service=None,
+    input_type=_BRIDGETESTREQUEST,
+    output_type=_BRIDGETESTRESPONSE,
+    serialized_options=None,
+    create_key=_descriptor._internal_create_key,
+  ),
+])
+_sym_db.RegisterServiceDescriptor(_BRIDGETESTSERVICE)
+
+DESCRIPTOR.services_by_name['BridgeTestService'] = _BRIDGETESTSERVICE
+
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,104 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+# @generated
+# Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+"""Client and server classes corresponding to protobuf-defined services."""
+import grpc
+
+from eagr.protos import bridge_test_service_pb2 as eagr_dot_protos_dot_bridge__test__service__pb2
+
+
+class BridgeTestServiceStub(object):
+    """Simple service to test the flask bridge
+    """
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.Search = channel.unary_unary(
+                '/eagr.BridgeTestService/Search',
+                request_serializer=eagr_dot_protos_dot_bridge__test__service__pb2.BridgeTestRequest.SerializeToString,
+                response_deserializer=eagr_dot_protos_dot_bridge__test__service__pb2.BridgeTestResponse.FromString,
+                )
+        self.StreamSearch = channel.unary_stream(
+                '/eagr.BridgeTestService/StreamSearch',
+                request_serializer=eagr_dot_protos_dot_bridge__test__service__pb2.BridgeTestRequest.SerializeToString,
+                response_deserializer=eagr_dot_protos_dot_bridge__test__service__pb2.BridgeTestResponse.FromString,
+                )
+
+
+class BridgeTestServiceServicer(object):
+    """Simple service to test the flask bridge
+    """
+
+    def Search(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def StreamSearch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_BridgeTestServiceServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'Search': grpc.unary_unary_rpc_method_handler(
+                    servicer.Search,
+                    request_deserializer=eagr_dot_protos_dot_bridge__test__service__pb2.BridgeTestRequest.FromString,
+                    response_serializer=eagr_dot_protos_dot_bridge__test__service__pb2.BridgeTestResponse.SerializeToString,
+            ),
+            'StreamSearch': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamSearch,
+                    request_deserializer=eagr_dot_protos_dot_bridge__test__service__pb2.BridgeTestRequest.FromString,
+                    response_serializer=eagr_dot_protos_dot_bridge__test__service__pb2.BridgeTestResponse.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'eagr.BridgeTestService', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+
+
+ # This class is part of an EXPERIMENTAL API.
+class BridgeTestService(object):
+    """Simple service to test the flask bridge
+    """
+
+    @staticmethod
+    def Search(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/eagr.BridgeTestService/Search',
+            eagr_dot_protos_dot_bridge__test__service__pb2.BridgeTestRequest.SerializeToString,
+            eagr_dot_protos_dot_bridge__test__service__pb2.BridgeTestResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def StreamSearch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/eagr.BridgeTestService/StreamSearch',
+            eagr_dot_protos_dot_bridge__test__service__pb2.BridgeTestRequest.SerializeToString,
+            eagr_dot_protos_dot_bridge__test__service__pb2.BridgeTestResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
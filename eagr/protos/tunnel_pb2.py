@@ -0,0 +1,243 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+# @generated
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: eagr/protos/tunnel.proto
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import message as _message
+from google.protobuf import reflection as _reflection
+from google.protobuf import symbol_database as _symbol_database
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor.FileDescriptor(
+  name='eagr/protos/tunnel.proto',
+  package='eagr',
+  syntax='proto3',
+  serialized_options=None,
+  create_key=_descriptor._internal_create_key,
+  serialized_pb=b'\n\x18\x65\x61gr/protos/tunnel.proto\x12\x04\x65\x61gr\"-\n\x0fTunnelMetadatum\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t\"\x82\x01\n\rTunnelRequest\x12\x16\n\x0e\x63orrelation_id\x18\x01 \x01(\x04\x12\x0e\n\x06method\x18\x02 \x01(\t\x12\x0f\n\x07payload\x18\x03 \x01(\x0c\x12\'\n\x08metadata\x18\x04 \x03(\x0b\x32\x15.eagr.TunnelMetadatum\x12\x0f\n\x07timeout\x18\x05 \x01(\x01\"\x8a\x01\n\x0eTunnelResponse\x12\x16\n\x0e\x63orrelation_id\x18\x01 \x01(\x04\x12\x0f\n\x07payload\x18\x02 \x01(\x0c\x12\x0c\n\x04\x63ode\x18\x03 \x01(\x05\x12\x0f\n\x07\x64\x65tails\x18\x04 \x01(\t\x12\x30\n\x11trailing_metadata\x18\x05 \x03(\x0b\x32\x15.eagr.TunnelMetadatum2H\n\x0bUnaryTunnel\x12\x39\n\x06Tunnel\x12\x13.eagr.TunnelRequest\x1a\x14.eagr.TunnelResponse\"\x00(\x01\x30\x01\x62\x06proto3'
+)
+
+
+
+
+_TUNNELMETADATUM = _descriptor.Descriptor(
+  name='TunnelMetadatum',
+  full_name='eagr.TunnelMetadatum',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  create_key=_descriptor._internal_create_key,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='key', full_name='eagr.TunnelMetadatum.key', index=0,
+      number=1, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='value', full_name='eagr.TunnelMetadatum.value', index=1,
+      number=2, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto3',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=34,
+  serialized_end=79,
+)
+
+
+_TUNNELREQUEST = _descriptor.Descriptor(
+  name='TunnelRequest',
+  full_name='eagr.TunnelRequest',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  create_key=_descriptor._internal_create_key,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='correlation_id', full_name='eagr.TunnelRequest.correlation_id', index=0,
+      number=1, type=4, cpp_type=4, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='method', full_name='eagr.TunnelRequest.method', index=1,
+      number=2, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='payload', full_name='eagr.TunnelRequest.payload', index=2,
+      number=3, type=12, cpp_type=9, label=1,
+      has_default_value=False, default_value=b"",
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='metadata', full_name='eagr.TunnelRequest.metadata', index=3,
+      number=4, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='timeout', full_name='eagr.TunnelRequest.timeout', index=4,
+      number=5, type=1, cpp_type=5, label=1,
+      has_default_value=False, default_value=float(0),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto3',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=82,
+  serialized_end=212,
+)
+
+
+_TUNNELRESPONSE = _descriptor.Descriptor(
+  name='TunnelResponse',
+  full_name='eagr.TunnelResponse',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  create_key=_descriptor._internal_create_key,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='correlation_id', full_name='eagr.TunnelResponse.correlation_id', index=0,
+      number=1, type=4, cpp_type=4, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='payload', full_name='eagr.TunnelResponse.payload', index=1,
+      number=2, type=12, cpp_type=9, label=1,
+      has_default_value=False, default_value=b"",
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='code', full_name='eagr.TunnelResponse.code', index=2,
+      number=3, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='details', full_name='eagr.TunnelResponse.details', index=3,
+      number=4, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='trailing_metadata', full_name='eagr.TunnelResponse.trailing_metadata', index=4,
+      number=5, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto3',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=215,
+  serialized_end=353,
+)
+
+_TUNNELREQUEST.fields_by_name['metadata'].message_type = _TUNNELMETADATUM
+_TUNNELRESPONSE.fields_by_name['trailing_metadata'].message_type = _TUNNELMETADATUM
+DESCRIPTOR.message_types_by_name['TunnelMetadatum'] = _TUNNELMETADATUM
+DESCRIPTOR.message_types_by_name['TunnelRequest'] = _TUNNELREQUEST
+DESCRIPTOR.message_types_by_name['TunnelResponse'] = _TUNNELRESPONSE
+_sym_db.RegisterFileDescriptor(DESCRIPTOR)
+
+TunnelMetadatum = _reflection.GeneratedProtocolMessageType('TunnelMetadatum', (_message.Message,), {
+  'DESCRIPTOR' : _TUNNELMETADATUM,
+  '__module__' : 'eagr.protos.tunnel_pb2'
+  # @@protoc_insertion_point(class_scope:eagr.TunnelMetadatum)
+  })
+_sym_db.RegisterMessage(TunnelMetadatum)
+
+TunnelRequest = _reflection.GeneratedProtocolMessageType('TunnelRequest', (_message.Message,), {
+  'DESCRIPTOR' : _TUNNELREQUEST,
+  '__module__' : 'eagr.protos.tunnel_pb2'
+  # @@protoc_insertion_point(class_scope:eagr.TunnelRequest)
+  })
+_sym_db.RegisterMessage(TunnelRequest)
+
+TunnelResponse = _reflection.GeneratedProtocolMessageType('TunnelResponse', (_message.Message,), {
+  'DESCRIPTOR' : _TUNNELRESPONSE,
+  '__module__' : 'eagr.protos.tunnel_pb2'
+  # @@protoc_insertion_point(class_scope:eagr.TunnelResponse)
+  })
+_sym_db.RegisterMessage(TunnelResponse)
+
+
+
+_UNARYTUNNEL = _descriptor.ServiceDescriptor(
+  name='UnaryTunnel',
+  full_name='eagr.UnaryTunnel',
+  file=DESCRIPTOR,
+  index=0,
+  serialized_options=None,
+  create_key=_descriptor._internal_create_key,
+  serialized_start=355,
+  serialized_end=427,
+  methods=[
+  _descriptor.MethodDescriptor(
+    name='Tunnel',
+    full_name='eagr.UnaryTunnel.Tunnel',
+    index=0,
+    containing_service=None,
+    input_type=_TUNNELREQUEST,
+    output_type=_TUNNELRESPONSE,
+    serialized_options=None,
+    create_key=_descriptor._internal_create_key,
+  ),
+])
+_sym_db.RegisterServiceDescriptor(_UNARYTUNNEL)
+
+DESCRIPTOR.services_by_name['UnaryTunnel'] = _UNARYTUNNEL
+
+# @@protoc_insertion_point(module_scope)
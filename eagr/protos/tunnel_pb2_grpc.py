@@ -0,0 +1,71 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+# @generated
+# Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+"""Client and server classes corresponding to protobuf-defined services."""
+import grpc
+
+from eagr.protos import tunnel_pb2 as eagr_dot_protos_dot_tunnel__pb2
+
+
+class UnaryTunnelStub(object):
+    """Carries many unary calls over one long-lived bidirectional stream
+    """
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.Tunnel = channel.stream_stream(
+                '/eagr.UnaryTunnel/Tunnel',
+                request_serializer=eagr_dot_protos_dot_tunnel__pb2.TunnelRequest.SerializeToString,
+                response_deserializer=eagr_dot_protos_dot_tunnel__pb2.TunnelResponse.FromString,
+                )
+
+
+class UnaryTunnelServicer(object):
+    """Carries many unary calls over one long-lived bidirectional stream
+    """
+
+    def Tunnel(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_UnaryTunnelServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'Tunnel': grpc.stream_stream_rpc_method_handler(
+                    servicer.Tunnel,
+                    request_deserializer=eagr_dot_protos_dot_tunnel__pb2.TunnelRequest.FromString,
+                    response_serializer=eagr_dot_protos_dot_tunnel__pb2.TunnelResponse.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'eagr.UnaryTunnel', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+
+
+ # This class is part of an EXPERIMENTAL API.
+class UnaryTunnel(object):
+    """Carries many unary calls over one long-lived bidirectional stream
+    """
+
+    @staticmethod
+    def Tunnel(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(request_iterator, target, '/eagr.UnaryTunnel/Tunnel',
+            eagr_dot_protos_dot_tunnel__pb2.TunnelRequest.SerializeToString,
+            eagr_dot_protos_dot_tunnel__pb2.TunnelResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
@@ -3,9 +3,10 @@ from typing import Callable, Dict, Optional, Tuple
 
 import backoff
 from google.protobuf import json_format
+from google.protobuf.descriptor_pool import DescriptorPool
 import grpc
 
-from eagr.grpc_utils import method, response_translation
+from eagr.grpc_utils import json_encoding, method
 from eagr.reflection import reflection_descriptor_database
 
 
@@ -13,7 +14,10 @@ MAX_RETRIES = 3
 
 
 def _make_json_to_json_method_invocation(
-    method_callable: Callable, proto_type: Callable, max_retries: int
+    method_callable: Callable,
+    proto_type: Callable,
+    max_retries: int,
+    descriptor_pool_instance: Optional[DescriptorPool] = None,
 ) -> Callable:
     """Make function wrapping grpc method into json conversion"""
     # This invocation definition serves as a lambda for a GRPC method invocation
@@ -32,7 +36,9 @@ def _make_json_to_json_method_invocation(
         response_as_message = method_callable(
             input_message, timeout=timeout, metadata=metadata, credentials=credentials
         )
-        response_as_dict = response_translation.translate_message_to_dict(response_as_message)
+        response_as_dict = json_encoding.message_to_clean_value(
+            response_as_message, descriptor_pool_instance
+        )
         return response_as_dict
 
     return invocation
@@ -55,7 +61,10 @@ def make_json_grpc_client(host: str, service_name: str) -> Dict[str, Callable]:
         input_type = method_descriptor.input_type
         input_prototype = symbol_database_instance.GetPrototype(input_type)
         method_invocation = _make_json_to_json_method_invocation(
-            method_callable, input_prototype, max_retries=MAX_RETRIES
+            method_callable,
+            input_prototype,
+            max_retries=MAX_RETRIES,
+            descriptor_pool_instance=descriptor_pool_instance,
         )
 
         client[method_name] = method_invocation
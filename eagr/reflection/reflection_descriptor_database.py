@@ -148,20 +148,35 @@ def add_protos_to_descriptor_pool(reflection_client, descriptor_pool, file_descr
         )
 
 
-def build_database_from_stub(reflection_client):
-    """Build descriptor pool and symbol database from reflection service.
+def get_service_names(reflection_client):
+    """Get the names of the services of the server.
 
     Args:
         reflection_client: ServerReflectionStub. GRPC reflection client
 
     Returns:
-        tuple (descriptor pool, symbol database)
+        list of full service names
     """
     services_response = funcy.first(
         # Note that this is stupid, but grpc has problems iterating over lists
         reflection_client.ServerReflectionInfo(x for x in [GET_SERVICES_REQUEST])
     )
-    service_names = [service.name for service in services_response.list_services_response.service]
+    return [service.name for service in services_response.list_services_response.service]
+
+
+def build_database_from_stub(reflection_client, service_names=None):
+    """Build descriptor pool and symbol database from reflection service.
+
+    Args:
+        reflection_client: ServerReflectionStub. GRPC reflection client
+        service_names: optional list of the names of the services whose protos (and their
+            dependencies) to load. All the services of the server by default
+
+    Returns:
+        tuple (descriptor pool, symbol database)
+    """
+    if service_names is None:
+        service_names = get_service_names(reflection_client)
     file_requests = (
         reflection_pb2.ServerReflectionRequest(file_containing_symbol=service_name)
         for service_name in service_names
@@ -175,14 +190,16 @@ def build_database_from_stub(reflection_client):
     return (descriptor_pool, symbol_database)
 
 
-def build_database_from_channel(channel):
+def build_database_from_channel(channel, service_names=None):
     """Build descriptor pool and symbol database from reflection service.
 
     Args:
         channel: GRPC channel
+        service_names: optional list of the names of the services whose protos (and their
+            dependencies) to load. All the services of the server by default
 
     Returns:
         tuple (descriptor pool, symbol database)
     """
     reflection_client = reflection_pb2_grpc.ServerReflectionStub(channel)
-    return build_database_from_stub(reflection_client)
+    return build_database_from_stub(reflection_client, service_names=service_names)
@@ -8,6 +8,8 @@ import grpc
 from grpc_reflection.v1alpha.reflection import enable_server_reflection
 import prometheus_client
 
+from eagr.server.middleware import RequestContextMiddleware
+
 
 GRPC_REGISTRAR_ATTRIBUTE = "_REGISTRAR"
 GRPC_TRACING_ATTRIBUTE = "_TRACING_ENABLED"
@@ -63,6 +65,10 @@ def run_grpc_servers(
     if middlewares is None:
         middlewares = []
 
+    # Always record the servicer context first, so that clients used inside handlers
+    # can propagate the inbound deadline to their outbound calls
+    middlewares = [RequestContextMiddleware()] + list(middlewares)
+
     interceptors = []
     for middleware in middlewares:
         interceptors.extend(middleware.get_interceptors())
@@ -0,0 +1,285 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""Calling the unary methods of GRPCBase servicers without going through a grpc server
+
+Transports that deliver calls to servicers themselves use LocalDispatcher to find the method
+handlers registered by the servicers and to apply the server middlewares around them, so that
+servicer methods and middlewares work unchanged.
+"""
+import collections
+import threading
+import time
+
+import grpc
+
+from eagr.server.base import GRPC_REGISTRAR_ATTRIBUTE
+from eagr.server.middleware import RequestContextMiddleware
+
+
+_Metadatum = collections.namedtuple("_Metadatum", ("key", "value"))
+
+LocalOutcome = collections.namedtuple(
+    "LocalOutcome", ("response", "code", "details", "trailing_metadata")
+)
+
+
+class _HandlerCallDetails(
+    collections.namedtuple("_HandlerCallDetails", ("method", "invocation_metadata")),
+    grpc.HandlerCallDetails,
+):
+    """Handler call details for looking up method handlers"""
+
+
+class _HandlerCollector(object):
+    """Stands in for a grpc server to collect the handlers that servicers register"""
+
+    def __init__(self):
+        """Initialize without handlers"""
+        self.generic_handlers = []
+
+    def add_generic_rpc_handlers(self, generic_rpc_handlers):
+        """Collect generic handlers"""
+        self.generic_handlers.extend(generic_rpc_handlers)
+
+    def add_registered_method_handlers(self, service_name, method_handlers):
+        """Newer generated code registers its handlers here as well as generic handlers"""
+
+
+class LocalAbort(Exception):
+    """Raised by LocalServicerContext.abort to end the call"""
+
+    def __init__(self, code, details):
+        """Initialize with the status code and details"""
+        super(LocalAbort, self).__init__(code, details)
+        self.code = code
+        self.details = details
+
+
+class LocalServicerContext(grpc.ServicerContext):
+    """Servicer context of a call dispatched by LocalDispatcher"""
+
+    def __init__(self, invocation_metadata=(), timeout=None, peer="local"):
+        """Initialize
+
+        Args:
+            invocation_metadata: optional iterable of (key, value) metadata pairs
+            timeout: optional timeout of the call in seconds
+            peer: optional peer description
+        """
+        super(LocalServicerContext, self).__init__()
+        self._invocation_metadata = tuple(
+            _Metadatum(key, value) for key, value in invocation_metadata
+        )
+        self._deadline = None if timeout is None else time.monotonic() + timeout
+        self._peer = peer
+        self._lock = threading.Lock()
+        self._active = True
+        self._callbacks = []
+        self._code = None
+        self._details = None
+        self._trailing_metadata = None
+
+    def complete(self):
+        """Mark the call as terminated and run the termination callbacks"""
+        with self._lock:
+            if not self._active:
+                return
+            self._active = False
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def is_active(self):
+        """Whether the call is still running"""
+        return self._active
+
+    def time_remaining(self):
+        """Seconds until the deadline, or None without a deadline"""
+        if self._deadline is None:
+            return None
+        return max(self._deadline - time.monotonic(), 0)
+
+    def cancel(self):
+        """Cancel the call"""
+        self.complete()
+
+    def add_callback(self, callback):
+        """Register a callback for the termination of the call"""
+        with self._lock:
+            if not self._active:
+                return False
+            self._callbacks.append(callback)
+            return True
+
+    def invocation_metadata(self):
+        """Get the invocation metadata"""
+        return self._invocation_metadata
+
+    def peer(self):
+        """Get the peer description"""
+        return self._peer
+
+    def peer_identities(self):
+        """Local calls carry no peer identities"""
+        return None
+
+    def peer_identity_key(self):
+        """Local calls carry no peer identities"""
+        return None
+
+    def auth_context(self):
+        """Local calls carry no auth context"""
+        return {}
+
+    def set_compression(self, compression):
+        """Local calls are not compressed"""
+
+    def send_initial_metadata(self, initial_metadata):
+        """Initial metadata is not delivered for local calls"""
+
+    def set_trailing_metadata(self, trailing_metadata):
+        """Set the trailing metadata"""
+        self._trailing_metadata = tuple(trailing_metadata)
+
+    def trailing_metadata(self):
+        """Get the trailing metadata"""
+        return self._trailing_metadata
+
+    def abort(self, code, details):
+        """End the call with a non-OK status code"""
+        self._code = code
+        self._details = details
+        raise LocalAbort(code, details)
+
+    def abort_with_status(self, status):
+        """End the call with a grpc.Status"""
+        if status.trailing_metadata:
+            self.set_trailing_metadata(status.trailing_metadata)
+        self.abort(status.code, status.details)
+
+    def set_code(self, code):
+        """Set the status code"""
+        self._code = code
+
+    def code(self):
+        """Get the status code"""
+        return self._code
+
+    def set_details(self, details):
+        """Set the status details"""
+        self._details = details
+
+    def details(self):
+        """Get the status details"""
+        return self._details
+
+    def disable_next_message_compression(self):
+        """Local calls are not compressed"""
+
+
+class LocalDispatcher(object):
+    """Calls the unary-unary methods of GRPCBase servicers, applying server middlewares.
+
+    The middlewares are applied through their get_decorator method, in the same order as
+    run_grpc_servers applies them, after a RequestContextMiddleware. Additional interceptors that
+    a middleware returns from get_interceptors are not applied.
+    """
+
+    def __init__(self, servers, middlewares=None):
+        """Initialize
+
+        Args:
+            servers: iterable of GRPCBase instances whose methods are dispatched
+            middlewares: optional list of GRPCMiddleware objects
+        """
+        collector = _HandlerCollector()
+        for server in servers:
+            getattr(server, GRPC_REGISTRAR_ATTRIBUTE)(collector)
+        self._generic_handlers = collector.generic_handlers
+        self._middlewares = [RequestContextMiddleware()] + list(middlewares or [])
+        self._handlers = {}
+
+    def _get_handler(self, method):
+        """Find the method handler of a method, or None"""
+        handler = self._handlers.get(method)
+        if handler is None:
+            details = _HandlerCallDetails(method, ())
+            for generic_handler in self._generic_handlers:
+                handler = generic_handler.service(details)
+                if handler is not None:
+                    self._handlers[method] = handler
+                    break
+        return handler
+
+    def has_method(self, method):
+        """Whether one of the servers serves a method, as a unary-unary method
+
+        Args:
+            method: full method name, e.g. /eagr.TestService/UnaryUnary
+        """
+        handler = self._get_handler(method)
+        return (
+            handler is not None and not handler.request_streaming and not handler.response_streaming
+        )
+
+    def _get_behavior(self, handler, method, context):
+        """Get the handler's behavior wrapped in the middleware decorators"""
+        metadata = {metadatum.key: metadatum.value for metadatum in context.invocation_metadata()}
+        behavior = handler.unary_unary
+        # The first middleware is the outermost, as with server interceptors
+        for middleware in reversed(self._middlewares):
+            decorator = middleware.get_decorator(method, metadata)
+            if decorator:
+                behavior = decorator(behavior)
+        return behavior
+
+    def _failed(self, context, code, details):
+        """Get the outcome of a failed call"""
+        return LocalOutcome(None, code, details, context.trailing_metadata())
+
+    def dispatch(self, method, request, context, serialized=False):
+        """Call a unary-unary method
+
+        Args:
+            method: full method name, e.g. /eagr.TestService/UnaryUnary
+            request: request message, or its serialization if serialized is set
+            context: LocalServicerContext of the call
+            serialized: whether the request is serialized and the response should be
+
+        Returns:
+            LocalOutcome of the call. The response is None unless the code is OK
+        """
+        try:
+            handler = self._get_handler(method)
+            if handler is None:
+                return self._failed(context, grpc.StatusCode.UNIMPLEMENTED, "Method not found!")
+            if handler.request_streaming or handler.response_streaming:
+                return self._failed(
+                    context,
+                    grpc.StatusCode.UNIMPLEMENTED,
+                    "Only unary-unary methods can be dispatched locally",
+                )
+            if serialized and handler.request_deserializer is not None:
+                try:
+                    request = handler.request_deserializer(request)
+                except Exception:  # pylint: disable=broad-except
+                    return self._failed(
+                        context, grpc.StatusCode.INTERNAL, "Exception deserializing request!"
+                    )
+            try:
+                response = self._get_behavior(handler, method, context)(request, context)
+            except LocalAbort as abort:
+                return self._failed(context, abort.code, abort.details)
+            except Exception as exc:  # pylint: disable=broad-except
+                return self._failed(
+                    context,
+                    context.code() or grpc.StatusCode.UNKNOWN,
+                    context.details() or "Exception calling application: {}".format(exc),
+                )
+            code = context.code() or grpc.StatusCode.OK
+            if code is not grpc.StatusCode.OK:
+                return self._failed(context, code, context.details())
+            if serialized and handler.response_serializer is not None:
+                response = handler.response_serializer(response)
+            return LocalOutcome(response, code, context.details(), context.trailing_metadata())
+        finally:
+            context.complete()
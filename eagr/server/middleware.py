@@ -1,8 +1,10 @@
 # Copyright 2020-present Kensho Technologies, LLC.
 import cProfile
 import functools
+import inspect
 import json
 import logging
+import threading
 
 from google.protobuf import json_format
 from google.protobuf.message import Message as ProtoMessage
@@ -25,6 +27,14 @@ METRICS_HISTO = prometheus_client.Histogram(
     labelnames=ENDPOINT_METRIC_LABELS,
 )
 
+# Holds the servicer context of the RPC being handled by the current thread
+_REQUEST_CONTEXT = threading.local()
+
+
+def get_current_servicer_context():
+    """Get the servicer context of the RPC handled by the current thread, or None"""
+    return getattr(_REQUEST_CONTEXT, "servicer_context", None)
+
 
 def _wrap_rpc_handler(method_handler, wrapper):
     """Wrap a GRPC rpc handler object in a decorator
@@ -271,3 +281,51 @@ class LoggingMiddleware(GRPCMiddleware):
         # Make sure that the method name is valid
         service_label, endpoint_label = _service_and_endpoint_labels_from_method(method_name)
         return self.Logger(service_label, endpoint_label, self._sanitizer)
+
+
+class RequestContextMiddleware(GRPCMiddleware):
+    """GRPC middleware that exposes the servicer context to code running inside a handler.
+
+    While a handler runs, get_current_servicer_context() returns its context. Clients created by
+    make_grpc_client use it to propagate the inbound deadline to outbound calls.
+    """
+
+    class ContextRecorder(object):
+        """Decorator that records the servicer context for the duration of the call"""
+
+        def __call__(self, fn):
+            """Wrap a method with the context recorder"""
+
+            @functools.wraps(fn)
+            def wrap(request, context):
+                """Inner wrapper"""
+                previous_context = get_current_servicer_context()
+                _REQUEST_CONTEXT.servicer_context = context
+                try:
+                    response = fn(request, context)
+                finally:
+                    _REQUEST_CONTEXT.servicer_context = previous_context
+                if inspect.isgenerator(response):
+                    # Streaming handlers run their body while the response is being consumed
+                    return _iterate_with_context(response, context)
+                return response
+
+            return wrap
+
+    def get_decorator(self, _, __):
+        """Return the context recording decorator"""
+        return self.ContextRecorder()
+
+
+def _iterate_with_context(response_iterator, context):
+    """Yield from the response iterator while recording the servicer context"""
+    while True:
+        previous_context = get_current_servicer_context()
+        _REQUEST_CONTEXT.servicer_context = context
+        try:
+            response = next(response_iterator)
+        except StopIteration:
+            return
+        finally:
+            _REQUEST_CONTEXT.servicer_context = previous_context
+        yield response
@@ -0,0 +1,143 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+"""Serving unary methods over long-lived tunnel streams
+
+Clients made by make_grpc_client with tunnel_unary_calls=True send their unary calls as messages
+of one bidirectional UnaryTunnel.Tunnel stream instead of opening an HTTP/2 stream per call. Every
+message carries a correlation id, so calls complete in any order.
+"""
+from concurrent import futures
+import logging
+import queue
+import threading
+
+import grpc
+
+from eagr.protos import tunnel_pb2, tunnel_pb2_grpc
+from eagr.server.base import GRPCBase
+from eagr.server.local_dispatch import LocalDispatcher, LocalServicerContext
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TUNNEL_WORKERS = 10
+
+_END_OF_STREAM = object()
+
+
+def _to_metadata(tunnel_metadata):
+    """Convert TunnelMetadatum messages into (key, value) pairs"""
+    return tuple((metadatum.key, metadatum.value) for metadatum in tunnel_metadata)
+
+
+def _to_tunnel_metadata(metadata):
+    """Convert (key, value) pairs into TunnelMetadatum messages"""
+    return [
+        tunnel_pb2.TunnelMetadatum(key=key, value=value)
+        for key, value in (metadata or ())
+        # Binary metadata values cannot be carried in the string field
+        if isinstance(value, str)
+    ]
+
+
+class UnaryTunnelServicer(GRPCBase, tunnel_pb2_grpc.UnaryTunnelServicer):
+    """Serves the unary-unary methods of GRPCBase servicers over tunnel streams.
+
+    Serve it next to the servicers themselves, which keep serving regular calls:
+
+        servicers = [ThingServicer(), OtherServicer()]
+        tunnel = UnaryTunnelServicer(servicers, middlewares=middlewares)
+        with run_grpc_servers(servicers + [tunnel], middlewares=middlewares, ...):
+            ...
+
+    Tunneled calls run on the tunnel's thread pool. The servicer methods and the get_decorator
+    part of the middlewares are applied as for regular calls, see LocalDispatcher.
+    """
+
+    _REGISTRAR = tunnel_pb2_grpc.add_UnaryTunnelServicer_to_server
+
+    def __init__(self, servers, middlewares=None, thread_pool=None):
+        """Initialize
+
+        Args:
+            servers: iterable of GRPCBase instances whose unary methods are served
+            middlewares: optional list of GRPCMiddleware objects applied to tunneled calls
+            thread_pool: optional executor running the tunneled calls. A pool of
+                         DEFAULT_TUNNEL_WORKERS threads by default
+        """
+        super(UnaryTunnelServicer, self).__init__()
+        self._dispatcher = LocalDispatcher(servers, middlewares)
+        if thread_pool is None:
+            thread_pool = futures.ThreadPoolExecutor(
+                max_workers=DEFAULT_TUNNEL_WORKERS, thread_name_prefix="UnaryTunnel"
+            )
+        self._thread_pool = thread_pool
+
+    def _handle(self, tunnel_request, peer):
+        """Run a tunneled call and build its response message"""
+        context = LocalServicerContext(
+            _to_metadata(tunnel_request.metadata),
+            timeout=tunnel_request.timeout or None,
+            peer=peer,
+        )
+        try:
+            outcome = self._dispatcher.dispatch(
+                tunnel_request.method, tunnel_request.payload, context, serialized=True
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.exception("Failed to dispatch tunneled call to %s", tunnel_request.method)
+            return tunnel_pb2.TunnelResponse(
+                correlation_id=tunnel_request.correlation_id,
+                code=grpc.StatusCode.INTERNAL.value[0],
+                details=str(exc),
+            )
+        return tunnel_pb2.TunnelResponse(
+            correlation_id=tunnel_request.correlation_id,
+            payload=outcome.response or b"",
+            code=outcome.code.value[0],
+            details=outcome.details or "",
+            trailing_metadata=_to_tunnel_metadata(outcome.trailing_metadata),
+        )
+
+    def Tunnel(self, request_iterator, context):
+        """Run the calls of a tunnel stream, streaming back their responses as they complete"""
+        responses = queue.Queue()
+        lock = threading.Lock()
+        # Calls in flight, plus one while requests are still being read
+        in_flight = [1]
+        peer = context.peer()
+
+        def finish_one():
+            """Count a finished call, ending the stream once all are finished"""
+            with lock:
+                in_flight[0] -= 1
+                finished = in_flight[0] == 0
+            if finished:
+                responses.put(_END_OF_STREAM)
+
+        def handle(tunnel_request):
+            """Run a call and queue its response"""
+            try:
+                responses.put(self._handle(tunnel_request, peer))
+            finally:
+                finish_one()
+
+        def read_requests():
+            """Submit every call of the stream to the thread pool"""
+            try:
+                for tunnel_request in request_iterator:
+                    with lock:
+                        in_flight[0] += 1
+                    self._thread_pool.submit(handle, tunnel_request)
+            except Exception:  # pylint: disable=broad-except
+                # The client went away; whatever is still running has no one to respond to
+                logger.debug("Tunnel stream from %s ended", peer, exc_info=True)
+            finally:
+                finish_one()
+
+        context.add_callback(lambda: responses.put(_END_OF_STREAM))
+        threading.Thread(target=read_requests, name="UnaryTunnelReader", daemon=True).start()
+        while True:
+            response = responses.get()
+            if response is _END_OF_STREAM:
+                return
+            yield response
@@ -0,0 +1,113 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+import threading
+import unittest
+
+from google.protobuf.wrappers_pb2 import StringValue
+
+from ...client import make_grpc_client
+from ...client.batching import AutoBatcher
+from ...client.client_test_helpers import inprocess_grpc_server
+from ...protos import test_service_pb2_grpc
+
+
+def merge_requests(requests):
+    """Merge string values into one comma separated value"""
+    return StringValue(value=",".join(request.value for request in requests))
+
+
+def split_response(batch_response, requests):
+    """Split a comma separated value back into string values"""
+    return [StringValue(value=value) for value in batch_response.value.split(",")]
+
+
+class BatchServicer(test_service_pb2_grpc.TestServiceServicer):
+    """Servicer that upper-cases a batch of comma separated values"""
+
+    def __init__(self):
+        """Initialize the batch size log"""
+        self.batch_sizes = []
+        self._lock = threading.Lock()
+
+    def UnaryUnary(self, request, context):
+        """Upper-case every value in the batch"""
+        with self._lock:
+            self.batch_sizes.append(len(request.value.split(",")))
+        return StringValue(value=request.value.upper())
+
+
+class TestAutoBatcher(unittest.TestCase):
+    def test_concurrent_calls_are_batched(self):
+        servicer = BatchServicer()
+        with inprocess_grpc_server(
+            servicer, test_service_pb2_grpc.add_TestServiceServicer_to_server
+        ) as address:
+            client = make_grpc_client(
+                "batching",
+                "bar",
+                address,
+                test_service_pb2_grpc.TestServiceStub,
+                disable_tracing=True,
+            )
+            batcher = AutoBatcher(
+                client.UnaryUnary,
+                merge_requests,
+                split_response,
+                max_batch_size=10,
+                max_delay_seconds=0.5,
+            )
+            values = ["value{}".format(i) for i in range(20)]
+            result_futures = [batcher.future(StringValue(value=value)) for value in values]
+            results = [result_future.result(timeout=5) for result_future in result_futures]
+            batcher.close()
+
+        self.assertEqual([StringValue(value=value.upper()) for value in values], results)
+        self.assertEqual([10, 10], servicer.batch_sizes)
+
+    def test_partial_batch_sent_after_delay(self):
+        servicer = BatchServicer()
+        with inprocess_grpc_server(
+            servicer, test_service_pb2_grpc.add_TestServiceServicer_to_server
+        ) as address:
+            client = make_grpc_client(
+                "batching",
+                "bar",
+                address,
+                test_service_pb2_grpc.TestServiceStub,
+                disable_tracing=True,
+            )
+            batcher = AutoBatcher(
+                client.UnaryUnary, merge_requests, split_response, max_delay_seconds=0.01
+            )
+            self.assertEqual(StringValue(value="FOO"), batcher(StringValue(value="foo"), 5))
+            batcher.close()
+
+        self.assertEqual([1], servicer.batch_sizes)
+
+    def test_errors_are_propagated_to_every_caller(self):
+        def failing_method(batch_request):
+            """Fail every batch"""
+            raise ConnectionRefusedError()
+
+        batcher = AutoBatcher(failing_method, merge_requests, split_response, max_batch_size=2)
+        result_futures = [batcher.future(StringValue(value=value)) for value in ("a", "b")]
+        for result_future in result_futures:
+            with self.assertRaises(ConnectionRefusedError):
+                result_future.result(timeout=5)
+        batcher.close()
+
+    def test_mismatched_split_fails_batch(self):
+        batcher = AutoBatcher(
+            lambda batch_request: batch_request,
+            merge_requests,
+            lambda batch_response, requests: [],
+            max_batch_size=1,
+        )
+        with self.assertRaises(ValueError):
+            batcher(StringValue(value="a"), timeout=5)
+        batcher.close()
+
+    def test_closed_batcher_rejects_requests(self):
+        batcher = AutoBatcher(lambda batch_request: batch_request, merge_requests, split_response)
+        batcher.close()
+        with self.assertRaises(RuntimeError):
+            batcher.future(StringValue(value="a"))
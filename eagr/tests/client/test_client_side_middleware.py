@@ -0,0 +1,362 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from google.protobuf.wrappers_pb2 import StringValue
+import grpc
+from prometheus_client.core import REGISTRY
+
+from ...client.call_futures import FailedCall, RejectedCall, RetryingCall, TranslatedCall
+from ...client.client_side_middleware import (
+    ClientAdaptiveThrottlingMiddleware,
+    ClientCompressionMiddleware,
+    ClientDeadlineMiddleware,
+    CompressionPolicy,
+    FusedClientInterceptor,
+    GRPCClientGeneralInterceptor,
+    GRPCClientMiddleware,
+    GRPCClientUnaryOutputInterceptor,
+    _ClientCallDetails,
+)
+from ...server.middleware import RequestContextMiddleware, get_current_servicer_context
+
+
+METHOD_NAME = "/eagr.TestService/UnaryUnary"
+
+
+def _make_call_details(timeout=None):
+    """Make client call details for the test method"""
+    return _ClientCallDetails(METHOD_NAME, timeout, None, None, None, None)
+
+
+def _get_outbound_timeout(decorator, client_call_details):
+    """Run the decorated continuation and return the timeout it was called with"""
+    return decorator(lambda details, request: details.timeout)(client_call_details, None)
+
+
+def _run_in_handler(time_remaining, fn):
+    """Run fn inside a fake server handler whose deadline is time_remaining seconds away"""
+    servicer_context = MagicMock()
+    servicer_context.time_remaining.return_value = time_remaining
+    decorator = RequestContextMiddleware().get_decorator(METHOD_NAME, {})
+    return decorator(lambda request, context: fn())(None, servicer_context)
+
+
+class TestClientDeadlineMiddleware(unittest.TestCase):
+    def test_default_timeouts(self):
+        middleware = ClientDeadlineMiddleware(
+            "foo", "bar", default_timeout=5, method_timeouts={"UnaryUnary": 2}
+        )
+        decorator = middleware.get_decorator(METHOD_NAME, {})
+        self.assertEqual(2, _get_outbound_timeout(decorator, _make_call_details()))
+        # Explicit timeouts win over the defaults
+        self.assertEqual(7, _get_outbound_timeout(decorator, _make_call_details(7)))
+
+        other_decorator = middleware.get_decorator("/eagr.TestService/UnaryStream", {})
+        self.assertEqual(5, _get_outbound_timeout(other_decorator, _make_call_details()))
+
+    def test_no_decorator_without_configuration(self):
+        middleware = ClientDeadlineMiddleware("foo", "bar")
+        self.assertIsNone(middleware.get_decorator(METHOD_NAME, {}))
+
+    def test_inbound_deadline_propagation(self):
+        middleware = ClientDeadlineMiddleware(
+            "foo", "bar", default_timeout=5, propagation_margin=0.5
+        )
+        decorator = middleware.get_decorator(METHOD_NAME, {})
+
+        def get_timeout():
+            """Get the outbound timeout of a call without explicit timeout"""
+            return _get_outbound_timeout(decorator, _make_call_details())
+
+        self.assertEqual(5, get_timeout())
+        self.assertEqual(1.5, _run_in_handler(2.0, get_timeout))
+        # The default still applies when it is shorter than the inbound deadline
+        self.assertEqual(5, _run_in_handler(60.0, get_timeout))
+        # An expired inbound deadline makes the outbound call fail right away
+        self.assertEqual(0, _run_in_handler(0.1, get_timeout))
+        # No inbound deadline at all
+        self.assertEqual(5, _run_in_handler(9.2e18, get_timeout))
+        self.assertIsNone(get_current_servicer_context())
+
+
+class TestClientCompressionMiddleware(unittest.TestCase):
+    def _get_compression(self, middleware, request, compression=None):
+        """Run the decorated continuation and return the compression it was called with"""
+        client_call_details = _ClientCallDetails(METHOD_NAME, None, None, None, None, compression)
+        decorator = middleware.get_decorator(METHOD_NAME, {})
+        return decorator(lambda details, _: details.compression)(client_call_details, request)
+
+    def test_size_threshold(self):
+        middleware = ClientCompressionMiddleware(
+            "compression", "bar", default_policy=CompressionPolicy(100, grpc.Compression.Gzip)
+        )
+        labels = {
+            "client_name": "compression",
+            "server_name": "bar",
+            "service": "eagr_TestService",
+            "endpoint": "UnaryUnary",
+        }
+        small_request = StringValue(value="a" * 10)
+        large_request = StringValue(value="a" * 1000)
+        self.assertIsNone(self._get_compression(middleware, small_request))
+        self.assertEqual(grpc.Compression.Gzip, self._get_compression(middleware, large_request))
+        self.assertEqual(
+            small_request.ByteSize(),
+            REGISTRY.get_sample_value(
+                "clientside_grpc_request_bytes_total", dict(labels, compression="identity")
+            ),
+        )
+        self.assertEqual(
+            large_request.ByteSize(),
+            REGISTRY.get_sample_value(
+                "clientside_grpc_request_bytes_total", dict(labels, compression="gzip")
+            ),
+        )
+        # Explicit compression and streaming requests are left alone
+        self.assertEqual(
+            grpc.Compression.NoCompression,
+            self._get_compression(middleware, large_request, grpc.Compression.NoCompression),
+        )
+        self.assertIsNone(self._get_compression(middleware, iter([large_request])))
+
+    def test_compression_sampling(self):
+        middleware = ClientCompressionMiddleware(
+            "compression_sampling",
+            "bar",
+            default_policy=CompressionPolicy(0, grpc.Compression.Deflate),
+            sample_rate=1,
+        )
+        self.assertEqual(
+            grpc.Compression.Deflate,
+            self._get_compression(middleware, StringValue(value="a" * 1000)),
+        )
+        labels = {
+            "client_name": "compression_sampling",
+            "server_name": "bar",
+            "service": "eagr_TestService",
+            "endpoint": "UnaryUnary",
+            "compression": "deflate",
+        }
+        before = REGISTRY.get_sample_value(
+            "clientside_grpc_request_compression_sample_bytes_total", dict(labels, stage="before")
+        )
+        after = REGISTRY.get_sample_value(
+            "clientside_grpc_request_compression_sample_bytes_total", dict(labels, stage="after")
+        )
+        self.assertLess(after, before)
+
+    def test_method_policies(self):
+        middleware = ClientCompressionMiddleware(
+            "compression",
+            "bar",
+            default_policy=CompressionPolicy(0, grpc.Compression.Gzip),
+            method_policies={"UnaryUnary": None},
+        )
+        self.assertIsNone(middleware.get_decorator(METHOD_NAME, {}))
+        self.assertIsNotNone(middleware.get_decorator("/eagr.TestService/UnaryStream", {}))
+        with self.assertRaises(ValueError):
+            ClientCompressionMiddleware(
+                "compression", "bar", CompressionPolicy(0, grpc.Compression.NoCompression)
+            )
+
+
+class TestClientAdaptiveThrottlingMiddleware(unittest.TestCase):
+    def _make_calls(self, middleware, num_calls, outcome):
+        """Make calls through the middleware, returning how many of them got sent"""
+        sent_calls = []
+
+        def continuation(client_call_details, request):
+            """Record the call and return the outcome"""
+            sent_calls.append(request)
+            return outcome
+
+        decorated = middleware.get_decorator(METHOD_NAME, {})(continuation)
+        for i in range(num_calls):
+            call = decorated(_make_call_details(), i)
+            if call is not outcome:
+                self.assertEqual(grpc.StatusCode.RESOURCE_EXHAUSTED, call.code())
+        return len(sent_calls)
+
+    @patch("eagr.client.client_side_middleware.random.random", return_value=0.5)
+    def test_throttling(self, _):
+        middleware = ClientAdaptiveThrottlingMiddleware("throttling", "bar", k=2)
+        accepted = FailedCall(ValueError())
+        rejected = RejectedCall(grpc.StatusCode.UNAVAILABLE, "overloaded")
+
+        self.assertEqual(10, self._make_calls(middleware, 10, accepted))
+        self.assertEqual(0, middleware.throttle_probability())
+        # 10 accepts allow up to 20 requests before throttling starts
+        self.assertEqual(10, self._make_calls(middleware, 10, rejected))
+        self.assertEqual(0, middleware.throttle_probability())
+        self.assertLess(self._make_calls(middleware, 40, rejected), 40)
+        self.assertGreater(middleware.throttle_probability(), 0.5)
+        self.assertGreater(
+            REGISTRY.get_sample_value(
+                "clientside_grpc_throttle_probability",
+                {"client_name": "throttling", "server_name": "bar"},
+            ),
+            0.5,
+        )
+
+    def test_sliding_window(self):
+        middleware = ClientAdaptiveThrottlingMiddleware("throttling", "bar", window_seconds=0.2)
+        self._make_calls(middleware, 10, RejectedCall(grpc.StatusCode.RESOURCE_EXHAUSTED, ""))
+        self.assertGreater(middleware.throttle_probability(), 0.5)
+        time.sleep(0.3)
+        self.assertEqual(0, middleware.throttle_probability())
+
+
+class RecordingMiddleware(GRPCClientMiddleware):
+    """Middleware that records the order in which its decorators run"""
+
+    def __init__(self, name, log, interceptor_class, metadata_dependent=False):
+        """Initialize with a name and a shared log"""
+        super(RecordingMiddleware, self).__init__("foo", "bar", interceptor_class)
+        self._name = name
+        self._log = log
+        self.metadata_dependent = metadata_dependent
+        self.get_decorator_calls = []
+
+    def get_decorator(self, method_name, metadata):
+        """Return a decorator that logs the middleware name"""
+        self.get_decorator_calls.append((method_name, metadata))
+
+        def decorator(fn):
+            """Log, then call through"""
+
+            def wrap(client_call_details, request):
+                """Inner wrapper"""
+                self._log.append(self._name)
+                return fn(client_call_details, request)
+
+            return wrap
+
+        return decorator
+
+
+class TestFusedClientInterceptor(unittest.TestCase):
+    def test_order_and_caching(self):
+        log = []
+        outer = RecordingMiddleware("outer", log, GRPCClientGeneralInterceptor)
+        unary_only = RecordingMiddleware("unary_only", log, GRPCClientUnaryOutputInterceptor)
+        dynamic = RecordingMiddleware(
+            "dynamic", log, GRPCClientGeneralInterceptor, metadata_dependent=True
+        )
+        interceptor = FusedClientInterceptor([outer, unary_only, dynamic])
+
+        def continuation(client_call_details, request):
+            """Log the call"""
+            log.append("continuation")
+            return request
+
+        details = _ClientCallDetails(METHOD_NAME, None, (("key", "value"),), None, None, None)
+        for _ in range(2):
+            self.assertEqual(1, interceptor.intercept_unary_unary(continuation, details, 1))
+        self.assertEqual(["outer", "unary_only", "dynamic", "continuation"] * 2, log)
+
+        # Metadata-independent decorators are computed once per method
+        self.assertEqual([(METHOD_NAME, {})], outer.get_decorator_calls)
+        self.assertEqual(
+            [(METHOD_NAME, {"key": "value"})] * 2,
+            dynamic.get_decorator_calls,
+        )
+
+        # Unary-output middlewares are skipped for streaming responses
+        del log[:]
+        interceptor.intercept_unary_stream(continuation, details, 1)
+        self.assertEqual(["outer", "dynamic", "continuation"], log)
+
+    def test_inner_exceptions_become_failed_calls(self):
+        seen_by_outer = []
+
+        class Outer(GRPCClientMiddleware):
+            """Record what the inner handler returns"""
+
+            metadata_dependent = False
+
+            def get_decorator(self, method_name, metadata):
+                """Return a recording decorator"""
+
+                def decorator(fn):
+                    """Record the result of fn"""
+
+                    def wrap(client_call_details, request):
+                        """Inner wrapper"""
+                        result = fn(client_call_details, request)
+                        seen_by_outer.append(result)
+                        return result
+
+                    return wrap
+
+                return decorator
+
+        class Inner(Outer):
+            """Raise from the decorator"""
+
+            def get_decorator(self, method_name, metadata):
+                """Return a failing decorator"""
+
+                def decorator(fn):
+                    """Raise instead of calling fn"""
+
+                    def wrap(client_call_details, request):
+                        """Inner wrapper"""
+                        raise TimeoutError()
+
+                    return wrap
+
+                return decorator
+
+        interceptor = FusedClientInterceptor(
+            [
+                Outer("foo", "bar", GRPCClientUnaryOutputInterceptor),
+                Inner("foo", "bar", GRPCClientUnaryOutputInterceptor),
+            ]
+        )
+        details = _make_call_details()
+        call = interceptor.intercept_unary_unary(lambda details, request: None, details, 1)
+        self.assertEqual([call], seen_by_outer)
+        self.assertIsInstance(call.exception(), TimeoutError)
+        with self.assertRaises(TimeoutError):
+            call.result()
+
+
+class TestRetryingCall(unittest.TestCase):
+    @patch("eagr.client.call_futures.backoff.full_jitter", return_value=0)
+    def test_synchronous_attempts_are_retried(self, _):
+        attempts = []
+
+        def issue_call():
+            """Fail the first two attempts"""
+            attempts.append(None)
+            if len(attempts) < 3:
+                return FailedCall(ConnectionRefusedError())
+            return TranslatedCall(FailedCall(ValueError()), lambda exc: exc)
+
+        call = RetryingCall(issue_call, (ConnectionRefusedError,), 5)
+        self.assertTrue(call.done())
+        self.assertEqual(3, len(attempts))
+        self.assertIsInstance(call.exception(), ValueError)
+
+    @patch("eagr.client.call_futures.backoff.full_jitter", return_value=0)
+    def test_max_tries(self, _):
+        attempts = []
+
+        def issue_call():
+            """Always fail"""
+            attempts.append(None)
+            return FailedCall(ConnectionRefusedError())
+
+        call = RetryingCall(issue_call, (ConnectionRefusedError,), 2)
+        with self.assertRaises(ConnectionRefusedError):
+            call.result()
+        self.assertEqual(2, len(attempts))
+
+    def test_completed_call_cannot_be_cancelled(self):
+        done_calls = []
+        call = RetryingCall(lambda: FailedCall(ConnectionRefusedError()), (Exception,), 1)
+        call.add_done_callback(done_calls.append)
+        self.assertEqual([call], done_calls)
+        self.assertFalse(call.cancel())
@@ -0,0 +1,84 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+import unittest
+from unittest.mock import MagicMock
+
+from google.protobuf.wrappers_pb2 import StringValue
+import opentracing
+from opentracing.mocktracer import MockTracer
+from opentracing_instrumentation.request_context import span_in_context
+from prometheus_client.core import REGISTRY
+
+from ...client import make_grpc_client
+from ...client.client_test_helpers import inprocess_grpc_server
+from ...client.client_tracing import is_call_sampled
+from ...protos import test_service_pb2_grpc
+
+
+TRACE_ID_HEADER = "ot-tracer-traceid"
+
+
+class TestSamplingAwareTracing(unittest.TestCase):
+    def setUp(self):
+        self.previous_tracer = opentracing.global_tracer()
+        self.tracer = MockTracer()
+        opentracing.set_global_tracer(self.tracer)
+        self.received_metadata = []
+
+        def unary_unary(request, context):
+            """Record the metadata and reflect"""
+            self.received_metadata.append(dict(context.invocation_metadata()))
+            return request
+
+        self.servicer = MagicMock(test_service_pb2_grpc.TestServiceServicer)
+        self.servicer.UnaryUnary = unary_unary
+
+    def tearDown(self):
+        opentracing.set_global_tracer(self.previous_tracer)
+
+    def _call(self, sampling_predicate=None):
+        """Make a call with a traced client"""
+        with inprocess_grpc_server(
+            self.servicer, test_service_pb2_grpc.add_TestServiceServicer_to_server
+        ) as address:
+            client = make_grpc_client(
+                "tracing",
+                "bar",
+                address,
+                test_service_pb2_grpc.TestServiceStub,
+                tracing_sampling_predicate=sampling_predicate,
+            )
+            unary_value = StringValue(value="foo")
+            self.assertEqual(unary_value, client.UnaryUnary(unary_value))
+
+    def test_sampled_calls_are_traced(self):
+        self._call()
+        self.assertEqual(
+            ["/eagr.TestService/UnaryUnary"],
+            [span.operation_name for span in self.tracer.finished_spans()],
+        )
+        self.assertIn(TRACE_ID_HEADER, self.received_metadata[0])
+
+    def test_unsampled_calls_are_not_traced(self):
+        labels = {"sampled": "false"}
+        unsampled_before = (
+            REGISTRY.get_sample_value("clientside_grpc_tracing_overhead_count", labels) or 0
+        )
+        parent_span = self.tracer.start_span("parent")
+        parent_span.is_sampled = lambda: False
+        with span_in_context(parent_span):
+            self._call()
+        self.assertEqual([], self.tracer.finished_spans())
+        self.assertNotIn(TRACE_ID_HEADER, self.received_metadata[0])
+        self.assertEqual(
+            1,
+            REGISTRY.get_sample_value("clientside_grpc_tracing_overhead_count", labels)
+            - unsampled_before,
+        )
+
+    def test_custom_sampling_predicate(self):
+        self._call(sampling_predicate=lambda tracer, active_span: False)
+        self.assertEqual([], self.tracer.finished_spans())
+
+    def test_noop_tracer_is_never_sampled(self):
+        self.assertFalse(is_call_sampled(opentracing.Tracer(), None))
+        self.assertTrue(is_call_sampled(self.tracer, None))
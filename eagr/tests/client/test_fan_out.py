@@ -0,0 +1,99 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+import threading
+import time
+import unittest
+
+from google.protobuf.wrappers_pb2 import StringValue
+
+from ...client import make_grpc_client
+from ...client.client_test_helpers import inprocess_grpc_server
+from ...client.fan_out import map_unordered
+from ...protos import test_service_pb2_grpc
+
+
+class ConcurrencyTrackingServicer(test_service_pb2_grpc.TestServiceServicer):
+    """Reflecting servicer that tracks the maximum number of concurrent calls"""
+
+    def __init__(self, delay):
+        """Initialize the concurrency counters"""
+        self._delay = delay
+        self._lock = threading.Lock()
+        self._concurrent_calls = 0
+        self.max_concurrent_calls = 0
+
+    def UnaryUnary(self, request, context):
+        """Sleep, then reflect"""
+        with self._lock:
+            self._concurrent_calls += 1
+            self.max_concurrent_calls = max(self.max_concurrent_calls, self._concurrent_calls)
+        try:
+            time.sleep(float(request.value.split(":")[1]) if ":" in request.value else self._delay)
+            return request
+        finally:
+            with self._lock:
+                self._concurrent_calls -= 1
+
+
+class TestMapUnordered(unittest.TestCase):
+    def _run_with_client(self, servicer, fn):
+        """Run fn with a client to an in-process server for the servicer"""
+        with inprocess_grpc_server(
+            servicer, test_service_pb2_grpc.add_TestServiceServicer_to_server, num_threads=8
+        ) as address:
+            client = make_grpc_client(
+                "fan_out",
+                "bar",
+                address,
+                test_service_pb2_grpc.TestServiceStub,
+                disable_tracing=True,
+            )
+            return fn(client)
+
+    def test_bounded_concurrency(self):
+        servicer = ConcurrencyTrackingServicer(0.01)
+        pulled_requests = []
+
+        def requests():
+            """Generate requests, logging how many got pulled"""
+            for i in range(20):
+                pulled_requests.append(i)
+                yield StringValue(value=str(i))
+
+        def run(client):
+            """Collect all responses"""
+            responses = map_unordered(client.UnaryUnary, requests(), max_in_flight=4)
+            first_response = next(responses)
+            # Requests are pulled lazily
+            self.assertLessEqual(len(pulled_requests), 5)
+            return [first_response] + list(responses)
+
+        responses = self._run_with_client(servicer, run)
+        self.assertEqual(
+            sorted(str(i) for i in range(20)), sorted(response.value for response in responses)
+        )
+        self.assertLessEqual(servicer.max_concurrent_calls, 4)
+
+    def test_completion_order(self):
+        servicer = ConcurrencyTrackingServicer(0)
+
+        def run(client):
+            """Collect all responses"""
+            requests = [StringValue(value="slow:0.5"), StringValue(value="fast:0")]
+            return [response.value for response in map_unordered(client.UnaryUnary, requests)]
+
+        self.assertEqual(["fast:0", "slow:0.5"], self._run_with_client(servicer, run))
+
+    def test_errors_are_translated(self):
+        servicer = ConcurrencyTrackingServicer(0)
+
+        def run(client):
+            """Consume responses of a call that times out"""
+            requests = [StringValue(value="slow:2")]
+            with self.assertRaises(TimeoutError):
+                list(map_unordered(client.UnaryUnary, requests, timeout=0.2))
+
+        self._run_with_client(servicer, run)
+
+    def test_invalid_max_in_flight(self):
+        with self.assertRaises(ValueError):
+            next(map_unordered(None, [], max_in_flight=0))
@@ -0,0 +1,151 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+import functools
+import threading
+import time
+import unittest
+
+from google.protobuf.wrappers_pb2 import StringValue
+import grpc
+from prometheus_client import REGISTRY
+
+from ...client import make_grpc_client
+from ...client.client_test_helpers import inprocess_grpc_server
+from ...protos import test_service_pb2_grpc
+from ...server import GRPCBase
+from ...server.middleware import GRPCMiddleware
+from ...server.tunnel import UnaryTunnelServicer
+
+
+class CoLocatedServicer(GRPCBase, test_service_pb2_grpc.TestServiceServicer):
+    """Servicer recording the requests and threads of its unary method"""
+
+    _REGISTRAR = test_service_pb2_grpc.add_TestServiceServicer_to_server
+
+    def __init__(self):
+        """Initialize without requests"""
+        self.requests = []
+        self.threads = []
+
+    def UnaryUnary(self, request, context):
+        """Reflect, sleep or abort depending on the request"""
+        self.requests.append(request)
+        self.threads.append(threading.current_thread())
+        if request.value.startswith("slow:"):
+            time.sleep(float(request.value.split(":")[1]))
+        elif request.value == "abort":
+            context.abort(grpc.StatusCode.NOT_FOUND, "nothing here")
+        elif request.value == "metadata":
+            return StringValue(value=dict(context.invocation_metadata())["key"])
+        return request
+
+    def UnaryStream(self, request, context):
+        """Stream the request back twice"""
+        yield request
+        yield request
+
+
+class ExclaimingMiddleware(GRPCMiddleware):
+    """Server middleware appending an exclamation mark to the response"""
+
+    def get_decorator(self, _, __):
+        """Return the decorator appending the exclamation mark"""
+
+        def decorator(fn):
+            """Append the exclamation mark"""
+
+            @functools.wraps(fn)
+            def wrap(request, context):
+                """Inner wrapper"""
+                return StringValue(value=fn(request, context).value + "!")
+
+            return wrap
+
+        return decorator
+
+
+class TestInProcess(unittest.TestCase):
+    def make_client(self, servicer, **kwargs):
+        return make_grpc_client(
+            "in_process",
+            "bar",
+            kwargs.pop("service_url", None),
+            test_service_pb2_grpc.TestServiceStub,
+            disable_tracing=True,
+            in_process_servers=servicer,
+            **kwargs
+        )
+
+    def test_dispatch(self):
+        servicer = CoLocatedServicer()
+        client = self.make_client(servicer, in_process_middlewares=[ExclaimingMiddleware()])
+        labels = {
+            "client_name": "in_process",
+            "server_name": "bar",
+            "service": "eagr_TestService",
+            "endpoint": "UnaryUnary",
+        }
+        calls_before = REGISTRY.get_sample_value("clientside_grpc_endpoint_count", labels) or 0
+
+        request = StringValue(value="foo")
+        self.assertEqual("foo!", client.UnaryUnary(request).value)
+        self.assertEqual(
+            "key!",
+            client.UnaryUnary(StringValue(value="metadata"), metadata=(("key", "key"),)).value,
+        )
+        self.assertEqual("foo!", client.UnaryUnary.future(request).result().value)
+        # Blocking calls run on the calling thread, and the request was serialized
+        self.assertIs(threading.current_thread(), servicer.threads[0])
+        self.assertIsNot(request, servicer.requests[0])
+        # The client middlewares were applied
+        self.assertEqual(
+            3, REGISTRY.get_sample_value("clientside_grpc_endpoint_count", labels) - calls_before
+        )
+
+        with self.assertRaises(grpc.RpcError) as raised:
+            client.UnaryUnary(StringValue(value="abort"))
+        self.assertEqual(grpc.StatusCode.NOT_FOUND, raised.exception.code())
+        self.assertEqual("nothing here", raised.exception.details())
+
+    def test_skip_serialization(self):
+        servicer = CoLocatedServicer()
+        client = self.make_client(servicer, skip_serialization=True)
+        request = StringValue(value="foo")
+        self.assertIs(request, client.UnaryUnary(request))
+        self.assertIs(request, servicer.requests[0])
+
+    def test_deadline(self):
+        client = self.make_client(CoLocatedServicer())
+        # Deadline exceeded is translated into a TimeoutError
+        with self.assertRaises(TimeoutError):
+            client.UnaryUnary(StringValue(value="slow:0.2"), timeout=0.05)
+
+    def test_streaming_methods(self):
+        servicer = CoLocatedServicer()
+        request = StringValue(value="foo")
+        client = self.make_client(servicer)
+        with self.assertRaises(grpc.RpcError) as raised:
+            list(client.UnaryStream(request))
+        self.assertEqual(grpc.StatusCode.UNIMPLEMENTED, raised.exception.code())
+
+        # With a service url, the calls that cannot be dispatched in-process go to the network
+        with inprocess_grpc_server(
+            servicer, test_service_pb2_grpc.add_TestServiceServicer_to_server
+        ) as address:
+            client = self.make_client(servicer, service_url=address)
+            self.assertEqual([request, request], list(client.UnaryStream(request)))
+            self.assertEqual(request, client.UnaryUnary(request))
+            self.assertEqual(1, len(servicer.threads))
+
+    def test_methods_not_served_in_process(self):
+        servicer = CoLocatedServicer()
+        request = StringValue(value="foo")
+        with inprocess_grpc_server(
+            servicer, test_service_pb2_grpc.add_TestServiceServicer_to_server
+        ) as address:
+            # Only the servers living in this process serve TestService
+            client = self.make_client(UnaryTunnelServicer([]), service_url=address)
+            self.assertEqual(request, client.UnaryUnary(request))
+            self.assertEqual(request, client.UnaryUnary.future(request).result())
+        # The calls went through the network
+        self.assertEqual(2, len(servicer.threads))
+        self.assertNotIn(threading.current_thread(), servicer.threads)
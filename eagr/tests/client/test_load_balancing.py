@@ -0,0 +1,158 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from google.protobuf.wrappers_pb2 import StringValue
+import grpc
+
+from ...client import make_grpc_client
+from ...client.client_test_helpers import inprocess_grpc_server
+from ...client.load_balancing import LatencyAwareChannel, get_endpoint_stats, resolve_endpoints
+from ...protos import test_service_pb2_grpc
+
+
+def _make_servicer(delay):
+    """Make a reflecting servicer that takes delay seconds to respond"""
+    servicer = MagicMock(test_service_pb2_grpc.TestServiceServicer)
+
+    def unary_unary(request, context):
+        """Sleep, then reflect"""
+        time.sleep(delay)
+        return request
+
+    servicer.UnaryUnary = unary_unary
+    return servicer
+
+
+def _make_failing_servicer():
+    """Make a servicer failing every call right away"""
+    servicer = MagicMock(test_service_pb2_grpc.TestServiceServicer)
+
+    def unary_unary(request, context):
+        """Fail"""
+        context.abort(grpc.StatusCode.UNAVAILABLE, "Failing")
+
+    servicer.UnaryUnary = unary_unary
+    return servicer
+
+
+class TestLatencyAwareLoadBalancing(unittest.TestCase):
+    def test_slow_endpoint_gets_less_traffic(self):
+        add_servicer = test_service_pb2_grpc.add_TestServiceServicer_to_server
+        with inprocess_grpc_server(_make_servicer(0), add_servicer) as fast_address:
+            with inprocess_grpc_server(_make_servicer(0.05), add_servicer) as slow_address:
+                client = make_grpc_client(
+                    "balancing",
+                    "bar",
+                    [fast_address, slow_address],
+                    test_service_pb2_grpc.TestServiceStub,
+                    disable_tracing=True,
+                )
+                unary_value = StringValue(value="foo")
+                for _ in range(30):
+                    self.assertEqual(unary_value, client.UnaryUnary(unary_value))
+                self.assertEqual(unary_value, client.UnaryUnary.future(unary_value).result())
+
+                # Give the done callback of the future a chance to run
+                time.sleep(0.1)
+                stats = get_endpoint_stats(client)
+
+        self.assertEqual({fast_address, slow_address}, set(stats))
+        self.assertEqual(31, sum(endpoint.calls for endpoint in stats.values()))
+        self.assertEqual(0, sum(endpoint.in_flight for endpoint in stats.values()))
+        self.assertGreater(stats[fast_address].calls, stats[slow_address].calls)
+        self.assertLess(
+            stats[fast_address].ewma_latency_seconds, stats[slow_address].ewma_latency_seconds
+        )
+
+    def test_errors_are_counted(self):
+        channel = LatencyAwareChannel(
+            grpc.insecure_channel, "balancing", "bar", endpoints=["localhost:1"]
+        )
+        stub = test_service_pb2_grpc.TestServiceStub(channel)
+        with self.assertRaises(grpc.RpcError):
+            stub.UnaryUnary(StringValue(value="foo"), timeout=1)
+        stats = channel.endpoint_stats()["localhost:1"]
+        self.assertEqual((0, 1, 1), (stats.in_flight, stats.calls, stats.errors))
+        channel.close()
+
+    def test_failing_endpoint_gets_less_traffic(self):
+        add_servicer = test_service_pb2_grpc.add_TestServiceServicer_to_server
+        with inprocess_grpc_server(_make_servicer(0.01), add_servicer) as healthy_address:
+            with inprocess_grpc_server(_make_failing_servicer(), add_servicer) as failing_address:
+                channel = LatencyAwareChannel(
+                    grpc.insecure_channel,
+                    "balancing",
+                    "bar",
+                    endpoints=[healthy_address, failing_address],
+                )
+                stub = test_service_pb2_grpc.TestServiceStub(channel)
+                for _ in range(30):
+                    try:
+                        stub.UnaryUnary(StringValue(value="foo"), timeout=5)
+                    except grpc.RpcError as exc:
+                        self.assertEqual(grpc.StatusCode.UNAVAILABLE, exc.code())
+                stats = channel.endpoint_stats()
+                channel.close()
+
+        # Failing fast must not make the endpoint look fast
+        self.assertEqual(stats[failing_address].calls, stats[failing_address].errors)
+        self.assertIsNone(stats[failing_address].ewma_latency_seconds)
+        self.assertLess(stats[failing_address].calls, 3)
+
+    def test_endpoint_updates(self):
+        channel_factory = MagicMock()
+        channel = LatencyAwareChannel(channel_factory, "balancing", "bar", endpoints=["a:1", "b:1"])
+        channel._set_endpoints(["b:1", "c:1"])
+        self.assertEqual({"b:1", "c:1"}, set(channel.endpoint_stats()))
+        self.assertEqual(3, channel_factory.call_count)
+        # The removed idle endpoint's channel got closed
+        channel_factory.return_value.close.assert_called()
+        channel.close()
+
+    def test_endpoint_without_latency_gets_prior(self):
+        channel = LatencyAwareChannel(MagicMock(), "balancing", "bar", endpoints=["a:1", "b:1"])
+        known, unknown = sorted(channel._endpoints, key=lambda endpoint: endpoint.target)
+        known.ewma_latency = 0.05
+        # A call hangs on the endpoint without latency samples, it should not win every pick
+        unknown.in_flight = 1
+        for _ in range(5):
+            self.assertIs(known, channel._acquire())
+            known.in_flight = 0
+        channel.close()
+
+    def test_closed_channel(self):
+        channel = LatencyAwareChannel(MagicMock(), "balancing", "bar", endpoints=["a:1", "b:1"])
+        channel.close()
+        stub = test_service_pb2_grpc.TestServiceStub(channel)
+        with self.assertRaises(grpc.RpcError) as raised:
+            stub.UnaryUnary(StringValue(value="foo"))
+        self.assertEqual(grpc.StatusCode.UNAVAILABLE, raised.exception.code())
+        future = stub.UnaryUnary.future(StringValue(value="foo"))
+        self.assertEqual(grpc.StatusCode.UNAVAILABLE, future.exception().code())
+        with self.assertRaises(grpc.RpcError):
+            list(stub.UnaryStream(StringValue(value="foo")))
+
+    def test_resolve_endpoints(self):
+        endpoints = resolve_endpoints("dns:///localhost:1234")
+        self.assertTrue(endpoints)
+        for endpoint in endpoints:
+            self.assertTrue(endpoint.endswith(":1234"))
+        self.assertTrue({"127.0.0.1:1234", "[::1]:1234"} & set(endpoints))
+
+    def test_no_endpoints(self):
+        with self.assertRaises(ValueError):
+            LatencyAwareChannel(grpc.insecure_channel, "balancing", "bar", endpoints=[])
+        with self.assertRaises(ValueError):
+            LatencyAwareChannel(grpc.insecure_channel, "balancing", "bar")
+
+    def test_aggregate_connectivity(self):
+        add_servicer = test_service_pb2_grpc.add_TestServiceServicer_to_server
+        with inprocess_grpc_server(_make_servicer(0), add_servicer) as address:
+            channel = LatencyAwareChannel(
+                grpc.insecure_channel, "balancing", "bar", endpoints=["localhost:1", address]
+            )
+            # One reachable endpoint is enough for the channel to be ready
+            grpc.channel_ready_future(channel).result(timeout=5)
+            channel.close()
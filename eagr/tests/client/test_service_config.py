@@ -0,0 +1,111 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+import json
+import unittest
+
+from google.protobuf.wrappers_pb2 import StringValue
+import grpc
+
+from ...client import make_grpc_client
+from ...client.client_test_helpers import inprocess_grpc_server
+from ...client.service_config import MethodConfigMatcher
+from ...protos import test_service_pb2_grpc
+from ...server import GRPCBase
+
+
+RETRY_POLICY = {
+    "maxAttempts": 3,
+    "initialBackoff": "0.01s",
+    "maxBackoff": "0.05s",
+    "backoffMultiplier": 2,
+    "retryableStatusCodes": ["UNAVAILABLE"],
+}
+
+
+class FlakyServicer(GRPCBase, test_service_pb2_grpc.TestServiceServicer):
+    """Servicer failing with UNAVAILABLE a number of times given by the request"""
+
+    _REGISTRAR = test_service_pb2_grpc.add_TestServiceServicer_to_server
+
+    def __init__(self):
+        """Initialize without calls"""
+        self.calls = 0
+
+    def UnaryUnary(self, request, context):
+        """Fail until the number of calls exceeds the number in the request"""
+        self.calls += 1
+        if self.calls <= int(request.value):
+            context.abort(grpc.StatusCode.UNAVAILABLE, "not now")
+        return request
+
+
+class TestMethodConfigMatcher(unittest.TestCase):
+    def test_most_specific_name_wins(self):
+        service_config = {
+            "methodConfig": [
+                {"name": [{}], "timeout": "1s"},
+                {"name": [{"service": "eagr.TestService"}], "timeout": "2s"},
+                {
+                    "name": [{"service": "eagr.TestService", "method": "UnaryUnary"}],
+                    "retryPolicy": RETRY_POLICY,
+                },
+            ]
+        }
+        matcher = MethodConfigMatcher(json.dumps(service_config))
+        self.assertTrue(matcher.covers_retries("/eagr.TestService/UnaryUnary"))
+        self.assertFalse(matcher.covers_timeout("/eagr.TestService/UnaryUnary"))
+        self.assertEqual(
+            "2s", matcher.get_method_config("/eagr.TestService/UnaryStream")["timeout"]
+        )
+        self.assertEqual("1s", matcher.get_method_config("/eagr.Other/UnaryUnary")["timeout"])
+        self.assertFalse(matcher.covers_retries("/eagr.Other/UnaryUnary"))
+        self.assertIsNone(MethodConfigMatcher(None).get_method_config("/eagr.Other/UnaryUnary"))
+
+    def test_invalid_names(self):
+        with self.assertRaises(ValueError):
+            MethodConfigMatcher({"methodConfig": [{"name": [{"method": "UnaryUnary"}]}]})
+        with self.assertRaises(ValueError):
+            MethodConfigMatcher({"methodConfig": [{"name": [{}]}, {"name": [{}]}]})
+
+
+class TestServiceConfig(unittest.TestCase):
+    def make_client(self, address, **kwargs):
+        return make_grpc_client(
+            "service_config",
+            "bar",
+            address,
+            test_service_pb2_grpc.TestServiceStub,
+            disable_tracing=True,
+            **kwargs
+        )
+
+    def test_core_retries(self):
+        servicer = FlakyServicer()
+        service_config = {
+            "methodConfig": [
+                {"name": [{"service": "eagr.TestService"}], "retryPolicy": RETRY_POLICY}
+            ]
+        }
+        with inprocess_grpc_server(
+            servicer, test_service_pb2_grpc.add_TestServiceServicer_to_server
+        ) as address:
+            client = self.make_client(address, service_config=service_config)
+            request = StringValue(value="2")
+            self.assertEqual(request, client.UnaryUnary(request))
+            self.assertEqual(3, servicer.calls)
+
+            # The Python retries step aside, so only the core's attempts are made
+            servicer.calls = 0
+            with self.assertRaises(ConnectionRefusedError):
+                client.UnaryUnary(StringValue(value="10"))
+            self.assertEqual(3, servicer.calls)
+
+    def test_python_retries_without_policy(self):
+        servicer = FlakyServicer()
+        service_config = {"methodConfig": [{"name": [{}], "waitForReady": True}]}
+        with inprocess_grpc_server(
+            servicer, test_service_pb2_grpc.add_TestServiceServicer_to_server
+        ) as address:
+            client = self.make_client(address, service_config=service_config, num_retries=2)
+            with self.assertRaises(ConnectionRefusedError):
+                client.UnaryUnary(StringValue(value="10"))
+            self.assertEqual(2, servicer.calls)
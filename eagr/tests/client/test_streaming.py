@@ -0,0 +1,90 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from google.protobuf.wrappers_pb2 import StringValue
+
+from ...client import make_grpc_client
+from ...client.client_test_helpers import inprocess_grpc_server
+from ...client.streaming import read_ahead
+from ...protos import test_service_pb2_grpc
+
+
+class CancellableStream(object):
+    """Endless response stream recording whether it got cancelled"""
+
+    def __init__(self):
+        """Initialize"""
+        self.produced = 0
+        self.cancelled = threading.Event()
+
+    def __iter__(self):
+        """Produce messages until cancelled"""
+        while not self.cancelled.is_set():
+            self.produced += 1
+            yield self.produced
+
+    def cancel(self):
+        """Cancel the stream"""
+        self.cancelled.set()
+
+
+class TestReadAhead(unittest.TestCase):
+    def test_reads_ahead_of_consumer(self):
+        def unary_stream(request, context):
+            """Stream five copies of the request"""
+            for _ in range(5):
+                yield request
+
+        servicer = MagicMock(test_service_pb2_grpc.TestServiceServicer)
+        servicer.UnaryStream = unary_stream
+        with inprocess_grpc_server(
+            servicer, test_service_pb2_grpc.add_TestServiceServicer_to_server
+        ) as address:
+            client = make_grpc_client(
+                "read_ahead",
+                "bar",
+                address,
+                test_service_pb2_grpc.TestServiceStub,
+                disable_tracing=True,
+            )
+            unary_value = StringValue(value="foo")
+            with read_ahead(client.UnaryStream(unary_value), buffer_size=8) as responses:
+                first_response = next(responses)
+                # The rest of the stream is buffered without being consumed
+                deadline = time.monotonic() + 5
+                while responses.buffered() < 4 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                self.assertEqual(4, responses.buffered())
+                self.assertEqual([unary_value] * 5, [first_response] + list(responses))
+
+    def test_buffer_is_bounded_and_close_cancels(self):
+        stream = CancellableStream()
+        responses = read_ahead(stream, buffer_size=3)
+        self.assertEqual(1, next(responses))
+        time.sleep(0.1)
+        # One message consumed, three buffered, and one more held by the blocked reader
+        self.assertLessEqual(stream.produced, 5)
+        responses.close()
+        self.assertTrue(stream.cancelled.is_set())
+        with self.assertRaises(StopIteration):
+            next(responses)
+
+    def test_errors_are_raised_after_buffered_messages(self):
+        def failing_stream():
+            """Produce a message, then fail"""
+            yield 1
+            raise ValueError("stream broke")
+
+        responses = read_ahead(failing_stream())
+        self.assertEqual(1, next(responses))
+        with self.assertRaises(ValueError):
+            next(responses)
+        with self.assertRaises(StopIteration):
+            next(responses)
+
+    def test_invalid_buffer_size(self):
+        with self.assertRaises(ValueError):
+            read_ahead(iter([]), buffer_size=0)
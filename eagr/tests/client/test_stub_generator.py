@@ -1,14 +1,17 @@
 # Copyright 2020-present Kensho Technologies, LLC.
 """Testing various wrappers that make_grpc_client creates"""
+import threading
 import time
 import unittest
 from unittest.mock import MagicMock
 
 from google.protobuf.wrappers_pb2 import StringValue
+import grpc
 from opentracing import global_tracer, set_global_tracer
 from prometheus_client.core import REGISTRY
 
-from ...client import make_grpc_client
+from ...client import close_grpc_client, make_grpc_client
+from ...client.client_side_middleware import CompressionPolicy
 from ...client.client_test_helpers import inprocess_grpc_server
 from ...protos import test_service_pb2_grpc
 
@@ -85,3 +88,320 @@ class TestCallMetrics(unittest.TestCase):
             self.assertEqual(1, calls_after - calls_before)
             print(exceptions_after, exceptions_before)  # noqa
             self.assertEqual(1, exceptions_after - exceptions_before)
+
+    def test_method_default_timeout(self):
+        servicer = MagicMock(test_service_pb2_grpc.TestServiceServicer)
+        servicer.UnaryUnary = lambda x, _: time.sleep(10)
+        with inprocess_grpc_server(
+            servicer, test_service_pb2_grpc.add_TestServiceServicer_to_server
+        ) as address:
+            client = make_grpc_client(
+                "deadlines",
+                "bar",
+                address,
+                test_service_pb2_grpc.TestServiceStub,
+                disable_tracing=True,
+                method_timeouts={"UnaryUnary": 0.5},
+            )
+            started_at = time.monotonic()
+            with self.assertRaises(TimeoutError):
+                client.UnaryUnary(StringValue(value="foo"))
+            self.assertLess(time.monotonic() - started_at, 5)
+
+    def test_future_calls_do_not_block(self):
+        servicer = MagicMock(test_service_pb2_grpc.TestServiceServicer)
+        servicer.UnaryUnary = lambda x, _: time.sleep(1)
+        labels = {
+            "client_name": "futures",
+            "server_name": "bar",
+            "service": "eagr_TestService",
+            "endpoint": "UnaryUnary",
+        }
+        exception_labels = dict(labels, exception="TimeoutError")
+        with inprocess_grpc_server(
+            servicer, test_service_pb2_grpc.add_TestServiceServicer_to_server
+        ) as address:
+            client = make_grpc_client(
+                "futures",
+                "bar",
+                address,
+                test_service_pb2_grpc.TestServiceStub,
+                disable_tracing=True,
+            )
+            started_at = time.monotonic()
+            future = client.UnaryUnary.future(StringValue(value="foo"), timeout=0.5)
+            self.assertLess(time.monotonic() - started_at, 0.4)
+            self.assertFalse(
+                REGISTRY.get_sample_value("clientside_grpc_endpoint_count", labels=labels)
+            )
+
+            # Exceptions are translated and counted once the call completes
+            with self.assertRaises(TimeoutError):
+                future.result()
+            self.assertIsInstance(future.exception(), TimeoutError)
+            self.assertEqual(
+                1,
+                REGISTRY.get_sample_value("clientside_grpc_endpoint_error_total", exception_labels),
+            )
+            self.assertEqual(
+                1, REGISTRY.get_sample_value("clientside_grpc_endpoint_count", labels=labels)
+            )
+            # The call was timed until completion, not just until initiation
+            self.assertGreaterEqual(
+                REGISTRY.get_sample_value("clientside_grpc_endpoint_sum", labels=labels), 0.4
+            )
+
+    def test_future_calls_are_retried(self):
+        attempts = []
+
+        def unary_unary(request, context):
+            """Fail the first attempt as unavailable"""
+            attempts.append(request)
+            if len(attempts) == 1:
+                context.abort(grpc.StatusCode.UNAVAILABLE, "try again")
+            return request
+
+        servicer = MagicMock(test_service_pb2_grpc.TestServiceServicer)
+        servicer.UnaryUnary = unary_unary
+        with inprocess_grpc_server(
+            servicer, test_service_pb2_grpc.add_TestServiceServicer_to_server
+        ) as address:
+            client = make_grpc_client(
+                "retries",
+                "bar",
+                address,
+                test_service_pb2_grpc.TestServiceStub,
+                disable_tracing=True,
+            )
+            unary_value = StringValue(value="foo")
+            self.assertEqual(unary_value, client.UnaryUnary.future(unary_value).result())
+            self.assertEqual(2, len(attempts))
+
+            # Blocking calls are retried as well
+            del attempts[:]
+            self.assertEqual(unary_value, client.UnaryUnary(unary_value))
+            self.assertEqual(2, len(attempts))
+
+    def test_stream_metrics(self):
+        def unary_stream(request, context):
+            """Stream three copies of the request"""
+            for _ in range(3):
+                time.sleep(0.05)
+                yield request
+
+        servicer = MagicMock(test_service_pb2_grpc.TestServiceServicer)
+        servicer.UnaryStream = unary_stream
+        labels = {
+            "client_name": "streams",
+            "server_name": "bar",
+            "service": "eagr_TestService",
+            "endpoint": "UnaryStream",
+        }
+        with inprocess_grpc_server(
+            servicer, test_service_pb2_grpc.add_TestServiceServicer_to_server
+        ) as address:
+            client = make_grpc_client(
+                "streams",
+                "bar",
+                address,
+                test_service_pb2_grpc.TestServiceStub,
+                disable_tracing=True,
+            )
+            unary_value = StringValue(value="foo")
+            self.assertEqual([unary_value] * 3, list(client.UnaryStream(unary_value)))
+
+        self.assertEqual(
+            3, REGISTRY.get_sample_value("clientside_grpc_stream_messages_total", labels=labels)
+        )
+        self.assertEqual(
+            1,
+            REGISTRY.get_sample_value("clientside_grpc_stream_first_message_count", labels=labels),
+        )
+        self.assertGreaterEqual(
+            REGISTRY.get_sample_value("clientside_grpc_stream_first_message_sum", labels=labels),
+            0.04,
+        )
+        self.assertEqual(
+            2, REGISTRY.get_sample_value("clientside_grpc_stream_message_wait_count", labels=labels)
+        )
+        # Unary-response calls are not instrumented as streams
+        unary_labels = dict(labels, endpoint="UnaryUnary")
+        self.assertIsNone(
+            REGISTRY.get_sample_value("clientside_grpc_stream_messages_total", labels=unary_labels)
+        )
+
+    def test_eager_connection(self):
+        servicer = MagicMock(test_service_pb2_grpc.TestServiceServicer)
+        servicer.UnaryUnary = lambda x, _: x
+        ready_labels = {"client_name": "eager", "server_name": "bar", "state": "ready"}
+        with inprocess_grpc_server(
+            servicer, test_service_pb2_grpc.add_TestServiceServicer_to_server
+        ) as address:
+            client = make_grpc_client(
+                "eager",
+                "bar",
+                address,
+                test_service_pb2_grpc.TestServiceStub,
+                disable_tracing=True,
+                ready_timeout=5,
+            )
+            self.addCleanup(close_grpc_client, client)
+            # The channel connected before the first call
+            self.assertIs(grpc.ChannelConnectivity.READY, client._connectivity_monitor.state)
+            self.assertEqual(
+                1, REGISTRY.get_sample_value("clientside_grpc_channel_state", ready_labels)
+            )
+            # Depending on timing, the channel may or may not report connecting before ready
+            transitions_to_ready = sum(
+                REGISTRY.get_sample_value(
+                    "clientside_grpc_channel_state_transitions_total",
+                    {
+                        "client_name": "eager",
+                        "server_name": "bar",
+                        "from_state": from_state,
+                        "to_state": "ready",
+                    },
+                )
+                or 0
+                for from_state in ("idle", "connecting")
+            )
+            self.assertEqual(1, transitions_to_ready)
+            unary_value = StringValue(value="foo")
+            self.assertEqual(unary_value, client.UnaryUnary(unary_value))
+
+    def test_ready_timeout(self):
+        started_at = time.monotonic()
+        client = make_grpc_client(
+            "unreachable",
+            "bar",
+            "localhost:1",
+            test_service_pb2_grpc.TestServiceStub,
+            disable_tracing=True,
+            ready_timeout=0.2,
+        )
+        self.addCleanup(close_grpc_client, client)
+        self.assertLess(time.monotonic() - started_at, 5)
+        self.assertIsNot(grpc.ChannelConnectivity.READY, client._connectivity_monitor.state)
+
+    def test_connectivity_monitoring_is_opt_in(self):
+        client = make_grpc_client(
+            "unmonitored", "bar", "localhost:1", test_service_pb2_grpc.TestServiceStub
+        )
+        self.assertIsNone(client._connectivity_monitor)
+        close_grpc_client(client)
+
+        thread_count = threading.active_count()
+        client = make_grpc_client(
+            "monitored",
+            "bar",
+            "localhost:1",
+            test_service_pb2_grpc.TestServiceStub,
+            monitor_connectivity=True,
+        )
+        self.assertIsNotNone(client._connectivity_monitor)
+        close_grpc_client(client)
+        # The connectivity polling thread ends once the channel has no subscribers
+        deadline = time.monotonic() + 5
+        while threading.active_count() > thread_count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertLessEqual(threading.active_count(), thread_count)
+
+    def test_request_compression(self):
+        servicer = MagicMock(test_service_pb2_grpc.TestServiceServicer)
+        servicer.UnaryUnary = lambda x, _: x
+        with inprocess_grpc_server(
+            servicer, test_service_pb2_grpc.add_TestServiceServicer_to_server
+        ) as address:
+            client = make_grpc_client(
+                "compressing",
+                "bar",
+                address,
+                test_service_pb2_grpc.TestServiceStub,
+                disable_tracing=True,
+                compression_policy=CompressionPolicy(1024, grpc.Compression.Gzip),
+            )
+            for value in ("a" * 10, "a" * 10000):
+                self.assertEqual(value, client.UnaryUnary(StringValue(value=value)).value)
+        labels = {
+            "client_name": "compressing",
+            "server_name": "bar",
+            "service": "eagr_TestService",
+            "endpoint": "UnaryUnary",
+            "compression": "gzip",
+        }
+        self.assertEqual(
+            StringValue(value="a" * 10000).ByteSize(),
+            REGISTRY.get_sample_value("clientside_grpc_request_bytes_total", labels),
+        )
+
+    def test_singleflight(self):
+        release = threading.Event()
+        received_users = []
+
+        def unary_unary(request, context):
+            """Record the user and reflect once released"""
+            received_users.append(dict(context.invocation_metadata()).get("user"))
+            release.wait(5)
+            return request
+
+        servicer = MagicMock(test_service_pb2_grpc.TestServiceServicer)
+        servicer.UnaryUnary = unary_unary
+        labels = {
+            "client_name": "singleflight",
+            "server_name": "bar",
+            "service": "eagr_TestService",
+            "endpoint": "UnaryUnary",
+        }
+        with inprocess_grpc_server(
+            servicer, test_service_pb2_grpc.add_TestServiceServicer_to_server, num_threads=4
+        ) as address:
+            client = make_grpc_client(
+                "singleflight",
+                "bar",
+                address,
+                test_service_pb2_grpc.TestServiceStub,
+                disable_tracing=True,
+                enable_singleflight=True,
+                singleflight_metadata_keys=("user",),
+            )
+            unary_value = StringValue(value="foo")
+            futures = [
+                client.UnaryUnary.future(unary_value, metadata=(("user", "a"),)) for _ in range(3)
+            ]
+            futures.append(client.UnaryUnary.future(unary_value, metadata=(("user", "b"),)))
+
+            # Blocking calls are deduplicated as well
+            blocking_results = []
+            threads = [
+                threading.Thread(
+                    target=lambda: blocking_results.append(
+                        client.UnaryUnary(unary_value, metadata=(("user", "a"),))
+                    )
+                )
+                for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            deadline = time.monotonic() + 5
+            while (
+                time.monotonic() < deadline
+                and (
+                    REGISTRY.get_sample_value(
+                        "clientside_grpc_singleflight_saved_calls_total", labels
+                    )
+                    or 0
+                )
+                < 4
+            ):
+                time.sleep(0.01)
+            release.set()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual([unary_value] * 4, [future.result() for future in futures])
+            self.assertEqual([unary_value] * 2, blocking_results)
+            self.assertEqual(["a", "b"], sorted(received_users))
+            self.assertEqual(
+                4,
+                REGISTRY.get_sample_value("clientside_grpc_singleflight_saved_calls_total", labels),
+            )
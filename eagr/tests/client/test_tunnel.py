@@ -0,0 +1,122 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+import time
+import unittest
+
+from google.protobuf.wrappers_pb2 import StringValue
+import grpc
+
+from ...client import make_grpc_client
+from ...client.client_test_helpers import inprocess_grpc_server
+from ...protos import test_service_pb2_grpc, tunnel_pb2_grpc
+from ...server import GRPCBase
+from ...server.middleware import GRPCMiddleware
+from ...server.tunnel import UnaryTunnelServicer
+
+
+class TunneledServicer(GRPCBase, test_service_pb2_grpc.TestServiceServicer):
+    """Servicer whose unary method behaves according to the request"""
+
+    _REGISTRAR = test_service_pb2_grpc.add_TestServiceServicer_to_server
+
+    def __init__(self):
+        """Initialize"""
+        super(TunneledServicer, self).__init__()
+        self.received_values = []
+
+    def UnaryUnary(self, request, context):
+        """Reflect, sleep, abort or return the metadata depending on the request"""
+        self.received_values.append(request.value)
+        if request.value.startswith("slow:"):
+            time.sleep(float(request.value.split(":")[1]))
+        elif request.value == "abort":
+            context.abort(grpc.StatusCode.NOT_FOUND, "nothing here")
+        elif request.value == "metadata":
+            return StringValue(value=dict(context.invocation_metadata())["key"])
+        return request
+
+
+class RecordingMiddleware(GRPCMiddleware):
+    """Server middleware recording the methods it is applied to"""
+
+    def __init__(self):
+        """Initialize"""
+        super(RecordingMiddleware, self).__init__()
+        self.methods = []
+
+    def get_decorator(self, method_name, _):
+        """Record the method"""
+        self.methods.append(method_name)
+        return None
+
+
+class TestUnaryTunnel(unittest.TestCase):
+    def _run_with_client(self, fn, middlewares=None, servicer=None):
+        """Run fn with a tunneling client to a server of the tunnel"""
+        servicer = servicer or TunneledServicer()
+        tunnel = UnaryTunnelServicer([servicer], middlewares=middlewares)
+        with inprocess_grpc_server(
+            tunnel, tunnel_pb2_grpc.add_UnaryTunnelServicer_to_server
+        ) as address:
+            client = make_grpc_client(
+                "tunnel",
+                "bar",
+                address,
+                test_service_pb2_grpc.TestServiceStub,
+                disable_tracing=True,
+                tunnel_unary_calls=True,
+            )
+            fn(client)
+
+    def test_calls(self):
+        middleware = RecordingMiddleware()
+
+        def run(client):
+            """Make blocking calls and calls with metadata"""
+            for value in ("foo", "bar"):
+                self.assertEqual(value, client.UnaryUnary(StringValue(value=value)).value)
+            response = client.UnaryUnary(
+                StringValue(value="metadata"), metadata=(("key", "value"),)
+            )
+            self.assertEqual("value", response.value)
+
+        self._run_with_client(run, middlewares=[middleware])
+        # Server middlewares are applied to the tunneled calls
+        self.assertEqual(["/eagr.TestService/UnaryUnary"] * 3, middleware.methods)
+
+    def test_futures_complete_out_of_order(self):
+        def run(client):
+            """Make a slow and a fast call"""
+            slow_future = client.UnaryUnary.future(StringValue(value="slow:0.5"))
+            fast_future = client.UnaryUnary.future(StringValue(value="fast"))
+            self.assertEqual("fast", fast_future.result(timeout=0.4).value)
+            self.assertFalse(slow_future.done())
+            self.assertEqual("slow:0.5", slow_future.result().value)
+
+        self._run_with_client(run)
+
+    def test_errors(self):
+        servicer = TunneledServicer()
+
+        def run(client):
+            """Make calls that fail"""
+            with self.assertRaises(grpc.RpcError) as context:
+                client.UnaryUnary(StringValue(value="abort"))
+            self.assertEqual(grpc.StatusCode.NOT_FOUND, context.exception.code())
+            self.assertEqual("nothing here", context.exception.details())
+            with self.assertRaises(TimeoutError):
+                client.UnaryUnary(StringValue(value="slow:2"), timeout=0.2)
+            # An expired deadline fails without reaching the server, where 0 means no deadline
+            with self.assertRaises(TimeoutError):
+                client.UnaryUnary(StringValue(value="expired"), timeout=0)
+            # Binary metadata cannot be tunneled
+            with self.assertRaises(grpc.RpcError) as context:
+                client.UnaryUnary(
+                    StringValue(value="binary"), timeout=5, metadata=(("key-bin", b"\x00"),)
+                )
+            self.assertEqual(grpc.StatusCode.INVALID_ARGUMENT, context.exception.code())
+            self.assertIn("key-bin", context.exception.details())
+            # The stream is still usable
+            self.assertEqual("foo", client.UnaryUnary(StringValue(value="foo")).value)
+
+        self._run_with_client(run, servicer=servicer)
+        self.assertEqual(["abort", "slow:2", "foo"], servicer.received_values)
@@ -0,0 +1 @@
+# Copyright 2020-present Kensho Technologies, LLC.
@@ -0,0 +1,126 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+import asyncio
+import json
+import unittest
+
+import grpc
+from prometheus_client import REGISTRY
+
+from eagr.client.client_test_helpers import inprocess_grpc_server
+from eagr.flask_bridge.concurrency import ConcurrencyLimit
+from eagr.flask_bridge.grpc_to_asgi import make_asgi_app
+from eagr.protos import bridge_test_service_pb2_grpc
+from eagr.tests.flask_bridge.test_grpc_to_json import BridgedServicer
+
+
+async def _post(app, path, payload, headers=None):
+    """Post a JSON payload to the app, returning the status, headers and body of the response"""
+    request_body = json.dumps(payload).encode("utf-8")
+    received = [
+        {"type": "http.request", "body": request_body[:5], "more_body": True},
+        {"type": "http.request", "body": request_body[5:]},
+    ]
+    sent = []
+
+    async def receive():
+        return received.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "headers": [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in (headers or {}).items()
+        ],
+    }
+    await app(scope, receive, send)
+    start = sent[0]
+    response_headers = {name.decode(): value.decode() for name, value in start["headers"]}
+    return start["status"], response_headers, b"".join(message["body"] for message in sent[1:])
+
+
+class TestGrpcToAsgi(unittest.TestCase):
+    def setUp(self):
+        self.servicer = BridgedServicer()
+        self.server = inprocess_grpc_server(
+            self.servicer,
+            bridge_test_service_pb2_grpc.add_BridgeTestServiceServicer_to_server,
+            num_threads=4,
+        )
+        self.address = self.server.__enter__()
+
+    def tearDown(self):
+        self.servicer.unblock.set()
+        self.server.__exit__(None, None, None)
+
+    def run_with_app(self, coroutine_function, **kwargs):
+        async def run():
+            async with grpc.aio.insecure_channel(self.address) as channel:
+                app = make_asgi_app(channel, "eagr.BridgeTestService", "/test", **kwargs)
+                return await coroutine_function(app)
+
+        return asyncio.run(run())
+
+    def test_unary_call(self):
+        async def call(app):
+            return await _post(app, "/test/Search", {"query": "foo", "count": 2})
+
+        status, headers, body = self.run_with_app(call)
+        self.assertEqual(200, status)
+        self.assertEqual("application/json", headers["content-type"])
+        self.assertEqual({"query": "foo", "items": ["foo", "foo"], "total": "2"}, json.loads(body))
+
+    def test_streamed_responses(self):
+        async def call(app):
+            return await _post(app, "/test/StreamSearch", {"query": "fail", "count": 3})
+
+        status, headers, body = self.run_with_app(call)
+        self.assertEqual(200, status)
+        self.assertEqual("application/x-ndjson", headers["content-type"])
+        self.assertEqual(
+            [
+                {"items": [], "query": "fail", "total": "0"},
+                {"code": "INTERNAL", "error": "failed mid-stream"},
+            ],
+            [json.loads(line) for line in body.splitlines()],
+        )
+
+    def test_errors(self):
+        async def call(app):
+            return [
+                await _post(
+                    app, "/test/Search", {"query": "slow:0.5"}, {"X-Request-Timeout": "0.05"}
+                ),
+                await _post(app, "/test/Search", {"unknown": 1}),
+                await _post(app, "/test/Missing", {}),
+            ]
+
+        statuses = [status for status, _, _ in self.run_with_app(call)]
+        self.assertEqual([504, 400, 404], statuses)
+
+    def test_saturated_route(self):
+        route_labels = {"route": "/test/Search"}
+
+        async def call(app):
+            blocked = asyncio.ensure_future(_post(app, "/test/Search", {"query": "block"}))
+            while not self.servicer.started.is_set():
+                await asyncio.sleep(0.01)
+            shed = await _post(app, "/test/Search", {"query": "foo"})
+            in_flight = REGISTRY.get_sample_value("bridge_in_flight_requests", route_labels)
+            self.servicer.unblock.set()
+            return shed, in_flight, await blocked
+
+        shed, in_flight, blocked = self.run_with_app(
+            call,
+            concurrency_limit=ConcurrencyLimit(max_concurrency=1, max_queue=0, queue_timeout=None),
+            retry_after=3,
+        )
+        self.assertEqual(503, shed[0])
+        self.assertEqual("3", shed[1]["retry-after"])
+        self.assertEqual(1, in_flight)
+        self.assertEqual(200, blocked[0])
+        self.assertEqual(0, REGISTRY.get_sample_value("bridge_in_flight_requests", route_labels))
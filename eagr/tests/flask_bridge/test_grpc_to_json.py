@@ -0,0 +1,497 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+from concurrent import futures
+import gzip
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+import flask
+from google.protobuf import any_pb2, descriptor_pb2, descriptor_pool, symbol_database
+from google.protobuf.internal import encoder
+import grpc
+from grpc_reflection.v1alpha import reflection
+from prometheus_client import REGISTRY
+
+from eagr.client.client_test_helpers import inprocess_grpc_server
+from eagr.flask_bridge import grpc_to_json
+from eagr.flask_bridge.compression import ResponseCompression
+from eagr.flask_bridge.concurrency import ConcurrencyLimit
+from eagr.flask_bridge.grpc_to_json import map_and_mount, map_and_mount_remote_services
+from eagr.grpc_utils.method import HTTP_RULE_FIELD_NUMBER
+from eagr.protos import (
+    bridge_test_service_pb2,
+    bridge_test_service_pb2_grpc,
+    test_service_pb2,
+    test_service_pb2_grpc,
+)
+
+
+class BridgedServicer(bridge_test_service_pb2_grpc.BridgeTestServiceServicer):
+    """Servicer whose search reflects, sleeps or blocks depending on the query"""
+
+    def __init__(self):
+        """Initialize with the event unblocking blocked calls"""
+        self.started = threading.Event()
+        self.unblock = threading.Event()
+        self.searches = 0
+
+    def Search(self, request, context):
+        """Reflect the query, after sleeping or blocking if asked to"""
+        self.searches += 1
+        if request.query.startswith("slow:"):
+            time.sleep(float(request.query.split(":")[1]))
+        elif request.query == "block":
+            self.started.set()
+            self.unblock.wait(5)
+        return bridge_test_service_pb2.BridgeTestResponse(
+            query=request.query, items=[request.query] * request.count, total=request.count
+        )
+
+    def StreamSearch(self, request, context):
+        """Stream one response per count, failing after the first one if asked to"""
+        if request.query == "slow":
+            time.sleep(0.5)
+        for index in range(request.count):
+            if index == 1 and request.query == "fail":
+                context.abort(grpc.StatusCode.INTERNAL, "failed mid-stream")
+            yield bridge_test_service_pb2.BridgeTestResponse(query=request.query, total=index)
+
+
+def _length_delimited(field_number, value):
+    """Encode a length-delimited field"""
+    return encoder.TagBytes(field_number, 2) + encoder._VarintBytes(len(value)) + value
+
+
+def _make_annotated_databases(get_template):
+    """Make the databases of the bridge test service, with a GET binding annotating Search"""
+    pool = descriptor_pool.DescriptorPool()
+    for file_descriptor in (any_pb2.DESCRIPTOR, bridge_test_service_pb2.DESCRIPTOR):
+        file_proto = descriptor_pb2.FileDescriptorProto()
+        file_descriptor.CopyToProto(file_proto)
+        if file_descriptor is bridge_test_service_pb2.DESCRIPTOR:
+            http_rule = _length_delimited(2, get_template.encode("utf-8"))
+            file_proto.service[0].method[0].options.MergeFromString(
+                _length_delimited(HTTP_RULE_FIELD_NUMBER, http_rule)
+            )
+        pool.Add(file_proto)
+    return pool, symbol_database.SymbolDatabase(pool)
+
+
+class TestGrpcToJson(unittest.TestCase):
+    def setUp(self):
+        self.servicer = BridgedServicer()
+        self.server = inprocess_grpc_server(
+            self.servicer,
+            bridge_test_service_pb2_grpc.add_BridgeTestServiceServicer_to_server,
+            num_threads=4,
+        )
+        self.channel = grpc.insecure_channel(self.server.__enter__())
+
+    def tearDown(self):
+        self.servicer.unblock.set()
+        self.channel.close()
+        self.server.__exit__(None, None, None)
+
+    def make_app(self, **kwargs):
+        app = flask.Flask(__name__)
+        map_and_mount(app, self.channel, "eagr.BridgeTestService", "/test", **kwargs)
+        return app.test_client()
+
+    def test_unary_call(self):
+        client = self.make_app()
+        response = client.post("/test/Search", json={"query": "foo", "count": 2})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            {"query": "foo", "items": ["foo", "foo"], "total": "2"},
+            response.get_json(),
+        )
+        # Bodies not matching the input message are rejected
+        self.assertEqual(400, client.post("/test/Search", json={"count": "many"}).status_code)
+        self.assertEqual(400, client.post("/test/Search", json=5).status_code)
+
+    def test_saturated_route(self):
+        route_labels = {"route": "/test/Search"}
+        client = self.make_app(
+            concurrency_limit=ConcurrencyLimit(max_concurrency=1, max_queue=0, queue_timeout=None),
+            retry_after=3,
+        )
+        with futures.ThreadPoolExecutor(max_workers=1) as executor:
+            blocked = executor.submit(client.post, "/test/Search", json={"query": "block"})
+            self.assertTrue(self.servicer.started.wait(5))
+            self.assertEqual(
+                1, REGISTRY.get_sample_value("bridge_in_flight_requests", route_labels)
+            )
+            shed_before = (
+                REGISTRY.get_sample_value(
+                    "bridge_shed_requests_total", dict(route_labels, reason="queue_full")
+                )
+                or 0
+            )
+
+            response = client.post("/test/Search", json={"query": "foo"})
+            self.assertEqual(503, response.status_code)
+            self.assertEqual("3", response.headers["Retry-After"])
+            # Malformed requests are rejected without waiting for a slot
+            response = client.post("/test/Search", json={"unknown": "foo"})
+            self.assertEqual(400, response.status_code)
+            self.assertEqual(
+                1,
+                REGISTRY.get_sample_value(
+                    "bridge_shed_requests_total", dict(route_labels, reason="queue_full")
+                )
+                - shed_before,
+            )
+
+            self.servicer.unblock.set()
+            self.assertEqual(200, blocked.result().status_code)
+        self.assertEqual(0, REGISTRY.get_sample_value("bridge_in_flight_requests", route_labels))
+
+    def test_queued_request(self):
+        client = self.make_app(
+            method_concurrency_limits={
+                "Search": ConcurrencyLimit(max_concurrency=1, max_queue=1, queue_timeout=5)
+            }
+        )
+        with futures.ThreadPoolExecutor(max_workers=2) as executor:
+            blocked = executor.submit(client.post, "/test/Search", json={"query": "block"})
+            self.assertTrue(self.servicer.started.wait(5))
+            queued = executor.submit(client.post, "/test/Search", json={"query": "foo"})
+            time.sleep(0.1)
+            self.assertFalse(queued.done())
+            self.servicer.unblock.set()
+            self.assertEqual(200, blocked.result().status_code)
+            self.assertEqual("foo", queued.result().get_json()["query"])
+
+    def test_request_timeout(self):
+        client = self.make_app()
+        response = client.post(
+            "/test/Search", json={"query": "slow:0.5"}, headers={"X-Request-Timeout": "0.05"}
+        )
+        self.assertEqual(504, response.status_code)
+
+        response = client.post(
+            "/test/Search", json={"query": "foo"}, headers={"X-Request-Timeout": "soon"}
+        )
+        self.assertEqual(400, response.status_code)
+
+        # The shorter of the default timeout and the request timeout applies
+        client = self.make_app(default_timeout=0.05)
+        response = client.post("/test/Search", json={"query": "slow:0.5"})
+        self.assertEqual(504, response.status_code)
+
+    def test_streamed_responses(self):
+        route_labels = {"route": "/test/StreamSearch"}
+        client = self.make_app()
+        response = client.post("/test/StreamSearch", json={"query": "foo", "count": 3})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("application/x-ndjson", response.mimetype)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(
+            [{"query": "foo", "items": [], "total": str(index)} for index in range(3)],
+            [json.loads(line) for line in response.get_data().splitlines()],
+        )
+        response.close()
+        self.assertEqual(0, REGISTRY.get_sample_value("bridge_in_flight_requests", route_labels))
+
+        response = client.post("/test/StreamSearch", json={"query": "foo"}, buffered=True)
+        self.assertEqual(b"", response.get_data())
+
+    def test_stream_errors(self):
+        client = self.make_app()
+        response = client.post("/test/StreamSearch", json={"query": "fail", "count": 3})
+        self.assertEqual(200, response.status_code)
+        lines = [json.loads(line) for line in response.get_data().splitlines()]
+        response.close()
+        self.assertEqual(2, len(lines))
+        self.assertEqual({"code": "INTERNAL", "error": "failed mid-stream"}, lines[-1])
+
+        response = client.post(
+            "/test/StreamSearch",
+            json={"query": "slow", "count": 1},
+            headers={"X-Request-Timeout": "0.05"},
+        )
+        self.assertEqual(504, response.status_code)
+
+    def test_batch(self):
+        client = self.make_app(enable_batch_route=True, max_batch_size=4)
+        batch = [
+            {"method": "Search", "body": {"query": "slow:0.3", "count": 1}},
+            {"method": "Search", "body": {"query": "slow:0.3"}},
+            {"method": "StreamSearch", "body": {}},
+            {"method": "Search", "body": {"unknown": 1}},
+        ]
+        started_at = time.time()
+        response = client.post("/test/_batch", json=batch)
+        # The calls are made concurrently
+        self.assertLess(time.time() - started_at, 0.55)
+        self.assertEqual(200, response.status_code)
+        results = response.get_json()
+        self.assertEqual(
+            [
+                {"response": {"query": "slow:0.3", "items": ["slow:0.3"], "total": "1"}},
+                {"response": {"query": "slow:0.3", "items": [], "total": "0"}},
+            ],
+            results[:2],
+        )
+        self.assertEqual(
+            ["NOT_FOUND", "INVALID_ARGUMENT"], [result["code"] for result in results[2:]]
+        )
+
+        response = client.post("/test/_batch", json=batch[:2], headers={"X-Request-Timeout": "0.1"})
+        self.assertEqual(
+            ["DEADLINE_EXCEEDED", "DEADLINE_EXCEEDED"],
+            [result["code"] for result in response.get_json()],
+        )
+
+        # Bodies that are not objects fail their entry only
+        response = client.post("/test/_batch", json=[{"method": "Search", "body": 5}, batch[0]])
+        self.assertEqual(200, response.status_code)
+        results = response.get_json()
+        self.assertEqual("INVALID_ARGUMENT", results[0]["code"])
+        self.assertIn("response", results[1])
+
+        self.assertEqual(413, client.post("/test/_batch", json=batch * 2).status_code)
+        self.assertEqual(400, client.post("/test/_batch", json={"method": "Search"}).status_code)
+
+    def test_batch_concurrency_limits(self):
+        client = self.make_app(
+            enable_batch_route=True,
+            method_concurrency_limits={
+                "Search": ConcurrencyLimit(max_concurrency=1, max_queue=1, queue_timeout=5)
+            },
+        )
+        batch = [{"method": "Search", "body": {"query": "slow:0.2"}}] * 2
+        results = client.post("/test/_batch", json=batch).get_json()
+        # The calls of a batch take slots of their method instead of bypassing its limit
+        self.assertIn("response", results[0])
+        self.assertEqual("RESOURCE_EXHAUSTED", results[1]["code"])
+        self.assertEqual(1, self.servicer.searches)
+        # The slot is released once the call completes
+        self.assertEqual(200, client.post("/test/Search", json={"query": "foo"}).status_code)
+
+    def test_get_routes(self):
+        client = self.make_app(get_routes={"Search": "/search/{query}"}, response_cache_ttl=60)
+        response = client.get("/test/search/foo?count=2")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            {"query": "foo", "items": ["foo", "foo"], "total": "2"}, response.get_json()
+        )
+        self.assertEqual("max-age=60", response.headers["Cache-Control"])
+        etag, is_weak = response.get_etag()
+        self.assertFalse(is_weak)
+
+        # Served from the cache, which holds the ETag for conditional requests
+        response = client.get("/test/search/foo?count=2", headers={"If-None-Match": etag})
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(1, self.servicer.searches)
+
+        response = client.get("/test/search/bar?count=2")
+        self.assertNotEqual(etag, response.get_etag()[0])
+        self.assertEqual(2, self.servicer.searches)
+        self.assertEqual(400, client.get("/test/search/foo?unknown=1").status_code)
+        self.assertEqual(400, client.get("/test/search/foo?count=many").status_code)
+
+        # Streaming methods are rejected before any route is mounted
+        app = flask.Flask(__name__)
+        with self.assertRaises(ValueError):
+            map_and_mount(
+                app,
+                self.channel,
+                "eagr.BridgeTestService",
+                "/test",
+                get_routes={"StreamSearch": "/stream"},
+            )
+        self.assertNotIn("/test/Search", [rule.rule for rule in app.url_map.iter_rules()])
+
+    def test_http_annotations(self):
+        pool, symbol_database_instance = _make_annotated_databases("/v1/search/{query}")
+        client = self.make_app(
+            descriptor_pool_instance=pool,
+            symbol_database_instance=symbol_database_instance,
+            enable_http_annotations=True,
+        )
+        response = client.get("/test/v1/search/foo")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("foo", response.get_json()["query"])
+        self.assertEqual("no-cache", response.headers["Cache-Control"])
+
+    def test_protobuf_content(self):
+        client = self.make_app()
+        request = bridge_test_service_pb2.BridgeTestRequest(query="foo", count=2)
+        expected = bridge_test_service_pb2.BridgeTestResponse(
+            query="foo", items=["foo", "foo"], total=2
+        )
+        protobuf_headers = {"Accept": "application/x-protobuf"}
+
+        response = client.post(
+            "/test/Search",
+            data=request.SerializeToString(),
+            content_type="application/x-protobuf",
+            headers=protobuf_headers,
+        )
+        self.assertEqual("application/x-protobuf", response.mimetype)
+        self.assertEqual(
+            expected, bridge_test_service_pb2.BridgeTestResponse.FromString(response.data)
+        )
+        self.assertIn("Accept", response.vary)
+
+        # Either side can be JSON
+        response = client.post(
+            "/test/Search", data=request.SerializeToString(), content_type="application/x-protobuf"
+        )
+        self.assertEqual(
+            {"query": "foo", "items": ["foo", "foo"], "total": "2"}, response.get_json()
+        )
+        response = client.post(
+            "/test/Search", json={"query": "foo", "count": 2}, headers=protobuf_headers
+        )
+        self.assertEqual(
+            expected, bridge_test_service_pb2.BridgeTestResponse.FromString(response.data)
+        )
+
+        response = client.post(
+            "/test/Search", data=b"\xff\xff", content_type="application/x-protobuf"
+        )
+        self.assertEqual(400, response.status_code)
+        response = client.post(
+            "/test/Search",
+            data=b"\xff\xff",
+            content_type="application/x-protobuf",
+            headers=protobuf_headers,
+        )
+        self.assertEqual(400, response.status_code)
+        # Malformed bodies never reach the service
+        self.assertEqual(3, self.servicer.searches)
+
+    def test_stage_timing(self):
+        route_labels = {"route": "/test/Search"}
+        encode_count_before = (
+            REGISTRY.get_sample_value(
+                "bridge_request_stage_count", dict(route_labels, stage="encode")
+            )
+            or 0
+        )
+        response_bytes_before = (
+            REGISTRY.get_sample_value("bridge_response_bytes_sum", route_labels) or 0
+        )
+        client = self.make_app(server_timing=True)
+        response = client.post("/test/Search", json={"query": "foo"})
+        stages = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+        self.assertEqual(["decode", "to_message", "queue", "call", "encode"], stages)
+        self.assertEqual(
+            1,
+            REGISTRY.get_sample_value(
+                "bridge_request_stage_count", dict(route_labels, stage="encode")
+            )
+            - encode_count_before,
+        )
+        self.assertEqual(
+            len(response.data),
+            REGISTRY.get_sample_value("bridge_response_bytes_sum", route_labels)
+            - response_bytes_before,
+        )
+        self.assertNotIn("Server-Timing", self.make_app().post("/test/Search", json={}).headers)
+
+    def test_response_compression(self):
+        route_labels = {"route": "/test/Search"}
+        compressed_before = (
+            REGISTRY.get_sample_value("bridge_response_compression_ratio_count", route_labels) or 0
+        )
+        client = self.make_app(
+            response_compression=ResponseCompression(threshold_bytes=100, level=6),
+            get_routes={"Search": "/search/{query}"},
+        )
+        gzip_headers = {"Accept-Encoding": "gzip"}
+        response = client.post(
+            "/test/Search", json={"query": "foo", "count": 100}, headers=gzip_headers
+        )
+        self.assertEqual("gzip", response.headers["Content-Encoding"])
+        self.assertIn("Accept-Encoding", response.vary)
+        self.assertEqual(100, len(json.loads(gzip.decompress(response.data))["items"]))
+        self.assertEqual(
+            1,
+            REGISTRY.get_sample_value("bridge_response_compression_ratio_count", route_labels)
+            - compressed_before,
+        )
+
+        # Small responses, and requests not accepting gzip, are not compressed
+        response = client.post("/test/Search", json={"query": "foo"}, headers=gzip_headers)
+        self.assertNotIn("Content-Encoding", response.headers)
+        response = client.post("/test/Search", json={"query": "foo", "count": 100})
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(100, len(response.get_json()["items"]))
+
+        response = client.post(
+            "/test/StreamSearch", json={"query": "foo", "count": 20}, headers=gzip_headers
+        )
+        self.assertTrue(response.is_streamed)
+        self.assertEqual("gzip", response.headers["Content-Encoding"])
+        lines = gzip.decompress(response.get_data()).splitlines()
+        response.close()
+        self.assertEqual(20, len(lines))
+
+        # Compressed responses get weak ETags, which conditional requests still match
+        response = client.get("/test/search/foo?count=100", headers=gzip_headers)
+        etag, is_weak = response.get_etag()
+        self.assertTrue(is_weak)
+        response = client.get(
+            "/test/search/foo?count=100",
+            headers=dict(gzip_headers, **{"If-None-Match": 'W/"{}"'.format(etag)}),
+        )
+        self.assertEqual(304, response.status_code)
+
+
+class EchoServicer(test_service_pb2_grpc.TestServiceServicer):
+    """Servicer whose unary method echoes its request"""
+
+    def UnaryUnary(self, request, context):
+        """Echo the request"""
+        return request
+
+
+def _add_servicers_with_reflection(servicer, server):
+    """Add the servicer, an EchoServicer and reflection to the server"""
+    bridge_test_service_pb2_grpc.add_BridgeTestServiceServicer_to_server(servicer, server)
+    test_service_pb2_grpc.add_TestServiceServicer_to_server(EchoServicer(), server)
+    service_names = [
+        bridge_test_service_pb2.DESCRIPTOR.services_by_name["BridgeTestService"].full_name,
+        test_service_pb2.DESCRIPTOR.services_by_name["TestService"].full_name,
+        reflection.SERVICE_NAME,
+    ]
+    reflection.enable_server_reflection(service_names, server)
+
+
+class TestRemoteServices(unittest.TestCase):
+    def test_single_reflection_pass(self):
+        with inprocess_grpc_server(
+            BridgedServicer(), _add_servicers_with_reflection, num_threads=4
+        ) as address:
+            channel = grpc.insecure_channel(address)
+            app = flask.Flask(__name__)
+            with mock.patch.object(
+                grpc_to_json,
+                "build_database_from_stub",
+                wraps=grpc_to_json.build_database_from_stub,
+            ) as build_database:
+                map_and_mount_remote_services(app, channel, root_path="/api")
+            self.assertEqual(1, build_database.call_count)
+
+            client = app.test_client()
+            response = client.post("/api/eagr.BridgeTestService/Search", json={"query": "foo"})
+            self.assertEqual("foo", response.get_json()["query"])
+            response = client.post("/api/eagr.TestService/UnaryUnary", json="echo")
+            self.assertEqual("echo", response.get_json())
+            self.assertNotIn(
+                "/api/{}/ServerReflectionInfo".format(reflection.SERVICE_NAME),
+                [rule.rule for rule in app.url_map.iter_rules()],
+            )
+
+            app = flask.Flask(__name__)
+            map_and_mount_remote_services(
+                app, channel, service_paths={"eagr.BridgeTestService": "/bridge"}
+            )
+            response = app.test_client().post("/bridge/Search", json={"query": "bar"})
+            self.assertEqual("bar", response.get_json()["query"])
+            channel.close()
@@ -0,0 +1,121 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+import json
+import unittest
+
+import flask
+from google.protobuf import any_pb2, wrappers_pb2
+from google.protobuf.util import json_format_proto3_pb2
+
+from eagr.grpc_utils import json_encoding, response_translation
+
+
+def _pack(message):
+    """Pack a message into an Any"""
+    any_proto = any_pb2.Any()
+    any_proto.Pack(message)
+    return any_proto
+
+
+def _make_messages():
+    """Messages exercising the translation of every kind of field"""
+    scalars = json_format_proto3_pb2.TestMessage(
+        bool_value=True,
+        int32_value=-3,
+        int64_value=1 << 40,
+        uint64_value=7,
+        float_value=0.1,
+        double_value=float("inf"),
+        string_value='café "quoted"\n',
+        bytes_value=b"\x00\xff",
+        enum_value=json_format_proto3_pb2.BAR,
+        message_value=json_format_proto3_pb2.MessageType(value=5),
+        repeated_int64_value=[1, 2],
+        repeated_float_value=[1.5],
+        repeated_enum_value=[json_format_proto3_pb2.FOO, 7],
+        repeated_message_value=[json_format_proto3_pb2.MessageType(value=1)],
+    )
+    maps = json_format_proto3_pb2.TestMap()
+    maps.bool_map[True] = 1
+    maps.bool_map[False] = 2
+    maps.int32_map[10] = 1
+    maps.int32_map[2] = 2
+    maps.string_map["@type"] = 1
+    maps.string_map["other"] = 2
+
+    struct = json_format_proto3_pb2.TestStruct()
+    struct.value.update(
+        {"a": 1.5, "b": [True, "x"], "c": {"@type": "t", "d": "flattened"}, "e": {}}
+    )
+
+    wrappers = json_format_proto3_pb2.TestWrapper(
+        int64_value=wrappers_pb2.Int64Value(value=4),
+        string_value=wrappers_pb2.StringValue(value="wrapped"),
+        repeated_bool_value=[wrappers_pb2.BoolValue(value=True)],
+    )
+
+    anys = json_format_proto3_pb2.TestAny(
+        value=_pack(wrappers_pb2.Int32Value(value=1)),
+        repeated_value=[
+            _pack(json_format_proto3_pb2.MessageType(value=2)),
+            _pack(scalars),
+            _pack(_pack(wrappers_pb2.StringValue(value="nested"))),
+            any_pb2.Any(),
+        ],
+    )
+
+    time_types = json_format_proto3_pb2.TestTimestamp()
+    time_types.value.FromSeconds(1600000000)
+    durations = json_format_proto3_pb2.TestDuration()
+    durations.value.FromMilliseconds(1500)
+
+    return (
+        json_format_proto3_pb2.TestMessage(),
+        scalars,
+        maps,
+        struct,
+        wrappers,
+        anys,
+        time_types,
+        durations,
+        json_format_proto3_pb2.TestOneof(oneof_int32_value=0),
+        _pack(scalars),
+    )
+
+
+class TestJsonEncoding(unittest.TestCase):
+    def test_same_shape_as_translation(self):
+        for message in _make_messages():
+            expected = response_translation.translate_message_to_dict(message)
+            self.assertEqual(expected, json_encoding.message_to_clean_value(message))
+            self.assertEqual(
+                json.loads(json.dumps(expected)),
+                json.loads(json_encoding.message_to_json_bytes(message)),
+            )
+
+    def test_same_bytes_as_jsonify(self):
+        app = flask.Flask(__name__)
+        with app.app_context():
+            for message in _make_messages():
+                expected = flask.json.jsonify(
+                    response_translation.translate_message_to_dict(message)
+                ).get_data()
+                self.assertEqual(
+                    expected.rstrip(b"\n"), json_encoding.message_to_json_bytes(message)
+                )
+
+    def test_null_values(self):
+        struct = json_format_proto3_pb2.TestStruct()
+        struct.value.update({"a": None, "b": [None]})
+        self.assertEqual(
+            {"repeatedValue": [], "value": {"a": None, "b": [None]}},
+            json_encoding.message_to_clean_value(struct),
+        )
+        self.assertEqual(
+            b'{"repeatedValue":[],"value":{"a":null,"b":[null]}}',
+            json_encoding.message_to_json_bytes(struct),
+        )
+
+    def test_top_level_wrapper(self):
+        message = wrappers_pb2.Int64Value(value=12)
+        self.assertEqual("12", json_encoding.message_to_clean_value(message))
+        self.assertEqual(b'"12"', json_encoding.message_to_json_bytes(message))
@@ -0,0 +1,103 @@
+# Copyright 2020-present Kensho Technologies, LLC.
+import functools
+import unittest
+
+from google.protobuf.wrappers_pb2 import StringValue
+import grpc
+
+from ...protos import test_service_pb2_grpc
+from ...server import GRPCBase
+from ...server.local_dispatch import LocalDispatcher, LocalServicerContext
+from ...server.middleware import GRPCMiddleware, get_current_servicer_context
+
+
+METHOD_NAME = "/eagr.TestService/UnaryUnary"
+
+
+class DispatchedServicer(GRPCBase, test_service_pb2_grpc.TestServiceServicer):
+    """Servicer whose unary method behaves according to the request"""
+
+    _REGISTRAR = test_service_pb2_grpc.add_TestServiceServicer_to_server
+
+    def UnaryUnary(self, request, context):
+        """Reflect, fail or set a code depending on the request"""
+        if request.value == "raise":
+            raise ValueError("broken")
+        elif request.value == "set_code":
+            context.set_code(grpc.StatusCode.FAILED_PRECONDITION)
+            context.set_details("not yet")
+            return StringValue()
+        elif request.value == "context":
+            return StringValue(value=str(get_current_servicer_context() is context))
+        return request
+
+
+class SuffixMiddleware(GRPCMiddleware):
+    """Server middleware appending a suffix to the response"""
+
+    def __init__(self, suffix):
+        """Initialize with the suffix"""
+        super(SuffixMiddleware, self).__init__()
+        self._suffix = suffix
+
+    def get_decorator(self, _, __):
+        """Return the decorator appending the suffix"""
+
+        def decorator(fn):
+            """Append the suffix to the response"""
+
+            @functools.wraps(fn)
+            def wrap(request, context):
+                """Inner wrapper"""
+                return StringValue(value=fn(request, context).value + self._suffix)
+
+            return wrap
+
+        return decorator
+
+
+class TestLocalDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = LocalDispatcher(
+            [DispatchedServicer()], middlewares=[SuffixMiddleware("1"), SuffixMiddleware("2")]
+        )
+
+    def _dispatch(self, value, method=METHOD_NAME):
+        """Dispatch a request with the value"""
+        return self.dispatcher.dispatch(method, StringValue(value=value), LocalServicerContext())
+
+    def test_dispatch(self):
+        outcome = self._dispatch("foo")
+        self.assertEqual(grpc.StatusCode.OK, outcome.code)
+        # The first middleware is the outermost
+        self.assertEqual("foo21", outcome.response.value)
+        self.assertEqual("True21", self._dispatch("context").response.value)
+
+        serialized_outcome = self.dispatcher.dispatch(
+            METHOD_NAME,
+            StringValue(value="foo").SerializeToString(),
+            LocalServicerContext(),
+            serialized=True,
+        )
+        self.assertEqual("foo21", StringValue.FromString(serialized_outcome.response).value)
+
+    def test_failures(self):
+        outcome = self._dispatch("raise")
+        self.assertEqual(grpc.StatusCode.UNKNOWN, outcome.code)
+        self.assertIsNone(outcome.response)
+
+        outcome = self._dispatch("set_code")
+        self.assertEqual(
+            (grpc.StatusCode.FAILED_PRECONDITION, "not yet"), (outcome.code, outcome.details)
+        )
+
+        outcome = self._dispatch("foo", method="/eagr.TestService/Missing")
+        self.assertEqual(grpc.StatusCode.UNIMPLEMENTED, outcome.code)
+        outcome = self._dispatch("foo", method="/eagr.TestService/UnaryStream")
+        self.assertEqual(grpc.StatusCode.UNIMPLEMENTED, outcome.code)
+
+    def test_has_method(self):
+        self.assertTrue(self.dispatcher.has_method(METHOD_NAME))
+        self.assertFalse(self.dispatcher.has_method("/eagr.TestService/Missing"))
+        # Streaming methods cannot be dispatched locally
+        self.assertFalse(self.dispatcher.has_method("/eagr.TestService/UnaryStream"))